@@ -0,0 +1,3 @@
+"""
+Benchmarks for the Brandfetch MCP server.
+"""
\ No newline at end of file
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Brandfetch API.
+
+Serves deterministic fake data for the two endpoints the MCP server uses, so
+the server's request path can be load tested without API credentials or quota:
+
+- GET /v2/search/{name}?c=<client_id>
+- GET /v2/brands/{identifier}?fields=<comma-separated fields>
+
+Latency, occasional slow responses, server errors, rate limiting (429 with
+Retry-After) and unknown brands (404) can all be injected. Brand documents
+carry an ETag and are answered with 304 Not Modified when the request's
+If-None-Match matches.
+Request counts are available at
+GET /__stats and can be reset with POST /__reset.
+
+Usage:
+    python benchmarks/fake_brandfetch.py --port 8765 --latency-ms 80 \
+        --rate-limit-rate 0.02
+
+Then point the server at it:
+    BRANDFETCH_API_URL=http://127.0.0.1:8765 python brandfetch_server.py
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+LOGO_TYPES = ["logo", "icon", "symbol"]
+LOGO_THEMES = ["light", "dark"]
+LOGO_FORMATS = ["svg", "png", "jpeg"]
+COLOR_TYPES = ["accent", "dark", "light", "brand"]
+
+
+@dataclass
+class FakeConfig:
+    """Behavior of the fake API."""
+    latency_ms: float = 50.0
+    jitter_ms: float = 10.0
+    # Fraction of requests delayed by slow_ms on top of the usual latency
+    slow_rate: float = 0.0
+    slow_ms: float = 1000.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    search_results: int = 5
+    logos_per_brand: int = 6
+    # Identifiers starting with this prefix return 404
+    missing_prefix: str = "missing"
+    seed: int = 0
+
+
+def make_brand(identifier: str, logos_per_brand: int = 6) -> Dict[str, Any]:
+    """Build a deterministic fake brand document for an identifier."""
+    digest = hashlib.sha256(identifier.lower().encode()).hexdigest()
+    domain = identifier.lower() if "." in identifier else f"{identifier.lower()}.com"
+    slug = domain.split(".")[0]
+    name = slug.replace("-", " ").title()
+    logos: List[Dict[str, Any]] = []
+    for i in range(logos_per_brand):
+        logo_type = LOGO_TYPES[i % len(LOGO_TYPES)]
+        theme = LOGO_THEMES[(i // len(LOGO_TYPES)) % len(LOGO_THEMES)]
+        logos.append({
+            "type": logo_type,
+            "theme": theme,
+            "tags": [],
+            "formats": [
+                {
+                    "src": f"https://asset.brandfetch.io/{digest[:10]}/{logo_type}-{theme}-{i}.{fmt}",
+                    "background": None if fmt == "svg" else "transparent",
+                    "format": fmt,
+                    "height": 256,
+                    "width": 256 * (1 + i % 3),
+                    "size": 1024 * (5 + i),
+                }
+                for fmt in LOGO_FORMATS
+            ],
+        })
+    return {
+        "id": f"id_{digest[:10]}",
+        "name": name,
+        "domain": domain,
+        "claimed": int(digest[10], 16) % 2 == 0,
+        "description": (
+            f"{name} is a fake brand served by the local Brandfetch stand-in."
+        ),
+        "longDescription": " ".join(
+            f"{name} builds products for customers in market {digest[i:i + 4]}."
+            for i in range(0, 40, 4)
+        ),
+        "links": [
+            {"name": network, "url": f"https://{network}.com/{slug}"}
+            for network in ("twitter", "facebook", "instagram", "linkedin")
+        ],
+        "logos": logos,
+        "colors": [
+            {
+                "hex": f"#{digest[12 + 6 * i:18 + 6 * i]}",
+                "type": color_type,
+                "brightness": int(digest[12 + 6 * i:14 + 6 * i], 16),
+            }
+            for i, color_type in enumerate(COLOR_TYPES)
+        ],
+        "fonts": [
+            {
+                "name": "Inter",
+                "type": "title",
+                "origin": "google",
+                "originId": "Inter",
+                "weights": [],
+            },
+            {
+                "name": "Roboto",
+                "type": "body",
+                "origin": "google",
+                "originId": "Roboto",
+                "weights": [],
+            },
+        ],
+        "images": [
+            {
+                "type": "banner",
+                "formats": [
+                    {
+                        "src": f"https://asset.brandfetch.io/{digest[:10]}/banner.jpeg",
+                        "background": None,
+                        "format": "jpeg",
+                        "height": 500,
+                        "width": 1500,
+                        "size": 120000,
+                    }
+                ],
+                "tags": [],
+            }
+        ],
+        "qualityScore": round(int(digest[40:42], 16) / 255, 2),
+        "company": {
+            "employees": 1000 * (1 + int(digest[42], 16)),
+            "foundedYear": 1950 + int(digest[43:45], 16) % 70,
+            "industries": [
+                {
+                    "score": 1,
+                    "id": "tech",
+                    "name": "Technology",
+                    "emoji": "",
+                    "slug": "technology",
+                }
+            ],
+            "kind": "PUBLIC_COMPANY",
+            "location": {
+                "city": "Springfield",
+                "country": "United States",
+                "countryCode": "US",
+            },
+        },
+        "isNsfw": False,
+    }
+
+
+def make_search_results(name: str, count: int) -> List[Dict[str, Any]]:
+    """Build deterministic fake search results for a brand name."""
+    slug = "-".join(name.lower().split()) or "brand"
+    results = []
+    for i in range(count):
+        domain = f"{slug}.com" if i == 0 else f"{slug}{i}.com"
+        brand = make_brand(domain, logos_per_brand=0)
+        results.append({
+            "icon": f"https://cdn.brandfetch.io/{domain}/icon",
+            "name": name.title() if i == 0 else f"{name.title()} {i}",
+            "domain": domain,
+            "claimed": brand["claimed"],
+            "brandId": brand["id"],
+        })
+    return results
+
+
+def create_app(config: FakeConfig) -> Starlette:
+    """Create the fake Brandfetch API application."""
+    rng = random.Random(config.seed)
+    stats: Counter = Counter()
+
+    async def simulate(endpoint: str) -> Optional[Response]:
+        stats[f"{endpoint}_requests"] += 1
+        delay = config.latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)
+        if rng.random() < config.slow_rate:
+            stats[f"{endpoint}_slow"] += 1
+            delay += config.slow_ms
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            stats[f"{endpoint}_429"] += 1
+            return JSONResponse(
+                {"message": "Too Many Requests"},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats[f"{endpoint}_500"] += 1
+            return JSONResponse({"message": "Internal Server Error"}, status_code=500)
+        return None
+
+    async def search(request: Request) -> Response:
+        failure = await simulate("search")
+        if failure is not None:
+            return failure
+        if not request.query_params.get("c"):
+            stats["search_401"] += 1
+            return JSONResponse({"message": "Missing client ID"}, status_code=401)
+        stats["search_200"] += 1
+        return JSONResponse(
+            make_search_results(request.path_params["name"], config.search_results)
+        )
+
+    async def brand(request: Request) -> Response:
+        failure = await simulate("brand")
+        if failure is not None:
+            return failure
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            stats["brand_401"] += 1
+            return JSONResponse({"message": "Missing API key"}, status_code=401)
+        identifier = request.path_params["identifier"]
+        if identifier.lower().startswith(config.missing_prefix):
+            stats["brand_404"] += 1
+            return JSONResponse({"message": "Brand not found"}, status_code=404)
+        document = make_brand(identifier, config.logos_per_brand)
+        fields = request.query_params.get("fields")
+        if fields:
+            wanted = fields.split(",")
+            document = {key: value for key, value in document.items() if key in wanted}
+        response = JSONResponse(document)
+        etag = '"%s"' % hashlib.sha256(response.body).hexdigest()[:16]
+        if request.headers.get("if-none-match") == etag:
+            stats["brand_304"] += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        stats["brand_200"] += 1
+        response.headers["ETag"] = etag
+        return response
+
+    async def root(request: Request) -> Response:
+        stats["root_requests"] += 1
+        return Response(status_code=200)
+
+    async def get_stats(request: Request) -> Response:
+        return JSONResponse(dict(stats))
+
+    async def reset_stats(request: Request) -> Response:
+        stats.clear()
+        return JSONResponse({})
+
+    return Starlette(routes=[
+        Route("/", root, methods=["GET", "HEAD"]),
+        Route("/v2/search/{name:path}", search),
+        Route("/v2/brands/{identifier:path}", brand),
+        Route("/__stats", get_stats),
+        Route("/__reset", reset_stats, methods=["POST"]),
+    ])
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Run a local Brandfetch API stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=FakeConfig.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=FakeConfig.jitter_ms)
+    parser.add_argument("--slow-rate", type=float, default=FakeConfig.slow_rate,
+                        help="Fraction of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=FakeConfig.slow_ms)
+    parser.add_argument("--error-rate", type=float, default=FakeConfig.error_rate,
+                        help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float,
+                        default=FakeConfig.rate_limit_rate,
+                        help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=FakeConfig.retry_after,
+                        help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--search-results", type=int, default=FakeConfig.search_results)
+    parser.add_argument("--logos-per-brand", type=int,
+                        default=FakeConfig.logos_per_brand)
+    parser.add_argument("--seed", type=int, default=FakeConfig.seed)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Run the fake API server."""
+    args = parse_args(argv)
+    config = FakeConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        search_results=args.search_results,
+        logos_per_brand=args.logos_per_brand,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+JSON handling benchmark for get_brand_info.
+
+Runs get_brand_info in-process against a mocked upstream response and
+converts its result to MCP content the way FastMCP does, comparing:
+- stdlib: decoding with the json module, result re-serialized by FastMCP
+- orjson: decoding with orjson (if installed), result re-serialized by FastMCP
+- passthrough: orjson decoding (if installed) with BRANDFETCH_RAW_PASSTHROUGH,
+  so the upstream body is returned without being encoded again
+
+Each mode is timed on a cache miss (upstream response decoded) and a cache
+hit, for brand documents of increasing size.
+
+Usage:
+    python benchmarks/json_benchmark.py --iterations 500 --logos 6,40,200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+import httpx
+from fake_brandfetch import make_brand
+from mcp.server.fastmcp.server import _convert_to_content
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brandfetch_server  # noqa: E402
+
+MODES = ("stdlib", "orjson", "passthrough")
+
+
+class _Context:
+    """Minimal stand-in for the MCP Context passed to tools."""
+
+    def __init__(self, brandfetch: brandfetch_server.BrandfetchContext) -> None:
+        self.request_context = type(
+            "RequestContext", (), {"lifespan_context": brandfetch}
+        )()
+
+
+async def time_mode(mode: str, body: bytes, iterations: int) -> Dict[str, float]:
+    """Return the median microseconds per call on a cache miss and hit."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200, content=body, headers={"Content-Type": "application/json"}
+        )
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        brandfetch = brandfetch_server.BrandfetchContext(
+            api_key="benchmark-key",
+            client_id="benchmark-client",
+            base_url="https://api.brandfetch.io",
+            http_client=client,
+            raw_passthrough=mode == "passthrough",
+        )
+        ctx = _Context(brandfetch)
+
+        async def call() -> float:
+            start = time.perf_counter()
+            result = await brandfetch_server.get_brand_info(ctx, "brand1.com")
+            _convert_to_content(result)
+            return time.perf_counter() - start
+
+        # Time the upstream request separately so only JSON handling differs
+        transport = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await client.get("https://api.brandfetch.io/v2/brands/brand1.com")
+            transport.append(time.perf_counter() - start)
+
+        misses, hits = [], []
+        for _ in range(iterations):
+            brandfetch.cache.clear()
+            brandfetch.aliases = brandfetch_server.AliasIndex()
+            misses.append(await call())
+            hits.append(await call())
+
+    overhead = statistics.median(transport)
+    return {
+        "miss_us": round((statistics.median(misses) - overhead) * 1e6, 1),
+        "hit_us": round(statistics.median(hits) * 1e6, 1),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run every mode for every document size."""
+    results = []
+    for logos in args.logos:
+        body = json.dumps(make_brand("brand1.com", logos)).encode()
+        for mode in MODES:
+            backend = None if mode == "stdlib" else brandfetch_server.orjson
+            with patch.object(brandfetch_server, "orjson", backend):
+                timing = await time_mode(mode, body, args.iterations)
+            results.append({"logos": logos, "bytes": len(body), "mode": mode, **timing})
+    return results
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    """Print benchmark results as a table."""
+    if brandfetch_server.orjson is None:
+        print("orjson is not installed; the orjson modes use the json module")
+    print(f"{'bytes':>8}  {'mode':<12} {'miss (us)':>10} {'hit (us)':>10}")
+    for row in results:
+        print(f"{row['bytes']:>8}  {row['mode']:<12} "
+              f"{row['miss_us']:>10} {row['hit_us']:>10}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark JSON handling in get_brand_info."
+    )
+    parser.add_argument("--iterations", type=int, default=300,
+                        help="Calls per measurement")
+    parser.add_argument("--logos", default="6,40,200",
+                        help="Comma-separated logo counts, controlling document size")
+    parser.add_argument("--json", default=None, metavar="PATH",
+                        help="Also write the results to a JSON file")
+    args = parser.parse_args(argv)
+    args.logos = [int(value) for value in args.logos.split(",")]
+    return args
+
+
+def main(argv=None) -> None:
+    """Run the benchmark from the command line."""
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+"""
+Load benchmark for the Brandfetch MCP server.
+
+Starts the local Brandfetch stand-in (fake_brandfetch.py), launches one or more
+MCP server processes over stdio pointed at it, and drives a mix of
+search_brands and get_brand_info calls at a fixed concurrency. Reports
+calls/sec, p50/p95/p99 latency and the number of requests that reached the
+upstream API.
+
+Usage:
+    python benchmarks/load_benchmark.py --calls 2000 --concurrency 64 --identifiers 500
+
+Server settings can be varied per run to compare configurations, e.g.:
+    python benchmarks/load_benchmark.py --env BRANDFETCH_CACHE_MAX_ENTRIES=0
+
+With --bulk-identifiers, each session also runs an enrich_brands job over that
+many other brands while the calls are timed, to measure interactive latency
+under bulk load:
+    python benchmarks/load_benchmark.py --bulk-identifiers 10000 \
+        --env BRANDFETCH_BRAND_RATE_LIMIT=100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from mcp import ClientSession
+from mcp.client.stdio import StdioServerParameters, stdio_client
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_SERVER = os.path.join(REPO_DIR, "brandfetch_server.py")
+FAKE_SERVER = os.path.join(BENCHMARK_DIR, "fake_brandfetch.py")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    last = len(sorted_values) - 1
+    index = min(last, int(round(pct / 100 * last)))
+    return sorted_values[index]
+
+
+def free_port() -> int:
+    """Return a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_workload(args: argparse.Namespace) -> List[Tuple[str, Dict[str, Any]]]:
+    """Build the list of tool calls to make."""
+    rng = random.Random(args.seed)
+    fields = args.fields.split(",") if args.fields else None
+    calls = []
+    for _ in range(args.calls):
+        brand = rng.randrange(args.identifiers)
+        if rng.random() < args.search_ratio:
+            calls.append(("search_brands", {"name": f"brand {brand}"}))
+        else:
+            arguments: Dict[str, Any] = {"identifier": f"brand{brand}.com"}
+            if fields:
+                arguments["fields"] = fields
+            calls.append(("get_brand_info", arguments))
+    return calls
+
+
+async def start_fake_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """Start the fake Brandfetch API and wait until it accepts requests."""
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, FAKE_SERVER,
+        "--port", str(port),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--slow-rate", str(args.slow_rate),
+        "--slow-ms", str(args.slow_ms),
+        "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+        "--retry-after", str(args.retry_after),
+    ])
+    url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{url}/__stats")
+                return process, url
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Fake Brandfetch API did not start")
+
+
+async def upstream_stats(url: str, reset: bool = False) -> Dict[str, int]:
+    """Fetch (and optionally reset) request counters from the fake API."""
+    async with httpx.AsyncClient() as client:
+        stats = (await client.get(f"{url}/__stats")).json()
+        if reset:
+            await client.post(f"{url}/__reset")
+    return stats
+
+
+async def run_session(
+    server_params: StdioServerParameters,
+    calls: List[Tuple[str, Dict[str, Any]]],
+    concurrency: int,
+    latencies: List[float],
+    errors: List[str],
+    ready: asyncio.Event,
+    started: asyncio.Event,
+    bulk_identifiers: int = 0,
+) -> None:
+    """
+    Run calls through one MCP server process with bounded concurrency.
+
+    With bulk_identifiers, an enrich_brands job over that many brands runs in
+    the same session until the calls are done.
+    """
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            bulk_job = None
+            if bulk_identifiers:
+                # Relative to the server's BRANDFETCH_ENRICH_DIR
+                output_path = f"enriched-{uuid.uuid4().hex}.ndjson"
+                job_arguments = {
+                    "identifiers": [f"bulk{i}.com" for i in range(bulk_identifiers)],
+                    "output_path": output_path,
+                }
+                bulk_job = asyncio.create_task(
+                    session.call_tool("enrich_brands", arguments=job_arguments)
+                )
+                # Let the job fill the server's queues before the calls start
+                await asyncio.sleep(0.5)
+            ready.set()
+            await started.wait()
+            pending = iter(calls)
+
+            async def worker() -> None:
+                for tool, arguments in pending:
+                    start = time.perf_counter()
+                    try:
+                        result = await session.call_tool(tool, arguments=arguments)
+                        if result.isError:
+                            errors.append(
+                                result.content[0].text if result.content else tool
+                            )
+                    except Exception as e:  # noqa: BLE001 - report and keep going
+                        errors.append(str(e))
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            if bulk_job is not None:
+                bulk_job.cancel()
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the benchmark and return its results."""
+    fake_process: Optional[subprocess.Popen] = None
+    upstream_url = args.upstream_url
+    if upstream_url is None:
+        fake_process, upstream_url = await start_fake_server(args)
+
+    env = dict(os.environ)
+    env.update({
+        "BRANDFETCH_API_KEY": env.get("BRANDFETCH_API_KEY", "benchmark-key"),
+        "BRANDFETCH_CLIENT_ID": env.get("BRANDFETCH_CLIENT_ID", "benchmark-client"),
+        "BRANDFETCH_API_URL": upstream_url,
+        "LOG_LEVEL": "WARNING",
+        "BRANDFETCH_ENRICH_DIR": tempfile.mkdtemp(),
+    })
+    for setting in args.env:
+        name, _, value = setting.partition("=")
+        env[name] = value
+    server_params = StdioServerParameters(
+        command=sys.executable, args=[args.server], env=env
+    )
+
+    calls = build_workload(args)
+    latencies: List[float] = []
+    errors: List[str] = []
+    try:
+        if fake_process is not None:
+            await upstream_stats(upstream_url, reset=True)
+        per_session = [calls[i::args.sessions] for i in range(args.sessions)]
+        concurrency = max(1, args.concurrency // args.sessions)
+        ready_events = [asyncio.Event() for _ in per_session]
+        started = asyncio.Event()
+        sessions = [
+            asyncio.create_task(run_session(
+                server_params, session_calls, concurrency, latencies, errors, ready,
+                started, args.bulk_identifiers,
+            ))
+            for session_calls, ready in zip(per_session, ready_events)
+        ]
+        # Only time the calls, not process startup
+        await asyncio.wait_for(
+            asyncio.gather(*(event.wait() for event in ready_events)), timeout=60
+        )
+        start = time.perf_counter()
+        started.set()
+        await asyncio.gather(*sessions)
+        elapsed = time.perf_counter() - start
+        upstream = {}
+        if fake_process is not None:
+            upstream = await upstream_stats(upstream_url)
+    finally:
+        if fake_process is not None:
+            fake_process.terminate()
+            fake_process.wait()
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "errors": len(errors),
+        "sample_errors": errors[:5],
+        "concurrency": args.concurrency,
+        "sessions": args.sessions,
+        "bulk_identifiers": args.bulk_identifiers,
+        "elapsed_s": round(elapsed, 3),
+        "calls_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "upstream": upstream,
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    """Print benchmark results in a readable form."""
+    latency = results["latency_ms"]
+    print(f"Calls:       {results['calls']} ({results['errors']} errors) "
+          f"over {results['sessions']} session(s) "
+          f"at concurrency {results['concurrency']}")
+    if results["bulk_identifiers"]:
+        print(f"Bulk job:    enrich_brands over {results['bulk_identifiers']} "
+              "brands per session")
+    print(f"Throughput:  {results['calls_per_s']} calls/s in {results['elapsed_s']}s")
+    print(f"Latency:     p50 {latency['p50']}ms  p95 {latency['p95']}ms  "
+          f"p99 {latency['p99']}ms  max {latency['max']}ms")
+    upstream = results["upstream"]
+    if upstream:
+        print(f"Upstream:    {upstream.get('search_requests', 0)} search, "
+              f"{upstream.get('brand_requests', 0)} brand requests")
+        injected = {
+            k: v for k, v in upstream.items()
+            if k.endswith(("_429", "_500", "_404"))
+        }
+        if injected:
+            print(f"Injected:    {injected}")
+    for error in results["sample_errors"]:
+        print(f"Error:       {error}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Load test the Brandfetch MCP server.")
+    parser.add_argument("--calls", type=int, default=1000, help="Total tool calls")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="Concurrent tool calls across all sessions")
+    parser.add_argument("--sessions", type=int, default=1,
+                        help="Number of MCP server processes")
+    parser.add_argument("--identifiers", type=int, default=500,
+                        help="Number of distinct brands to request")
+    parser.add_argument("--search-ratio", type=float, default=0.2,
+                        help="Fraction of calls that are search_brands")
+    parser.add_argument("--fields", default=None,
+                        help="Comma-separated fields for get_brand_info calls")
+    parser.add_argument("--bulk-identifiers", type=int, default=0,
+                        help="Run an enrich_brands job over this many brands "
+                             "in each session")
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="Server script to run")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment variable for the server (repeatable)")
+    parser.add_argument("--upstream-url", default=None,
+                        help="Use this API URL instead of starting the fake API")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="Fraction of upstream requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=1000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, metavar="PATH",
+                        help="Also write the results to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Run the benchmark from the command line."""
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
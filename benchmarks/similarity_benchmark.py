@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Color similarity benchmark for find_similar_brands.
+
+Fills the color index with fake brand documents (as the server does when
+brands are fetched or read from the disk cache) and reports, per index size:
+- add: time to index one brand document
+- sync: time for the first query to write the new brands into NumPy arrays
+- query: median time of a top-k nearest palette query over all brands
+
+Usage:
+    python benchmarks/similarity_benchmark.py --brands 10000,50000 --queries 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from fake_brandfetch import make_brand
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brandfetch_server  # noqa: E402
+
+
+def time_index(brands: int, queries: int, limit: int) -> Dict[str, Any]:
+    """Index brands and return the add, sync and query timings."""
+    documents = [make_brand(f"brand{i}.com", 1) for i in range(brands)]
+    color_index = brandfetch_server.ColorIndex(max_entries=brands)
+
+    start = time.perf_counter()
+    for document in documents:
+        color_index.add_brand_document(document)
+    add = (time.perf_counter() - start) / brands
+
+    palettes = [
+        color_index.get(f"brand{i}.com")[1] for i in range(min(queries, brands))
+    ]
+    start = time.perf_counter()
+    color_index.nearest(palettes[0], limit)
+    sync = time.perf_counter() - start
+
+    timings = []
+    for i in range(queries):
+        start = time.perf_counter()
+        color_index.nearest(palettes[i % len(palettes)], limit, exclude=f"brand{i}.com")
+        timings.append(time.perf_counter() - start)
+    return {
+        "brands": brands,
+        "add_us": round(add * 1e6, 1),
+        "sync_ms": round(sync * 1000, 1),
+        "query_ms": round(statistics.median(timings) * 1000, 2),
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run the benchmark for every index size."""
+    brandfetch_server.import_numpy()  # Keep the import out of the first sync
+    return [time_index(brands, args.queries, args.limit) for brands in args.brands]
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    """Print benchmark results as a table."""
+    print(f"{'brands':>8} {'add (us)':>10} {'sync (ms)':>10} {'query (ms)':>11}")
+    for row in results:
+        print(f"{row['brands']:>8} {row['add_us']:>10} "
+              f"{row['sync_ms']:>10} {row['query_ms']:>11}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the color similarity index."
+    )
+    parser.add_argument("--brands", default="1000,10000,50000",
+                        help="Comma-separated index sizes")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Queries per index size")
+    parser.add_argument("--limit", type=int, default=10,
+                        help="Brands returned per query")
+    parser.add_argument("--json", default=None, metavar="PATH",
+                        help="Also write the results to a JSON file")
+    args = parser.parse_args(argv)
+    args.brands = [int(value) for value in args.brands.split(",")]
+    return args
+
+
+def main(argv=None) -> None:
+    """Run the benchmark from the command line."""
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Startup benchmark for the Brandfetch MCP server.
+
+Measures, over several fresh processes:
+- import: time to import the server module in a new interpreter
+- initialize: time from launching the server over stdio until the MCP
+  initialize handshake completes
+- first call: time of the first get_brand_info call, which creates the HTTP
+  client and fetches from the local Brandfetch stand-in (fake_brandfetch.py)
+
+Usage:
+    python benchmarks/startup_benchmark.py --runs 10
+
+Settings can be compared between runs, e.g. eager client creation:
+    python benchmarks/startup_benchmark.py --env BRANDFETCH_LAZY_INIT=false
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from load_benchmark import DEFAULT_SERVER, REPO_DIR, start_fake_server
+from mcp import ClientSession
+from mcp.client.stdio import StdioServerParameters, stdio_client
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import brandfetch_server; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    """Return the seconds a fresh interpreter takes to import the server module."""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def measure_session(server_params: StdioServerParameters) -> Dict[str, float]:
+    """Launch one server process and time its handshake and first tool call."""
+    start = time.perf_counter()
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            initialized = time.perf_counter()
+            result = await session.call_tool(
+                "get_brand_info", arguments={"identifier": "brand1.com"}
+            )
+            if result.isError:
+                raise RuntimeError(
+                    result.content[0].text if result.content else "error"
+                )
+            called = time.perf_counter()
+    return {"initialize": initialized - start, "first_call": called - initialized}
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Return the median and range of values in milliseconds."""
+    return {
+        "median": round(statistics.median(values) * 1000, 1),
+        "min": round(min(values) * 1000, 1),
+        "max": round(max(values) * 1000, 1),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the benchmark and return its results."""
+    fake_process: Optional[subprocess.Popen] = None
+    upstream_url = args.upstream_url
+    if upstream_url is None:
+        fake_process, upstream_url = await start_fake_server(args)
+
+    env = dict(os.environ)
+    env.update({
+        "BRANDFETCH_API_KEY": env.get("BRANDFETCH_API_KEY", "benchmark-key"),
+        "BRANDFETCH_CLIENT_ID": env.get("BRANDFETCH_CLIENT_ID", "benchmark-client"),
+        "BRANDFETCH_API_URL": upstream_url,
+        "LOG_LEVEL": "WARNING",
+    })
+    for setting in args.env:
+        name, _, value = setting.partition("=")
+        env[name] = value
+    if args.module:
+        server_params = StdioServerParameters(
+            command=sys.executable,
+            args=["-m", "brandfetch_server"],
+            env=env,
+            cwd=REPO_DIR,
+        )
+    else:
+        server_params = StdioServerParameters(
+            command=sys.executable, args=[args.server], env=env
+        )
+
+    imports: List[float] = []
+    sessions: List[Dict[str, float]] = []
+    try:
+        for _ in range(args.runs):
+            imports.append(measure_import(env))
+            sessions.append(await measure_session(server_params))
+    finally:
+        if fake_process is not None:
+            fake_process.terminate()
+            fake_process.wait()
+
+    return {
+        "runs": args.runs,
+        "import_ms": summarize(imports),
+        "initialize_ms": summarize([s["initialize"] for s in sessions]),
+        "first_call_ms": summarize([s["first_call"] for s in sessions]),
+        "total_ms": summarize([s["initialize"] + s["first_call"] for s in sessions]),
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    """Print benchmark results in a readable form."""
+    print(f"Runs:        {results['runs']}")
+    for label, key in (
+        ("Import", "import_ms"),
+        ("Initialize", "initialize_ms"),
+        ("First call", "first_call_ms"),
+        ("Total", "total_ms"),
+    ):
+        timing = results[key]
+        print(f"{label + ':':<13}median {timing['median']}ms  "
+              f"(min {timing['min']}ms, max {timing['max']}ms)")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Measure Brandfetch MCP server startup."
+    )
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Server processes to launch")
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="Server script to run")
+    parser.add_argument("--module", action="store_true",
+                        help="Run the server with 'python -m brandfetch_server'")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment variable for the server (repeatable)")
+    parser.add_argument("--upstream-url", default=None,
+                        help="Use this API URL instead of starting the fake API")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--json", default=None, metavar="PATH",
+                        help="Also write the results to a JSON file")
+    args = parser.parse_args(argv)
+    # Options start_fake_server expects, with faults disabled
+    args.slow_rate = 0.0
+    args.slow_ms = 0.0
+    args.error_rate = 0.0
+    args.rate_limit_rate = 0.0
+    args.retry_after = 0.1
+    return args
+
+
+def main(argv=None) -> None:
+    """Run the benchmark from the command line."""
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmark(args))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
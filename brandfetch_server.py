@@ -9,24 +9,2450 @@ Capabilities:
 - Search for brands by name
 - Get detailed brand information by identifier (domain, brand ID, ISIN, stock symbol)
 """
+import argparse
+import asyncio
+import atexit
+import base64
+import bisect
+import csv
+import difflib
+import functools
+import hashlib
+import importlib.util
+import itertools
+import json
 import logging
+import logging.handlers
 import os
-from contextlib import asynccontextmanager
+import queue
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, deque
 from collections.abc import AsyncIterator
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Union
+from contextlib import AsyncExitStack, asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import httpx
+from dotenv import load_dotenv
+from mcp.server.fastmcp import Context, FastMCP
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+try:
+    import orjson
+except ImportError:  # Optional faster JSON backend
+    orjson = None
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger("brandfetch-mcp")
+
+T = TypeVar("T")
+
+# Cache defaults, overridable through environment variables
+DEFAULT_CACHE_MAX_ENTRIES = 2048
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64 MiB
+DEFAULT_BRAND_CACHE_TTL = 24 * 60 * 60  # Brand documents rarely change within a day
+DEFAULT_SEARCH_CACHE_TTL = 6 * 60 * 60
+DEFAULT_DISK_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MiB
+# Unknown brands and searches without results are remembered this long, so
+# repeated lookups don't reach the API
+DEFAULT_NEGATIVE_CACHE_TTL = 5 * 60
+
+# Expired brand documents can be served for this long while they are refreshed
+DEFAULT_STALE_WINDOW = 60 * 60
+DEFAULT_MAX_BACKGROUND_REFRESHES = 4
+DEFAULT_HOT_REFRESH_INTERVAL = 15 * 60
+
+# Narrow field projections of the same brand seen within the window before the
+# full document is fetched instead
+DEFAULT_FULL_FETCH_THRESHOLD = 2
+DEFAULT_FULL_FETCH_WINDOW = 60.0
+
+# Concurrent upstream requests per batch tool call
+DEFAULT_BATCH_CONCURRENCY = 8
+MAX_BATCH_SIZE = 500
+DEFAULT_ENRICH_CHUNK_SIZE = 50
+# enrich_brands only reads and writes files inside this directory
+DEFAULT_ENRICH_DIR = "~/.cache/brandfetch-mcp/enrich"
+
+# Longest list kept in compact brand documents
+DEFAULT_COMPACT_MAX_ITEMS = 10
+
+# Weights for ranking search results in resolve_brand
+DEFAULT_RANK_CLAIMED_WEIGHT = 1.0
+DEFAULT_RANK_NAME_WEIGHT = 2.0
+DEFAULT_RANK_DOMAIN_WEIGHT = 1.0
+MAX_RESOLVE_CANDIDATES = 10
+
+# Local index of brands seen in earlier responses, used to answer searches
+DEFAULT_SEARCH_INDEX_MAX_ENTRIES = 10000
+# Score a local match needs to answer a search without the API; 1.0 requires
+# an exact name match (ignoring case and punctuation)
+DEFAULT_SEARCH_INDEX_MIN_SCORE = 1.0
+# Matches scoring below this are not returned with a local answer
+SEARCH_INDEX_MIN_RESULT_SCORE = 0.3
+SEARCH_INDEX_MAX_RESULTS = 10
+
+# Index of brand palettes for finding brands with similar colors
+DEFAULT_COLOR_INDEX_MAX_ENTRIES = 100000
+# Colors kept per brand, highest weighted first
+COLOR_INDEX_MAX_COLORS = 6
+MAX_SIMILAR_BRANDS = 50
+# Weight of each color type in palette distances; near-black and near-white
+# colors also count less, as most palettes have one
+COLOR_TYPE_WEIGHTS = {"brand": 1.0, "accent": 1.0, "dark": 0.5, "light": 0.5}
+DEFAULT_COLOR_TYPE_WEIGHT = 0.75
+# Brand documents read from the disk cache per batch when filling the index
+COLOR_INDEX_SCAN_BATCH = 500
+
+# Downloaded logo and icon files
+DEFAULT_ASSET_DIR = "~/.cache/brandfetch-mcp/assets"
+DEFAULT_ASSET_MAX_BYTES = 20 * 1024 * 1024  # 20 MiB per file
+DEFAULT_ASSET_STORE_MAX_BYTES = 512 * 1024 * 1024  # 512 MiB in total
+# Temporary files this old are left over from crashed downloads
+ASSET_STALE_TEMP_AGE = 3600.0
+DEFAULT_ASSET_CONCURRENCY = 4
+MAX_ASSET_BASE64_BYTES = 1024 * 1024
+ASSET_CHUNK_SIZE = 64 * 1024
+# Redirects followed per asset download, as CDNs often redirect logo URLs
+ASSET_MAX_REDIRECTS = 5
+
+# Shared state used by default when serving HTTP from several worker processes
+DEFAULT_SHARED_CACHE_PATH = "~/.cache/brandfetch-mcp/cache.db"
+DEFAULT_SHARED_RATE_LIMIT_PATH = "~/.cache/brandfetch-mcp/rate_limits.db"
+
+# Learned aliases (domain, ISIN, stock symbol) of brand IDs
+DEFAULT_ALIAS_MAX_ENTRIES = 50000
+
+# Patterns for classifying brand identifiers. Brand IDs without an
+# underscore mix in capitals or digits, unlike words such as "identity"
+BRAND_ID_PATTERN = re.compile(
+    r"^id(?:_[A-Za-z0-9_-]+|(?=[a-z]*[A-Z0-9])[A-Za-z0-9]{8,})$"
+)
+ISIN_PATTERN = re.compile(r"^[A-Z]{2}[A-Z0-9]{9}[0-9]$")
+DOMAIN_PATTERN = re.compile(r"^(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,}$")
+TICKER_PATTERN = re.compile(r"^[A-Z0-9]{1,6}(?:[.-][A-Z]{1,2})?$")
+HEX_COLOR_PATTERN = re.compile(r"#?([0-9a-fA-F]{6}|[0-9a-fA-F]{3})")
+
+# HTTP connection pool and timeout defaults
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_WRITE_TIMEOUT = 30.0
+DEFAULT_POOL_TIMEOUT = 10.0
+DEFAULT_WARMUP_CONNECTIONS = 1
+
+# Retries for rate-limited (429) and server error (5xx) responses
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BASE_DELAY = 0.5
+DEFAULT_RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Longest pause in seconds a 429 response may put on its endpoint
+RATE_LIMIT_MAX_PAUSE = 600.0
+
+# Longest wait in seconds for one upstream attempt, and for all the upstream
+# requests of an interactive tool call (0 disables either)
+DEFAULT_ATTEMPT_TIMEOUT = 10.0
+DEFAULT_CALL_DEADLINE = 30.0
+
+# Hedging of slow upstream requests: a duplicate is sent once a request has
+# been waiting longer than this latency quantile of its endpoint (0 disables
+# hedging), but no sooner than the minimum delay
+DEFAULT_HEDGE_QUANTILE = 0.0
+DEFAULT_HEDGE_MIN_DELAY = 0.05
+# Extra requests hedging may add, as a fraction of requests sent
+DEFAULT_HEDGE_BUDGET = 0.1
+# Latency samples needed before hedge delays are estimated
+HEDGE_MIN_SAMPLES = 20
+# Unused hedge budget saved up, in requests
+HEDGE_MAX_CREDITS = 10.0
+
+# Priority classes of upstream requests: interactive tool calls are sent
+# ahead of queued bulk work (batches, enrichment, refreshes, warm-up)
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+# Concurrent upstream requests per server process (0 means no limit), and
+# the fraction of them bulk work may occupy
+DEFAULT_UPSTREAM_CONCURRENCY = 32
+DEFAULT_BULK_SHARE = 0.75
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(value: Any) -> bytes:
+    """Encode a value as compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {value!r}")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    if value.strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    if value.strip().lower() in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"{name} must be a boolean, got {value!r}")
+
+
+# Attributes every log record has, so the rest can be reported as extra fields
+_LOG_RECORD_FIELDS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None))
+) | {"message", "asctime"}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of log records below WARNING.
+
+    Warnings and errors always pass, so sampling only thins out the
+    per-call debug and info records on the request path.
+    """
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Format log records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    Queue log records for a background thread without formatting them.
+
+    The standard QueueHandler formats each record in the calling thread;
+    here formatting is left to the listener, off the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging() -> Optional[logging.handlers.QueueListener]:
+    """
+    Set up logging from the LOG_* environment variables.
+
+    LOG_LEVEL sets the level, LOG_FORMAT chooses "text" or "json" output,
+    LOG_SAMPLE_RATE keeps that fraction of the server's debug and info
+    records, and LOG_QUEUE (on by default) writes records from a background
+    thread so log I/O never blocks the event loop. Like logging.basicConfig,
+    no handler is added when the root logger already has one.
+    """
+    log_format = os.environ.get("LOG_FORMAT", "text").strip().lower()
+    if log_format not in ("text", "json"):
+        raise ValueError(f"LOG_FORMAT must be 'text' or 'json', got {log_format!r}")
+    sample_rate = _env_float("LOG_SAMPLE_RATE", 1.0)
+    if not 0 <= sample_rate <= 1:
+        raise ValueError(f"LOG_SAMPLE_RATE must be between 0 and 1, got {sample_rate}")
+    
+    root = logging.getLogger()
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").strip().upper())
+    for log_filter in [f for f in logger.filters if isinstance(f, SamplingFilter)]:
+        logger.removeFilter(log_filter)
+    if sample_rate < 1:
+        logger.addFilter(SamplingFilter(sample_rate))
+    if root.handlers:
+        return None
+    
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    if not _env_bool("LOG_QUEUE", True):
+        root.addHandler(handler)
+        return None
+    
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(QueueLogHandler(records))
+    return listener
+
+
+configure_logging()
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, in seconds."""
+
+    __slots__ = ("bucket_counts", "count", "total")
+
+    def __init__(self) -> None:
+        # The extra last bucket counts observations above the largest bound
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Record one observation."""
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile by interpolating within its bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if i == len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[-1]
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+    def summary(self) -> Dict[str, float]:
+        """Return the count, mean and estimated percentiles in milliseconds."""
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "mean_ms": round(mean * 1000, 3),
+            "p50_ms": round(self.quantile(0.50) * 1000, 3),
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+        }
+
+
+class ServerMetrics:
+    """
+    Counters and latency histograms for tool calls and upstream requests.
+
+    Metrics are identified by a name and a set of labels, as in Prometheus,
+    and can be rendered as a JSON-friendly snapshot or in the Prometheus
+    text exposition format.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self.counters: "Counter[Tuple[str, Tuple[Tuple[str, str], ...]]]" = Counter()
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+
+    def increment(self, name: str, amount: int = 1, **labels: str) -> None:
+        """Add amount to a counter."""
+        self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """Record a duration in a histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        """Return the histogram with name and labels, or None if never recorded."""
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics as nested dictionaries keyed by name and labels."""
+        counters: Dict[str, Dict[str, int]] = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            counters.setdefault(name, {})[_format_labels(labels)] = value
+        histograms: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            summaries = histograms.setdefault(name, {})
+            summaries[_format_labels(labels)] = histogram.summary()
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def render_prometheus(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Render all metrics, plus any extra gauges, in Prometheus text format."""
+        lines = []
+        seen = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE brandfetch_{name} counter")
+                seen.add(name)
+            lines.append(f"brandfetch_{name}{_prometheus_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in seen:
+                lines.append(f"# TYPE brandfetch_{name} histogram")
+                seen.add(name)
+            prefix = f"brandfetch_{name}"
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, histogram.bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _prometheus_labels(labels + (("le", str(bound)),))
+                lines.append(f"{prefix}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _prometheus_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{prefix}_bucket{inf_labels} {histogram.count}")
+            label_text = _prometheus_labels(labels)
+            lines.append(f"{prefix}_sum{label_text} {histogram.total}")
+            lines.append(f"{prefix}_count{label_text} {histogram.count}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE brandfetch_{name} gauge")
+            lines.append(f"brandfetch_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    return ",".join(f"{key}={value}" for key, value in labels) or "all"
+
+
+def _prometheus_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+@dataclass
+class CacheEntry:
+    """A cached API response."""
+    value: Any
+    expires_at: float
+    size: int
+    group: Optional[str] = None
+    stale_until: float = 0.0
+    encoded: Optional[bytes] = None
+    validators: Optional[Dict[str, str]] = None
+
+
+class ResponseCache:
+    """
+    Bounded in-memory cache for API responses.
+
+    Entries expire after a per-entry TTL and are evicted in least-recently-used
+    order once either the entry count or the total byte size exceeds its limit.
+    Entries can be tagged with a group so related keys (for example, several
+    field projections of one brand) can be found without scanning the cache.
+    An entry stored with a stale TTL stays available to get_stale_first for
+    that long after it expires, so it can be served while it is refreshed.
+    An entry can also keep the JSON it was decoded from, so it can be returned
+    without encoding the value again, and the conditional request headers
+    with which it can be revalidated once expired. Such entries are kept past
+    their stale window until they are evicted, so peek still finds them.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._groups: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.expires_at > time.monotonic()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if it is missing or expired."""
+        found = self.get_first([key])
+        return found[1] if found is not None else None
+
+    def get_first(self, keys: Iterable[str]) -> Optional[Tuple[str, Any]]:
+        """
+        Return the first live (key, value) pair among keys, or None.
+
+        The lookup counts as a single hit or miss however many keys are tried.
+        """
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry.expires_at <= now:
+                if entry.stale_until <= now:
+                    self._drop_expired(key, entry)
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return key, entry.value
+        self.misses += 1
+        return None
+
+    def get_stale_first(self, keys: Iterable[str]) -> Optional[Tuple[str, Any]]:
+        """Return the first expired but still servable (key, value) among keys."""
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at > now:
+                continue
+            if entry.stale_until <= now:
+                self._drop_expired(key, entry)
+                continue
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            return key, entry.value
+        return None
+
+    def expires_in(self, key: str) -> Optional[float]:
+        """Return the seconds until key expires (negative once stale), or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry.expires_at - time.monotonic()
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry under key, even if expired, without counting a lookup."""
+        return self._entries.get(key)
+
+    def get_encoded(self, key: str, value: Any) -> Optional[bytes]:
+        """Return the JSON stored with key if its entry still holds value, or None."""
+        entry = self._entries.get(key)
+        if entry is None or entry.value is not value:
+            return None
+        return entry.encoded
+
+    def group_keys(self, group: str) -> List[str]:
+        """Return the keys currently stored under group."""
+        return list(self._groups.get(group, ()))
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float,
+        size: int,
+        group: Optional[str] = None,
+        stale_ttl: float = 0.0,
+        encoded: Optional[bytes] = None,
+        validators: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Store value under key for ttl seconds, evicting old entries as needed.
+
+        The entry can still be served as stale for stale_ttl seconds after
+        it expires. encoded is the JSON value was decoded from, if known, and
+        validators the headers for a conditional request revalidating it.
+        """
+        if key in self._entries:
+            self._remove(key)
+        if ttl <= 0 or self.max_entries <= 0 or size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + ttl
+        self._entries[key] = CacheEntry(
+            value,
+            expires_at,
+            size,
+            group,
+            expires_at + max(stale_ttl, 0.0),
+            encoded,
+            validators,
+        )
+        self.total_bytes += size
+        if group is not None:
+            self._groups.setdefault(group, set()).add(key)
+        while (
+            len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        self._entries.clear()
+        self._groups.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+        }
+
+    def _drop_expired(self, key: str, entry: CacheEntry) -> None:
+        # Expired entries with validators are left to LRU eviction, since a
+        # conditional request can still renew them
+        if not entry.validators:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+        if entry.group is not None:
+            keys = self._groups[entry.group]
+            keys.discard(key)
+            if not keys:
+                del self._groups[entry.group]
+
+
+class ProjectionTracker:
+    """
+    Track narrow field projections requested per brand.
+
+    When several different projections of the same brand miss the cache within
+    a short window, fetching the full document once and projecting it locally
+    is cheaper than one upstream request per projection.
+    """
+
+    def __init__(
+        self,
+        threshold: int = DEFAULT_FULL_FETCH_THRESHOLD,
+        window: float = DEFAULT_FULL_FETCH_WINDOW,
+        max_tracked: int = 1024,
+    ) -> None:
+        self.threshold = threshold
+        self.window = window
+        self.max_tracked = max_tracked
+        self._misses: "OrderedDict[str, Deque[float]]" = OrderedDict()
+
+    def should_fetch_full(self, identifier: str) -> bool:
+        """Record a projection miss and return whether to fetch the full document."""
+        if self.threshold <= 0:
+            return False
+        now = time.monotonic()
+        misses = self._misses.pop(identifier, None)
+        if misses is None:
+            misses = deque()
+        while misses and now - misses[0] > self.window:
+            misses.popleft()
+        misses.append(now)
+        if len(misses) >= self.threshold:
+            # The full document will answer every later projection
+            return True
+        self._misses[identifier] = misses
+        while len(self._misses) > self.max_tracked:
+            self._misses.popitem(last=False)
+        return False
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one in-flight call.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it is pending wait on the same task and receive its result or
+    exception. Cancelling a waiter does not cancel the shared call.
+    
+    The task sends its upstream requests under its own copy of the first
+    caller's request class, and an interactive caller joining a bulk call
+    raises it, so the caller doesn't wait at bulk priority. A joining caller
+    waits no longer than its own call deadline.
+    """
+
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._calls: Dict[str, Tuple["asyncio.Future[Any]", "RequestClass"]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn for key, or join the call already in flight for key."""
+        caller = _request_class.get()
+        if key not in self._calls:
+            request = RequestClass(caller.priority, caller.session)
+            
+            async def run() -> T:
+                _request_class.set(request)
+                return await fn()
+            
+            call = asyncio.ensure_future(run())
+            self._calls[key] = (call, request)
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+            return await asyncio.shield(call)
+        
+        call, request = self._calls[key]
+        self.coalesced += 1
+        request.raise_to(caller.priority)
+        deadline = _call_deadline.get()
+        if deadline is None:
+            return await asyncio.shield(call)
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(call), max(deadline - time.monotonic(), 0.0)
+            )
+        except asyncio.TimeoutError:
+            raise ValueError("Tool call deadline exceeded")
+
+
+class DiskCache:
+    """
+    Persistent response cache stored in a SQLite database.
+
+    The database runs in WAL mode so many server processes on one host can
+    read it concurrently while one writes. Entries carry an absolute expiry
+    time, and once the stored values exceed max_bytes the least recently
+    accessed entries are evicted. Expired entries are kept until space is
+    needed, so those stored with validators can still be revalidated.
+    Methods are blocking and are meant to be called through asyncio.to_thread.
+    """
+
+    # Only record reads this much newer than the stored access time, so hot
+    # entries don't turn every read into a write
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(
+        self, path: str, max_bytes: int = DEFAULT_DISK_CACHE_MAX_BYTES
+    ) -> None:
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=10.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " validators TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if "validators" not in columns:
+            try:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN validators TEXT")
+            except sqlite3.OperationalError:
+                pass  # Added by another process in the meantime
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta "
+            "(name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        # Running totals, so stats don't scan the whole table
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (name, value)"
+            " SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM entries"
+        )
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (name, value)"
+            " SELECT 'entry_count', COUNT(*) FROM entries"
+        )
+
+    def get_first(self, keys: List[str]) -> Optional[Tuple[str, Any, float, bytes]]:
+        """
+        Return the first live (key, value, expires_at, data) among keys, or None.
+
+        expires_at is a wall-clock timestamp as returned by time.time(), and
+        data is the stored JSON that value was decoded from.
+        """
+        now = time.time()
+        placeholders = ",".join("?" for _ in keys)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value, expires_at, accessed_at FROM entries"
+                f" WHERE key IN ({placeholders}) AND expires_at > ?",
+                (*keys, now),
+            ).fetchall()
+            if not rows:
+                self.misses += 1
+                return None
+            by_key = {row[0]: row for row in rows}
+            key, value, expires_at, accessed_at = next(
+                by_key[key] for key in keys if key in by_key
+            )
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+        return key, json_loads(value), expires_at, value
+
+    def get_revalidation(self, key: str) -> Optional[Tuple[Any, bytes, Dict[str, str]]]:
+        """
+        Return (value, data, validators) for key, even if expired, or None.
+
+        Only entries stored with validators are returned; validators are the
+        headers for a conditional request revalidating the entry.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, validators FROM entries"
+                " WHERE key = ? AND validators IS NOT NULL",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return json_loads(row[0]), row[0], json_loads(row[1])
+
+    def scan(
+        self, prefix: str, after: str = "", limit: int = 500
+    ) -> List[Tuple[str, Any]]:
+        """
+        Return up to limit live (key, value) pairs whose keys start with prefix.
+
+        Pairs are in key order, starting after the key `after`, so a large
+        cache can be read in batches.
+        """
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM entries"
+                " WHERE key >= ? AND key > ? AND key < ? AND expires_at > ?"
+                " ORDER BY key LIMIT ?",
+                (prefix, after, end, time.time(), limit),
+            ).fetchall()
+        return [(key, json_loads(value)) for key, value in rows]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store value under key for ttl seconds, evicting old entries as needed."""
+        self.set_encoded(key, json_dumps(value), ttl)
+
+    def set_encoded(
+        self,
+        key: str,
+        data: bytes,
+        ttl: float,
+        validators: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Store an already JSON-encoded value under key for ttl seconds.
+
+        validators are the headers for a conditional request revalidating
+        the entry once it expires.
+        """
+        if ttl <= 0 or len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT size FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                old_size = row[0] if row else 0
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries"
+                    " (key, value, expires_at, accessed_at, size, validators)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        data,
+                        now + ttl,
+                        now,
+                        len(data),
+                        json_dumps(validators).decode() if validators else None,
+                    ),
+                )
+                self._conn.execute(
+                    "UPDATE meta SET value = value + ? WHERE name = 'total_bytes'",
+                    (len(data) - old_size,),
+                )
+                if row is None:
+                    self._conn.execute(
+                        "UPDATE meta SET value = value + 1"
+                        " WHERE name = 'entry_count'"
+                    )
+                total = self._conn.execute(
+                    "SELECT value FROM meta WHERE name = 'total_bytes'"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            totals = dict(self._conn.execute("SELECT name, value FROM meta"))
+        return {
+            "entries": totals["entry_count"],
+            "bytes": totals["total_bytes"],
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self, now: float) -> None:
+        # Expired entries go first, then the least recently accessed tenth of
+        # the cache at a time until the total size is back under the limit
+        self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        total = self._recount()
+        while total > self.max_bytes:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM entries ORDER BY accessed_at"
+                " LIMIT MAX(1, (SELECT COUNT(*) FROM entries) / 10))"
+            )
+            total = self._recount()
+
+    def _recount(self) -> int:
+        entries, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        self._conn.executemany(
+            "UPDATE meta SET value = ? WHERE name = ?",
+            [(total, "total_bytes"), (entries, "entry_count")],
+        )
+        return total
+
+
+class BlobWriter:
+    """Write one asset to a temporary file while hashing its content."""
+
+    def __init__(self, directory: str) -> None:
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        """Append a chunk of the asset."""
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def hexdigest(self) -> str:
+        """Return the SHA-256 of everything written so far."""
+        return self._hash.hexdigest()
+
+    def close(self) -> None:
+        """Close the temporary file."""
+        self._file.close()
+
+    def abort(self) -> None:
+        """Close and delete the temporary file."""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AssetStore:
+    """
+    Content-addressed on-disk store of downloaded brand assets.
+
+    Files are stored once under their SHA-256 digest, however many URLs
+    serve the same content, and a small JSON record per URL points at the
+    blob. Writes go to a temporary file that is renamed into place, so
+    several server processes can share a store. Once the blobs exceed
+    max_total_bytes the least recently used are evicted, along with the
+    records pointing at them, and temporary files left over from crashed
+    downloads are removed when a process starts using the store. Methods
+    do blocking file I/O and should be run off the event loop.
+    """
+
+    # Only record reads this much newer than a blob's access time, as in
+    # DiskCache
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_ASSET_MAX_BYTES,
+        max_total_bytes: int = DEFAULT_ASSET_STORE_MAX_BYTES,
+    ) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self._lock = threading.Lock()
+        self._ready = False
+        # Size of the blobs, counted on first use and kept up to date by
+        # this process; eviction recounts, to include other processes' blobs
+        self._total_bytes = 0
+
+    def blob_path(self, digest: str) -> str:
+        """Return the path of the blob with the given SHA-256 digest."""
+        return os.path.join(self.path, "blobs", digest[:2], digest)
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the stored record for url, or None if it was never stored."""
+        try:
+            with open(self._record_path(url), encoding="utf-8") as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            self._touch(record["path"])
+        except FileNotFoundError:
+            return None
+        return record
+
+    def begin(self) -> BlobWriter:
+        """Start writing a new asset."""
+        self._ensure_directories()
+        return BlobWriter(os.path.join(self.path, "tmp"))
+
+    def commit(
+        self, writer: BlobWriter, url: str, content_type: Optional[str]
+    ) -> Dict[str, Any]:
+        """Move a finished asset into the store and record it for url."""
+        writer.close()
+        digest = writer.hexdigest()
+        blob_path = self.blob_path(digest)
+        try:
+            self._touch(blob_path)
+            os.remove(writer.path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(writer.path, blob_path)
+            with self._lock:
+                self._total_bytes += writer.size
+                if self._total_bytes > self.max_total_bytes:
+                    self._evict(keep=blob_path)
+        record = {
+            "url": url,
+            "sha256": digest,
+            "path": blob_path,
+            "size": writer.size,
+            "content_type": content_type,
+        }
+        record_path = self._record_path(url)
+        tmp_path = f"{record_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, record_path)
+        return record
+
+    def _record_path(self, url: str) -> str:
+        return os.path.join(self.path, "urls", hashlib.sha256(url.encode()).hexdigest())
+
+    def _ensure_directories(self) -> None:
+        with self._lock:
+            if self._ready:
+                return
+            for name in ("blobs", "urls", "tmp"):
+                os.makedirs(os.path.join(self.path, name), exist_ok=True)
+            # Other processes may be writing fresher temporary files
+            cutoff = time.time() - ASSET_STALE_TEMP_AGE
+            for directory in ("tmp", "urls"):
+                for entry in os.scandir(os.path.join(self.path, directory)):
+                    if entry.name.endswith((".part", ".tmp")):
+                        self._remove_if_older(entry, cutoff)
+            self._total_bytes = sum(size for _, size, _ in self._scan_blobs())
+            self._ready = True
+
+    def _touch(self, path: str) -> None:
+        # Raises FileNotFoundError if the blob was evicted
+        if time.time() - os.stat(path).st_mtime > self.TOUCH_INTERVAL:
+            os.utime(path)
+
+    def _scan_blobs(self) -> List[Tuple[float, int, str]]:
+        blobs = []
+        for prefix in os.scandir(os.path.join(self.path, "blobs")):
+            for entry in os.scandir(prefix.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, entry.path))
+        return blobs
+
+    def _evict(self, keep: str) -> None:
+        # Least recently used blobs go first, down to 90% of the limit so
+        # the next few downloads don't each scan the store again; then the
+        # records whose blob is gone are removed
+        blobs = sorted(self._scan_blobs())
+        total = sum(size for _, size, _ in blobs)
+        for _, size, path in blobs:
+            if total <= self.max_total_bytes * 0.9:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+        for entry in os.scandir(os.path.join(self.path, "urls")):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    blob_path = json.load(f)["path"]
+                if not os.path.exists(blob_path):
+                    os.remove(entry.path)
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+
+    @staticmethod
+    def _remove_if_older(entry: "os.DirEntry[str]", cutoff: float) -> None:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+class BackgroundRefresher:
+    """
+    Run cache refreshes as background tasks, off the tool call's critical path.
+
+    At most max_concurrent refreshes run at once; further requests are dropped
+    rather than queued, since a later stale hit will schedule them again.
+    A key that is already being refreshed is not scheduled twice.
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_BACKGROUND_REFRESHES) -> None:
+        self.max_concurrent = max_concurrent
+        self.scheduled = 0
+        self.dropped = 0
+        self.failed = 0
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def schedule(self, key: str, fn: Callable[[], Awaitable[Any]]) -> bool:
+        """Start refreshing key in the background; return whether it was started."""
+        if key in self._tasks:
+            return False
+        if len(self._tasks) >= self.max_concurrent:
+            self.dropped += 1
+            return False
+        task = asyncio.ensure_future(fn())
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        self.scheduled += 1
+        return True
+
+    async def wait(self) -> None:
+        """Wait for the refreshes currently running to finish."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def close(self) -> None:
+        """Cancel all running refreshes."""
+        for task in self._tasks.values():
+            task.cancel()
+
+    def _finished(self, key: str, task: "asyncio.Task[Any]") -> None:
+        self._tasks.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            logger.warning("Background refresh of %s failed: %s", key, task.exception())
+
+
+class TokenBucket:
+    """
+    Client-side rate limiter for one API endpoint.
+
+    Requests take a token each; tokens refill at `rate` per second up to
+    `burst`. A rate of 0 disables the limit. When the API answers 429 the
+    bucket pauses every caller until the retry time and halves its rate,
+    then recovers gradually towards the configured rate as requests succeed.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: Optional[int] = None) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self.throttled = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self, reserve: float = 0.0) -> float:
+        """
+        Wait until a request may be sent; return the seconds waited.
+
+        With a reserve, the caller also waits until that many tokens are
+        left over for other callers.
+        """
+        now = time.monotonic()
+        delay = max(self._paused_until - now, 0.0)
+        if self.rate > 0:
+            elapsed = now - self._updated
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+            # Reserve a token now, so concurrent callers queue up in order
+            self._tokens -= 1
+            if self._tokens < reserve:
+                delay = max(delay, (reserve - self._tokens) / self.rate)
+        if delay > 0:
+            self.throttled += 1
+            await asyncio.sleep(delay)
+        return delay
+
+    async def try_acquire(self) -> bool:
+        """Take a token only if one is available right away, for optional requests."""
+        now = time.monotonic()
+        if self._paused_until > now:
+            return False
+        if self.rate > 0:
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        return True
+
+    def paused_for(self) -> float:
+        """Return the seconds left of the latest pause this process has seen."""
+        return max(self._paused_until - time.monotonic(), 0.0)
+
+    async def pause(self, seconds: float) -> None:
+        """Hold back all requests for seconds, after a 429 response."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.max_rate > 0:
+            self.rate = max(self.max_rate / 10, self.rate / 2)
+
+    async def record_success(self) -> None:
+        """Recover the rate gradually after a successful request."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose state is shared by all server processes on a host.
+
+    The tokens, current rate and pause deadline live in a SQLite database,
+    so worker processes draw from one rate limit budget and a 429 seen by
+    one worker holds back all of them. Reservations, pauses and rate
+    recovery are written in a worker thread, since a write may wait for
+    other processes to finish theirs.
+    Without a rate, requests only check the shared pause, without a
+    write transaction.
+    """
+
+    def __init__(
+        self, path: str, name: str, rate: float = 0.0, burst: Optional[int] = None
+    ) -> None:
+        super().__init__(rate, burst)
+        self.name = name
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=10.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " paused_until REAL NOT NULL,"
+            " rate REAL NOT NULL)"
+        )
+        # The first process to start sets the budget; later ones join it
+        self._conn.execute(
+            "INSERT OR IGNORE INTO rate_limits VALUES (?, ?, ?, 0, ?)",
+            (name, self.capacity, time.time(), rate),
+        )
+
+    async def acquire(self, reserve: float = 0.0) -> float:
+        """Wait until a request may be sent; return the seconds waited."""
+        delay = await asyncio.to_thread(self._reserve, False, reserve)
+        if delay > 0:
+            self.throttled += 1
+            await asyncio.sleep(delay)
+        return delay
+
+    async def try_acquire(self) -> bool:
+        """Take a token only if one is available right away, for optional requests."""
+        return await asyncio.to_thread(self._reserve, True) == 0
+
+    async def pause(self, seconds: float) -> None:
+        """Hold back requests from every process for seconds, after a 429 response."""
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE rate_limits SET paused_until = MAX(paused_until, ?),"
+            " rate = CASE WHEN ? > 0 THEN MAX(? / 10, rate / 2) ELSE rate END"
+            " WHERE name = ?",
+            (time.time() + seconds, self.max_rate, self.max_rate, self.name),
+        )
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self.max_rate > 0:
+            self.rate = max(self.max_rate / 10, self.rate / 2)
+
+    async def record_success(self) -> None:
+        """Recover the shared rate gradually after a successful request."""
+        if self.rate < self.max_rate:
+            await asyncio.to_thread(
+                self._execute,
+                "UPDATE rate_limits SET rate = MIN(?, rate + ?) WHERE name = ?",
+                (self.max_rate, self.max_rate / 20, self.name),
+            )
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: Tuple[Any, ...]) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _reserve(self, only_if_available: bool = False, reserve: float = 0.0) -> float:
+        # Wall-clock time, since the state is shared between processes. With
+        # only_if_available, nothing is reserved when the caller would wait.
+        with self._lock:
+            if self.max_rate <= 0:
+                # Without a rate there are no tokens to take, only a pause
+                # to respect, which a read sees without the write lock
+                (paused_until,) = self._conn.execute(
+                    "SELECT paused_until FROM rate_limits WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                delay = max(paused_until - time.time(), 0.0)
+                self._paused_until = time.monotonic() + delay
+                return delay
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, updated, paused_until, rate = self._conn.execute(
+                    "SELECT tokens, updated, paused_until, rate FROM rate_limits"
+                    " WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                now = time.time()
+                delay = max(paused_until - now, 0.0)
+                # Mirrored on this process's clock for paused_for
+                self._paused_until = time.monotonic() + delay
+                if rate > 0:
+                    tokens = min(self.capacity, tokens + max(now - updated, 0.0) * rate)
+                    tokens -= 1
+                    if tokens < reserve:
+                        delay = max(delay, (reserve - tokens) / rate)
+                if only_if_available and delay > 0:
+                    self._conn.execute("ROLLBACK")
+                    return delay
+                if rate > 0:
+                    self._conn.execute(
+                        "UPDATE rate_limits SET tokens = ?, updated = ? WHERE name = ?",
+                        (tokens, now, self.name),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.rate = rate
+        return delay
+
+
+class HedgePolicy:
+    """
+    Decide when a slow upstream request is hedged with a duplicate.
+
+    A request still unanswered after the `quantile` latency of its endpoint,
+    estimated from the upstream latency histogram and never less than
+    min_delay, gets one duplicate request, and whichever answers first wins.
+    Each request sent earns `budget` hedge credits, up to HEDGE_MAX_CREDITS,
+    and each hedge spends one, so hedging adds at most that fraction of
+    extra load. A quantile of 0 disables hedging.
+    """
+
+    def __init__(
+        self,
+        quantile: float = DEFAULT_HEDGE_QUANTILE,
+        min_delay: float = DEFAULT_HEDGE_MIN_DELAY,
+        budget: float = DEFAULT_HEDGE_BUDGET,
+    ) -> None:
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.budget = budget
+        self.credits = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def delay(self, latencies: Optional[Histogram]) -> Optional[float]:
+        """
+        Record a request and return how long to wait before hedging it.
+
+        Returns None when the request should not be hedged: hedging is
+        disabled or too few latencies have been observed yet.
+        """
+        self.requests += 1
+        self.credits = min(HEDGE_MAX_CREDITS, self.credits + self.budget)
+        if (
+            self.quantile <= 0
+            or latencies is None
+            or latencies.count < HEDGE_MIN_SAMPLES
+        ):
+            return None
+        return max(self.min_delay, latencies.quantile(self.quantile))
+
+    def can_hedge(self) -> bool:
+        """Return whether the budget has a credit left for a hedge."""
+        return self.credits >= 1
+
+    def record_hedge(self) -> None:
+        """Spend a credit on a hedge that was sent."""
+        self.credits -= 1
+        self.hedges += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hedging counters."""
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "credits": round(self.credits, 2),
+        }
+
+
+@dataclass(eq=False)
+class RequestClass:
+    """
+    The priority class and MCP session upstream requests are sent under.
+
+    Calls coalesced by SingleFlight share one instance, whose priority an
+    interactive caller can raise while the call is in flight.
+    """
+    priority: str = PRIORITY_INTERACTIVE
+    session: Hashable = None
+    # The scheduler the requests of this class are queued in
+    scheduler: Optional["RequestScheduler"] = None
+
+    def raise_to(self, priority: str) -> None:
+        """Raise the priority class to priority, if that is higher."""
+        if PRIORITIES.index(priority) >= PRIORITIES.index(self.priority):
+            return
+        self.priority = priority
+        if self.scheduler is not None:
+            self.scheduler.requeue(self)
+
+
+# A queued request: its dispatch future, rate limiter and request class
+_Waiter = Tuple["asyncio.Future[str]", TokenBucket, RequestClass]
+
+
+class RequestScheduler:
+    """
+    Order upstream requests by priority class and share them fairly between sessions.
+
+    A request waits for one of max_concurrent slots (0 means no limit) and
+    then for a token from its endpoint's rate limiter. Queued interactive
+    requests are always dispatched before bulk ones. Bulk requests may hold
+    at most bulk_share of the slots and leave the rest of the limiter's
+    burst unused, so interactive calls find a free slot and a token even
+    while a large job runs. Within a class, sessions take turns.
+
+    Only one request per rate limiter and class waits for a token at a time;
+    the rest stay queued here rather than reserving tokens ahead, so an
+    interactive request arriving later is still next in line. Queued
+    requests whose class is raised move to the interactive queue; one
+    already waiting for a token keeps waiting as bulk work.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = DEFAULT_UPSTREAM_CONCURRENCY,
+        bulk_share: float = DEFAULT_BULK_SHARE,
+    ) -> None:
+        if max_concurrent < 0:
+            raise ValueError("max_concurrent must be at least 0 (no limit)")
+        if not 0 < bulk_share <= 1:
+            raise ValueError("bulk_share must be greater than 0 and at most 1")
+        self.max_concurrent = max_concurrent
+        self.bulk_share = bulk_share
+        self.bulk_slots = 0
+        if max_concurrent > 0:
+            self.bulk_slots = max(1, int(max_concurrent * bulk_share))
+        self.in_flight: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.dispatched: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        # Per class, the waiting requests of each session in turn order. Each
+        # future is resolved with the class its request is dispatched under.
+        self._queues: Dict[str, "OrderedDict[Hashable, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        # Rate limiters and classes with a dispatched request waiting for a token
+        self._acquiring: Set[Tuple[int, str]] = set()
+
+    def queued(self, priority: str) -> int:
+        """Return the number of requests of a class waiting to be dispatched."""
+        return sum(len(waiters) for waiters in self._queues[priority].values())
+
+    @asynccontextmanager
+    async def slot(
+        self, limiter: TokenBucket, request: RequestClass
+    ) -> AsyncIterator[float]:
+        """
+        Hold a slot for one upstream request, yielding the seconds waited.
+
+        The slot is taken in turn among queued requests of the request's
+        class and after a token from limiter, and is given back when the
+        block exits.
+        """
+        start = time.monotonic()
+        future: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+        request.scheduler = self
+        self._queues[request.priority].setdefault(request.session, deque()).append(
+            (future, limiter, request)
+        )
+        self._dispatch()
+        if not future.done():
+            try:
+                await future
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # Dispatched just as the caller was cancelled
+                    self._acquiring.discard((id(limiter), future.result()))
+                    self._release(future.result())
+                else:
+                    self._discard(request, future)
+                raise
+        priority = future.result()
+        reserve = 0.0
+        if priority == PRIORITY_BULK:
+            reserve = limiter.capacity * (1 - self.bulk_share)
+        try:
+            await limiter.acquire(reserve)
+        except BaseException:
+            self._acquiring.discard((id(limiter), priority))
+            self._release(priority)
+            raise
+        self._acquiring.discard((id(limiter), priority))
+        self._dispatch()
+        try:
+            yield time.monotonic() - start
+        finally:
+            self._release(priority)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return slot usage and queue lengths per priority class."""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "bulk_slots": self.bulk_slots,
+            "in_flight": dict(self.in_flight),
+            "queued": {priority: self.queued(priority) for priority in PRIORITIES},
+            "dispatched": dict(self.dispatched),
+        }
+
+    def requeue(self, request: RequestClass) -> None:
+        """Move the queued requests of a raised request class to its new class."""
+        for priority, queues in self._queues.items():
+            if priority == request.priority:
+                continue
+            for session in list(queues):
+                moved = [waiter for waiter in queues[session] if waiter[2] is request]
+                if not moved:
+                    continue
+                queues[session] = deque(
+                    waiter for waiter in queues[session] if waiter[2] is not request
+                )
+                if not queues[session]:
+                    del queues[session]
+                target = self._queues[request.priority]
+                target.setdefault(session, deque()).extend(moved)
+        self._dispatch()
+
+    def _has_slot(self, priority: str) -> bool:
+        if self.max_concurrent <= 0:
+            return True
+        if sum(self.in_flight.values()) >= self.max_concurrent:
+            return False
+        if priority != PRIORITY_BULK:
+            return True
+        return self.in_flight[PRIORITY_BULK] < self.bulk_slots
+
+    def _dispatch(self) -> None:
+        # Hand out free slots to the queued requests, interactive first and
+        # one request per session in turn, skipping requests whose rate
+        # limiter already has a request of their class waiting for a token
+        progress = True
+        while progress:
+            progress = False
+            for priority in PRIORITIES:
+                queues = self._queues[priority]
+                for session in list(queues):
+                    if not self._has_slot(priority):
+                        break
+                    waiters = queues[session]
+                    future, limiter, _ = waiters[0]
+                    if (id(limiter), priority) in self._acquiring:
+                        continue
+                    waiters.popleft()
+                    if waiters:
+                        queues.move_to_end(session)
+                    else:
+                        del queues[session]
+                    if future.cancelled():
+                        continue
+                    self.in_flight[priority] += 1
+                    self.dispatched[priority] += 1
+                    self._acquiring.add((id(limiter), priority))
+                    future.set_result(priority)
+                    progress = True
+
+    def _discard(self, request: RequestClass, future: "asyncio.Future[str]") -> None:
+        # Requests are moved when their class is raised, so a waiting
+        # request is in the queue of its current class
+        queues = self._queues[request.priority]
+        waiters = queues.get(request.session)
+        if waiters is None:
+            return
+        for waiter in waiters:
+            if waiter[0] is future:
+                waiters.remove(waiter)
+                break
+        if not waiters:
+            del queues[request.session]
+
+    def _release(self, priority: str) -> None:
+        self.in_flight[priority] -= 1
+        self._dispatch()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class SearchIndex:
+    """
+    Local index of brands seen in search and brand responses.
+
+    Brand names are indexed by trigram, so a query finds exact, prefix and
+    fuzzy matches without calling the search API. Entries are keyed by
+    brand ID (or domain) and the least recently updated are evicted beyond
+    max_entries.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_SEARCH_INDEX_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Normalized name and its number of trigrams for each entry
+        self._name_keys: Dict[str, Tuple[str, int]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, brand: Dict[str, Any]) -> None:
+        """Index one search result shaped brand."""
+        if self.max_entries <= 0:
+            return
+        name_key = _name_key(str(brand.get("name") or ""))
+        key = brand.get("brandId") or brand.get("domain")
+        if not name_key or not key:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = {
+            "icon": brand.get("icon"),
+            "name": brand.get("name"),
+            "domain": brand.get("domain"),
+            "claimed": bool(brand.get("claimed")),
+            "brandId": brand.get("brandId"),
+        }
+        trigrams = _trigrams(name_key)
+        self._name_keys[key] = (name_key, len(trigrams))
+        for trigram in trigrams:
+            self._trigrams.setdefault(trigram, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def add_search_results(self, results: Iterable[Dict[str, Any]]) -> None:
+        """Index the results of a search response."""
+        for result in results:
+            if isinstance(result, dict):
+                self.add(result)
+
+    def add_brand_document(self, document: Dict[str, Any]) -> None:
+        """Index a brand document, if it has a name and domain or ID."""
+        icon = None
+        for logo in document.get("logos") or []:
+            if (
+                isinstance(logo, dict)
+                and logo.get("type") == "icon"
+                and logo.get("formats")
+            ):
+                icon = logo["formats"][0].get("src")
+                break
+        self.add({
+            "icon": icon,
+            "name": document.get("name"),
+            "domain": document.get("domain"),
+            "claimed": document.get("claimed"),
+            "brandId": document.get("id"),
+        })
+
+    def search(
+        self, name: str, limit: int = SEARCH_INDEX_MAX_RESULTS
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Return (score, brand) pairs matching name, best first.
+
+        An exact name match scores 1.0, a prefix match between 0.5 and 0.9,
+        and other matches 0.8 times their trigram similarity.
+        """
+        query = _name_key(name)
+        if not query:
+            return []
+        query_trigrams = _trigrams(query)
+        shared: "Counter[str]" = Counter()
+        for trigram in query_trigrams:
+            keys = self._trigrams.get(trigram)
+            if keys:
+                shared.update(keys)
+        # A fuzzy match can only score enough with enough shared trigrams
+        min_shared = SEARCH_INDEX_MIN_RESULT_SCORE / 1.6 * len(query_trigrams)
+        matches = []
+        for key, count in shared.items():
+            if count < min_shared:
+                continue
+            name_key, trigram_count = self._name_keys[key]
+            if name_key == query:
+                score = 1.0
+            elif name_key.startswith(query):
+                score = 0.5 + 0.4 * len(query) / len(name_key)
+            else:
+                score = 1.6 * count / (len(query_trigrams) + trigram_count)
+            if score >= SEARCH_INDEX_MIN_RESULT_SCORE:
+                matches.append((round(score, 4), self._entries[key]))
+        matches.sort(key=lambda match: -match[0])
+        return matches[:limit]
+
+    def stats(self) -> Dict[str, int]:
+        """Return index counters."""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, key: str) -> None:
+        del self._entries[key]
+        name_key, _ = self._name_keys.pop(key)
+        for trigram in _trigrams(name_key):
+            keys = self._trigrams.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[trigram]
+
+
+def _trigrams(name_key: str) -> Set[str]:
+    padded = f"  {name_key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# A palette: (hex, L, a, b, weight) for each color, highest weight first
+Palette = List[Tuple[str, float, float, float, float]]
+# A ColorIndex entry: brand document, palette and padded array values
+_IndexedBrand = Tuple[Dict[str, Any], Palette, Tuple[float, ...]]
+
+
+def import_numpy() -> Any:
+    """Import NumPy on first use, as only the color index needs it."""
+    try:
+        import numpy
+    except ImportError:
+        raise ValueError(
+            "Color similarity search requires NumPy: "
+            "pip install 'brandfetch-mcp[similarity]'"
+        ) from None
+    return numpy
+
+
+def hex_to_lab(value: str) -> Optional[Tuple[float, float, float]]:
+    """Convert a hex sRGB color to CIE Lab (D65), or None if it isn't a hex color."""
+    match = HEX_COLOR_PATTERN.fullmatch(value.strip())
+    if match is None:
+        return None
+    digits = match.group(1)
+    if len(digits) == 3:
+        digits = "".join(digit * 2 for digit in digits)
+    linear = []
+    for i in (0, 2, 4):
+        channel = int(digits[i:i + 2], 16) / 255
+        if channel <= 0.04045:
+            linear.append(channel / 12.92)
+        else:
+            linear.append(((channel + 0.055) / 1.055) ** 2.4)
+    red, green, blue = linear
+    xyz = (
+        (0.4124564 * red + 0.3575761 * green + 0.1804375 * blue) / 0.95047,
+        0.2126729 * red + 0.7151522 * green + 0.0721750 * blue,
+        (0.0193339 * red + 0.1191920 * green + 0.9503041 * blue) / 1.08883,
+    )
+    fx, fy, fz = (
+        t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116 for t in xyz
+    )
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def color_weight(color: Dict[str, Any]) -> float:
+    """
+    Return the weight of a brand color in palette distances.
+
+    The weight comes from the color's type, and is halved towards black or
+    white brightness.
+    """
+    weight = COLOR_TYPE_WEIGHTS.get(str(color.get("type")), DEFAULT_COLOR_TYPE_WEIGHT)
+    brightness = color.get("brightness")
+    if isinstance(brightness, (int, float)):
+        weight *= 1.0 - 0.5 * min(1.0, abs(brightness - 127.5) / 127.5)
+    return weight
+
+
+def palette_colors(colors: Iterable[Any]) -> Palette:
+    """
+    Convert brand colors to (hex, L, a, b, weight), highest weight first.
+
+    Colors are the "colors" entries of a brand document or plain hex
+    strings, which get full weight. Invalid colors are skipped, and at most
+    COLOR_INDEX_MAX_COLORS are kept.
+    """
+    palette = []
+    for color in colors:
+        if isinstance(color, str):
+            color = {"hex": color, "type": "brand"}
+        if not isinstance(color, dict) or not isinstance(color.get("hex"), str):
+            continue
+        lab = hex_to_lab(color["hex"])
+        if lab is not None:
+            palette.append((color["hex"].strip().lower(), *lab, color_weight(color)))
+    palette.sort(key=lambda entry: -entry[4])
+    return [entry for entry in palette[:COLOR_INDEX_MAX_COLORS] if entry[4] > 0]
+
+
+class ColorIndex:
+    """
+    Local index of brand palettes, for finding brands with similar colors.
+
+    Colors are compared in CIE Lab, where distance follows perceived
+    difference, and weighted by their type and brightness. The distance
+    between two palettes is the weighted mean distance from each color to
+    the closest color of the other palette, averaged over both directions.
+
+    Brands are added from brand documents as they are fetched or loaded from
+    the caches, without NumPy. A query first writes the brands added since
+    the previous query into NumPy arrays, then compares the query palette
+    with every brand in one vectorized computation. The least recently
+    updated brands are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_COLOR_INDEX_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.queries = 0
+        self.disk_scanned = False
+        # Brand, palette and padded (L, a, b, weight) values for the arrays
+        self._brands: "OrderedDict[str, _IndexedBrand]" = OrderedDict()
+        # Brands added, updated or evicted since the arrays were last written
+        self._dirty: Set[str] = set()
+        # Array column of each brand, and the brand of each column
+        self._rows: Dict[str, int] = {}
+        self._keys: List[str] = []
+        # NumPy arrays of the indexed palettes (see _sync)
+        self._lab: Any = None
+        self._lab_squared: Any = None
+        self._weights: Any = None
+        self._padding: Any = None
+
+    def __len__(self) -> int:
+        return len(self._brands)
+
+    def add_brand_document(
+        self, document: Dict[str, Any], identifier: Optional[str] = None
+    ) -> None:
+        """Index the colors of a brand document, keyed by its domain or identifier."""
+        if self.max_entries <= 0 or not isinstance(document.get("colors"), list):
+            return
+        domain = document.get("domain")
+        key = normalize_identifier(
+            domain if isinstance(domain, str) else identifier or ""
+        )
+        palette = palette_colors(document["colors"])
+        if not key or not palette:
+            return
+        info = {
+            "name": document.get("name"),
+            "domain": domain if isinstance(domain, str) else key,
+            "brandId": document.get("id"),
+            "colors": [entry[0] for entry in palette],
+        }
+        previous = self._brands.pop(key, None)
+        if previous is not None:
+            # Projected documents may lack the name and ID
+            for name in ("name", "brandId"):
+                if info[name] is None:
+                    info[name] = previous[0][name]
+        values = tuple(value for entry in palette for value in entry[1:])
+        values += (0.0,) * (4 * COLOR_INDEX_MAX_COLORS - len(values))
+        self._brands[key] = (info, palette, values)
+        self._dirty.add(key)
+        while len(self._brands) > self.max_entries:
+            evicted, _ = self._brands.popitem(last=False)
+            self._dirty.add(evicted)
+
+    def get(self, identifier: str) -> Optional[Tuple[Dict[str, Any], Palette]]:
+        """Return the (brand, palette) indexed for an identifier, or None."""
+        indexed = self._brands.get(normalize_identifier(identifier))
+        return indexed[:2] if indexed is not None else None
+
+    def nearest(
+        self,
+        palette: Palette,
+        limit: int = 10,
+        exclude: Optional[str] = None,
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """Return (distance, brand) pairs for the brands closest to palette.
+
+        Pairs are sorted closest first.
+        """
+        np = import_numpy()
+        self._sync(np)
+        self.queries += 1
+        count = len(self._keys)
+        if not count or not palette or limit < 1:
+            return []
+        query = np.array([entry[1:4] for entry in palette], dtype=np.float32)
+        query_weights = np.array([entry[4] for entry in palette], dtype=np.float32)
+        weights = self._weights[:, :count]
+        # Distances from every brand color slot to every query color, as
+        # (slot, query color, brand) so reductions run over whole rows
+        squared = query @ self._lab[:, :, :count]
+        squared *= -2
+        squared += self._lab_squared[:, None, :count]
+        squared += (query * query).sum(axis=1)[None, :, None]
+        distances = np.sqrt(np.maximum(squared, 0, out=squared), out=squared)
+        # Each brand color to the closest query color
+        backward = (distances.min(axis=1) * weights).sum(axis=0) / weights.sum(axis=0)
+        # Each query color to the closest brand color, skipping padding slots
+        distances += self._padding[:, None, :count]
+        forward = query_weights @ distances.min(axis=0) / query_weights.sum()
+        scores = (forward + backward) / 2
+        if exclude is not None:
+            row = self._rows.get(normalize_identifier(exclude))
+            if row is not None:
+                scores[row] = np.inf
+        limit = min(limit, count)
+        top = np.argpartition(scores, limit - 1)[:limit]
+        top = top[np.argsort(scores[top])]
+        return [
+            (round(float(scores[row]), 2), self._brands[self._keys[row]][0])
+            for row in top
+            if np.isfinite(scores[row])
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """Return index counters."""
+        return {"entries": len(self._brands), "queries": self.queries}
+
+    def _sync(self, np: Any) -> None:
+        # Write the brands changed since the last query into the arrays, which
+        # hold one column per brand: Lab values (slot, L/a/b, brand), and
+        # squared Lab norms, weights and padding (0, or inf for no color)
+        # per (slot, brand)
+        if not self._dirty:
+            return
+        for key in self._dirty:
+            if key not in self._brands and key in self._rows:
+                self._remove_row(key)
+        changed = [key for key in self._dirty if key in self._brands]
+        self._dirty.clear()
+        if not changed:
+            return
+        size = len(self._keys)
+        needed = size + len(changed)
+        if self._lab is None or needed > self._lab.shape[2]:
+            capacity = max(1024, needed, 2 * size)
+            arrays = (
+                np.zeros((COLOR_INDEX_MAX_COLORS, 3, capacity), dtype=np.float32),
+                np.zeros((COLOR_INDEX_MAX_COLORS, capacity), dtype=np.float32),
+                np.zeros((COLOR_INDEX_MAX_COLORS, capacity), dtype=np.float32),
+                np.full((COLOR_INDEX_MAX_COLORS, capacity), np.inf, dtype=np.float32),
+            )
+            if self._lab is not None:
+                arrays[0][:, :, :size] = self._lab[:, :, :size]
+                arrays[1][:, :size] = self._lab_squared[:, :size]
+                arrays[2][:, :size] = self._weights[:, :size]
+                arrays[3][:, :size] = self._padding[:, :size]
+            self._lab, self._lab_squared, self._weights, self._padding = arrays
+        rows = []
+        values: List[float] = []
+        for key in changed:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._keys)
+                self._keys.append(key)
+            rows.append(row)
+            values.extend(self._brands[key][2])
+        # (brand, slot, L/a/b/weight) to one column per brand
+        values_array = np.array(values, dtype=np.float32).reshape(
+            len(changed), COLOR_INDEX_MAX_COLORS, 4
+        ).transpose(1, 2, 0)
+        lab = values_array[:, :3, :]
+        rows_array = np.array(rows)
+        self._lab[:, :, rows_array] = lab
+        self._lab_squared[:, rows_array] = (lab * lab).sum(axis=1)
+        self._weights[:, rows_array] = values_array[:, 3, :]
+        self._padding[:, rows_array] = np.where(values_array[:, 3, :] > 0, 0, np.inf)
+
+    def _remove_row(self, key: str) -> None:
+        # Move the last column into the removed one, keeping the arrays dense
+        row = self._rows.pop(key)
+        last_key = self._keys.pop()
+        if last_key != key:
+            last = len(self._keys)
+            for array in (self._lab_squared, self._weights, self._padding):
+                array[:, row] = array[:, last]
+            self._lab[:, :, row] = self._lab[:, :, last]
+            self._keys[row] = last_key
+            self._rows[last_key] = row
+
+
+def classify_identifier(identifier: str) -> Tuple[str, str]:
+    """
+    Classify a brand identifier and return (kind, canonical form).
+
+    kind is "id", "isin", "domain", "ticker" or "unknown". Brand IDs are
+    case-sensitive and kept as given, and so is anything unclassified.
+    ISINs are uppercased. Stock symbols are only recognized when written
+    in uppercase, as short words like "nike" are not symbols. Domains are
+    lowercased and stripped of any "www.", path and trailing dot, and URLs
+    of their scheme, user info and port, so "https://www.Nike.com/" becomes
+    "nike.com". Symbols with an exchange suffix, such as "RY.TO", are also
+    valid domain names, and are taken as stock symbols.
+    """
+    identifier = identifier.strip()
+    if BRAND_ID_PATTERN.match(identifier):
+        return "id", identifier
+    upper = identifier.upper()
+    if ISIN_PATTERN.match(upper):
+        return "isin", upper
+    if identifier == upper and TICKER_PATTERN.match(upper):
+        return "ticker", upper
+    
+    host = identifier.lower()
+    if "://" in host:
+        host = host.split("://", 1)[1]
+        host = host.split("/", 1)[0].rsplit("@", 1)[-1].split(":", 1)[0]
+    host = host.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0].rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    if DOMAIN_PATTERN.match(host):
+        return "domain", host
+    return "unknown", identifier
+
+
+def normalize_identifier(identifier: str) -> str:
+    """Normalize a brand identifier for use in cache keys and API requests."""
+    return classify_identifier(identifier)[1]
+
+
+class AliasIndex:
+    """
+    Map the other identifiers of a brand to its primary identifier.
+
+    A brand's primary identifier is its brand ID, or its domain when the
+    ID is unknown. Aliases are learned from responses: a document fetched
+    by domain, ISIN or stock symbol links that identifier and the
+    document's domain to its ID, and search results link domains to IDs.
+    Brand documents are cached under the primary identifier, so every alias
+    of a brand shares one cache entry. The least recently learned aliases
+    are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_ALIAS_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def resolve(self, identifier: str) -> str:
+        """Return the primary identifier for identifier, in canonical form."""
+        canonical = normalize_identifier(identifier)
+        primary = self._aliases.get(canonical)
+        if primary is None:
+            return canonical
+        self.hits += 1
+        return primary
+
+    def add(self, alias: str, primary: str) -> None:
+        """Record alias as another identifier of the brand known as primary."""
+        alias = normalize_identifier(alias)
+        primary = normalize_identifier(primary)
+        if self.max_entries <= 0 or not alias or alias == primary:
+            return
+        self._aliases.pop(alias, None)
+        self._aliases[alias] = primary
+        while len(self._aliases) > self.max_entries:
+            self._aliases.popitem(last=False)
+
+    def learn(self, identifier: str, document: Dict[str, Any]) -> str:
+        """
+        Learn aliases from a brand document fetched by identifier.
+
+        Returns the primary identifier to cache the document under.
+        """
+        primary = normalize_identifier(identifier)
+        brand_id = document.get("id")
+        domain = document.get("domain")
+        if isinstance(brand_id, str) and classify_identifier(brand_id)[0] == "id":
+            primary = brand_id.strip()
+        elif isinstance(domain, str) and classify_identifier(domain)[0] == "domain":
+            primary = normalize_identifier(domain)
+        self.add(identifier, primary)
+        if isinstance(domain, str) and domain:
+            self.add(domain, primary)
+        return primary
+
+    def learn_search_results(self, results: Iterable[Dict[str, Any]]) -> None:
+        """Link the domains and brand IDs listed in search results."""
+        for result in results:
+            if not isinstance(result, dict):
+                continue
+            domain, brand_id = result.get("domain"), result.get("brandId")
+            if (
+                isinstance(domain, str) and domain
+                and isinstance(brand_id, str)
+                and classify_identifier(brand_id)[0] == "id"
+            ):
+                self.add(domain, brand_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Return index counters."""
+        return {"entries": len(self._aliases), "hits": self.hits}
+
+
+def alias_cache_key(identifier: str) -> str:
+    """Build the disk cache key mapping an identifier to its primary identifier."""
+    return f"alias:{normalize_identifier(identifier)}"
+
+
+def brand_cache_group(identifier: str) -> str:
+    """Build the cache group shared by all field projections of a brand."""
+    return f"brand:{normalize_identifier(identifier)}"
+
+
+def brand_cache_key(identifier: str, fields: Optional[List[str]] = None) -> str:
+    """Build the cache key for a brand lookup and its field set."""
+    field_part = ",".join(sorted(set(fields))) if fields else "*"
+    return f"{brand_cache_group(identifier)}:{field_part}"
+
+
+def brand_cache_candidates(
+    cache: ResponseCache, identifier: str, fields: Optional[List[str]] = None
+) -> List[str]:
+    """
+    List the cache keys that can answer a brand lookup, best match first.
+
+    The exact key comes first, then the full document, then any cached
+    projection whose field set is a superset of the requested fields.
+    """
+    exact_key = brand_cache_key(identifier, fields)
+    if not fields:
+        return [exact_key]
+    full_key = brand_cache_key(identifier)
+    wanted = set(fields)
+    supersets = []
+    for key in cache.group_keys(brand_cache_group(identifier)):
+        if key in (exact_key, full_key):
+            continue
+        cached_fields = key.rsplit(":", 1)[1]
+        if wanted.issubset(cached_fields.split(",")):
+            supersets.append(key)
+    return [exact_key, full_key] + supersets
+
+
+def brand_cache_key_fields(cache_key: str) -> Optional[List[str]]:
+    """Return the field set encoded in a brand cache key (None for all fields)."""
+    field_part = cache_key.rsplit(":", 1)[1]
+    return None if field_part == "*" else field_part.split(",")
+
+
+def project_fields(document: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Keep only the requested top-level fields of a brand document."""
+    return {name: document[name] for name in fields if name in document}
+
+
+@dataclass(frozen=True)
+class CompactSpec:
+    """Compiled options for slimming a brand document."""
+    logo_themes: Optional[Tuple[str, ...]] = None
+    logo_formats: Optional[Tuple[str, ...]] = None
+    max_items: Optional[int] = DEFAULT_COMPACT_MAX_ITEMS
+    best_logo_only: bool = False
+    # Preference rank of each theme and format, from the order they were given
+    theme_rank: Dict[str, int] = field(default_factory=dict, compare=False, hash=False)
+    format_rank: Dict[str, int] = field(default_factory=dict, compare=False, hash=False)
 
-import httpx
-from dotenv import load_dotenv
 
-from mcp.server.fastmcp import FastMCP, Context
+@functools.lru_cache(maxsize=128)
+def compile_compact_spec(
+    logo_themes: Optional[Tuple[str, ...]] = None,
+    logo_formats: Optional[Tuple[str, ...]] = None,
+    max_items: Optional[int] = DEFAULT_COMPACT_MAX_ITEMS,
+    best_logo_only: bool = False,
+) -> CompactSpec:
+    """Build a CompactSpec, reusing the compiled spec for repeated options."""
+    if max_items is not None and max_items < 1:
+        raise ValueError("max_items must be at least 1")
+    themes = tuple(t.lower() for t in logo_themes) if logo_themes else None
+    formats = tuple(f.lower() for f in logo_formats) if logo_formats else None
+    return CompactSpec(
+        logo_themes=themes,
+        logo_formats=formats,
+        max_items=max_items,
+        best_logo_only=best_logo_only,
+        theme_rank={theme: i for i, theme in enumerate(themes or ())},
+        format_rank={fmt: i for i, fmt in enumerate(formats or ())},
+    )
 
-# Load environment variables
-load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
-logger = logging.getLogger("brandfetch-mcp")
+def compact_brand_document(
+    document: Dict[str, Any], spec: CompactSpec
+) -> Dict[str, Any]:
+    """
+    Slim a brand document in one pass.
+
+    Logos are limited to the spec's themes and formats (in order of
+    preference), null and empty values are dropped, and lists are capped at
+    max_items. With best_logo_only, one logo with a single format is kept per
+    logo type. The document itself is not modified.
+    """
+    result = {}
+    for key, value in document.items():
+        if key == "logos" and isinstance(value, list):
+            value = _compact_logos(value, spec)
+        else:
+            value = _compact_value(value, spec)
+        if value is not None:
+            result[key] = value
+    return result
+
+
+def _compact_value(value: Any, spec: CompactSpec) -> Any:
+    # Returns None for values that should be dropped
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            item = _compact_value(item, spec)
+            if item is not None:
+                compacted[key] = item
+        return compacted or None
+    if isinstance(value, list):
+        items = []
+        for item in value:
+            item = _compact_value(item, spec)
+            if item is not None:
+                items.append(item)
+                if spec.max_items is not None and len(items) >= spec.max_items:
+                    break
+        return items or None
+    if value == "":
+        return None
+    return value
+
+
+def _compact_logos(logos: List[Any], spec: CompactSpec) -> Optional[List[Any]]:
+    kept = []
+    for logo in logos:
+        if not isinstance(logo, dict):
+            continue
+        theme = str(logo.get("theme") or "").lower()
+        if spec.logo_themes is not None and theme not in spec.theme_rank:
+            continue
+        formats = [
+            fmt for fmt in logo.get("formats") or []
+            if isinstance(fmt, dict) and (
+                spec.logo_formats is None
+                or str(fmt.get("format") or "").lower() in spec.format_rank
+            )
+        ]
+        if not formats:
+            continue
+        if spec.logo_formats is not None:
+            formats.sort(
+                key=lambda fmt: spec.format_rank[str(fmt.get("format")).lower()]
+            )
+        kept.append((spec.theme_rank.get(theme, len(spec.theme_rank)), logo, formats))
+    
+    if spec.best_logo_only:
+        # Keep the logo with the most preferred theme for each type
+        best: Dict[Any, Tuple[int, Dict[str, Any], List[Any]]] = {}
+        for candidate in kept:
+            logo_type = candidate[1].get("type")
+            if logo_type not in best or candidate[0] < best[logo_type][0]:
+                best[logo_type] = candidate
+        kept = [(rank, logo, formats[:1]) for rank, logo, formats in best.values()]
+    
+    return _compact_value(
+        [dict(logo, formats=formats) for _, logo, formats in kept], spec
+    )
+
+
+def missing_cache_key(cache_key: str) -> str:
+    """Build the key recording that the API answered a cached lookup with 404."""
+    return f"missing:{cache_key}"
+
+
+def conditional_headers(response: httpx.Response) -> Dict[str, str]:
+    """Return the headers for a conditional request revalidating a response."""
+    headers = {}
+    if "ETag" in response.headers:
+        headers["If-None-Match"] = response.headers["ETag"]
+    if "Last-Modified" in response.headers:
+        headers["If-Modified-Since"] = response.headers["Last-Modified"]
+    return headers
+
+
+def search_cache_key(name: str, client_id: str) -> str:
+    """Build the cache key for a brand search."""
+    normalized_name = " ".join(name.split()).lower()
+    return f"search:{normalized_name}:{client_id}"
+
+
+@dataclass
+class RankingWeights:
+    """Weights of the signals used to rank search results."""
+    claimed: float = DEFAULT_RANK_CLAIMED_WEIGHT
+    name: float = DEFAULT_RANK_NAME_WEIGHT
+    domain: float = DEFAULT_RANK_DOMAIN_WEIGHT
+
+
+def _name_key(name: str) -> str:
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+
+def rank_search_results(
+    name: str,
+    results: List[Dict[str, Any]],
+    weights: RankingWeights,
+) -> List[Dict[str, Any]]:
+    """
+    Order search results by how well they match name, best first.
+
+    Each result scores weights.claimed if the brand is claimed, weights.name
+    if its name matches exactly (ignoring case and punctuation), and up to
+    weights.domain for how closely its domain resembles the name. Ties keep
+    the API's order. Returns copies of the results with a "score" added.
+    """
+    query = _name_key(name)
+    ranked = []
+    for result in results:
+        score = 0.0
+        if result.get("claimed"):
+            score += weights.claimed
+        if query and _name_key(str(result.get("name") or "")) == query:
+            score += weights.name
+        domain = str(result.get("domain") or "").lower()
+        if domain.startswith("www."):
+            domain = domain[4:]
+        label = _name_key(domain.split(".")[0])
+        if query and label:
+            similarity = difflib.SequenceMatcher(None, query, label).ratio()
+            score += weights.domain * similarity
+        ranked.append(dict(result, score=round(score, 4)))
+    ranked.sort(key=lambda result: -result["score"])
+    return ranked
 
 
 @dataclass
@@ -35,11 +2461,191 @@ class BrandfetchContext:
     api_key: str
     client_id: str
     base_url: str
-    http_client: httpx.AsyncClient
+    http_client: Optional[httpx.AsyncClient] = None
+    cache: ResponseCache = field(default_factory=ResponseCache)
+    brand_cache_ttl: float = DEFAULT_BRAND_CACHE_TTL
+    search_cache_ttl: float = DEFAULT_SEARCH_CACHE_TTL
+    negative_cache_ttl: float = DEFAULT_NEGATIVE_CACHE_TTL
+    projections: ProjectionTracker = field(default_factory=ProjectionTracker)
+    batch_concurrency: int = DEFAULT_BATCH_CONCURRENCY
+    inflight: SingleFlight = field(default_factory=SingleFlight)
+    disk_cache: Optional[DiskCache] = None
+    stale_window: float = DEFAULT_STALE_WINDOW
+    refresher: BackgroundRefresher = field(default_factory=BackgroundRefresher)
+    rate_limiters: Dict[str, TokenBucket] = field(
+        default_factory=lambda: {"search": TokenBucket(), "brand": TokenBucket()}
+    )
+    max_retries: int = DEFAULT_MAX_RETRIES
+    retry_base_delay: float = DEFAULT_RETRY_BASE_DELAY
+    retry_max_delay: float = DEFAULT_RETRY_MAX_DELAY
+    attempt_timeout: float = DEFAULT_ATTEMPT_TIMEOUT
+    call_deadline: float = DEFAULT_CALL_DEADLINE
+    hedging: HedgePolicy = field(default_factory=HedgePolicy)
+    scheduler: RequestScheduler = field(default_factory=RequestScheduler)
+    metrics: ServerMetrics = field(default_factory=ServerMetrics)
+    ranking_weights: RankingWeights = field(default_factory=RankingWeights)
+    search_index: SearchIndex = field(default_factory=SearchIndex)
+    search_index_min_score: float = DEFAULT_SEARCH_INDEX_MIN_SCORE
+    color_index: ColorIndex = field(default_factory=ColorIndex)
+    aliases: AliasIndex = field(default_factory=AliasIndex)
+    asset_store: Optional[AssetStore] = None
+    asset_concurrency: int = DEFAULT_ASSET_CONCURRENCY
+    enrich_dir: Optional[str] = None
+    client_factory: Optional[Callable[[], httpx.AsyncClient]] = None
+    raw_passthrough: bool = False
+    
+    def get_http_client(self) -> httpx.AsyncClient:
+        """Return the HTTP client, creating it through client_factory on first use."""
+        if self.http_client is None:
+            if self.client_factory is None:
+                raise ValueError("HTTP client is not configured")
+            self.http_client = self.client_factory()
+        return self.http_client
+
+
+# The context shared by all sessions of this process (see brandfetch_lifespan),
+# also used by routes served outside an MCP session
+_active_context: Optional[BrandfetchContext] = None
+_context_users = 0
+_context_stack: Optional[AsyncExitStack] = None
+_context_lock: Optional[asyncio.Lock] = None
+
+# Monotonic time by which the upstream requests of the current interactive
+# tool call must finish (see with_call_deadline)
+_call_deadline: ContextVar[Optional[float]] = ContextVar(
+    "brandfetch_call_deadline", default=None
+)
+
+# Priority class and session of the upstream requests made by the current
+# tool call or background task (see request_priority)
+_request_class: ContextVar[RequestClass] = ContextVar(
+    "brandfetch_request_class", default=RequestClass()
+)
+
+
+def create_http_client(metrics: Optional[ServerMetrics] = None) -> httpx.AsyncClient:
+    """
+    Create the shared HTTP client from environment configuration.
+
+    Pool size, keep-alive expiry, HTTP/2 and the connect/read/write/pool
+    timeouts can all be tuned through BRANDFETCH_* environment variables.
+    The client carries no Authorization header: the brand endpoint sends the
+    bearer token per request, while the search endpoint must not receive it.
+    When metrics are given, the time each request waits for a pooled
+    connection is recorded.
+    """
+    limits = httpx.Limits(
+        max_connections=_env_int("BRANDFETCH_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS),
+        max_keepalive_connections=_env_int(
+            "BRANDFETCH_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+        ),
+        keepalive_expiry=_env_float(
+            "BRANDFETCH_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY
+        ),
+    )
+    timeout = httpx.Timeout(
+        connect=_env_float("BRANDFETCH_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+        read=_env_float("BRANDFETCH_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+        write=_env_float("BRANDFETCH_WRITE_TIMEOUT", DEFAULT_WRITE_TIMEOUT),
+        pool=_env_float("BRANDFETCH_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT),
+    )
+    
+    http2 = _env_bool("BRANDFETCH_HTTP2", False)
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning(
+            "BRANDFETCH_HTTP2 is set but the h2 package is not installed; "
+            "falling back to HTTP/1.1 (install with: pip install 'httpx[http2]')"
+        )
+        http2 = False
+    
+    logger.info(
+        "HTTP client pool: %s connections, %s keep-alive, HTTP/2 %s",
+        limits.max_connections,
+        limits.max_keepalive_connections,
+        "on" if http2 else "off",
+    )
+    event_hooks = {"request": [_pool_wait_hook(metrics)]} if metrics else None
+    return httpx.AsyncClient(
+        headers={"Content-Type": "application/json"},
+        timeout=timeout,
+        limits=limits,
+        http2=http2,
+        event_hooks=event_hooks,
+    )
+
+
+def _pool_wait_hook(
+    metrics: ServerMetrics,
+) -> Callable[[httpx.Request], Awaitable[None]]:
+    """Build a request hook that records how long requests wait for a connection."""
+    async def on_request(request: httpx.Request) -> None:
+        queued_at = time.perf_counter()
+        
+        # The first connection event marks the end of the wait for the pool
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            nonlocal queued_at
+            if queued_at is not None and event_name.endswith(".started"):
+                metrics.observe("pool_wait_seconds", time.perf_counter() - queued_at)
+                queued_at = None
+        
+        request.extensions["trace"] = trace
+    
+    return on_request
+
+
+async def warm_up_connections(
+    http_client: httpx.AsyncClient, base_url: str, connections: int
+) -> None:
+    """
+    Open connections to the API ahead of the first tool call.
+
+    Completes DNS resolution and the TLS handshake for up to `connections`
+    pooled connections so they can be reused by later requests. Failures are
+    logged and ignored, since the first real request will simply connect.
+    """
+    if connections <= 0:
+        return
+    results = await asyncio.gather(
+        *(http_client.head(base_url) for _ in range(connections)),
+        return_exceptions=True,
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning("Connection warm-up failed: %s", failures[0])
+    else:
+        logger.info("Warmed up %d connection(s) to %s", connections, base_url)
+
+
+async def keep_brands_warm(
+    brandfetch: BrandfetchContext, identifiers: List[str], interval: float
+) -> None:
+    """
+    Keep the full documents of a hot list of brands fresh in the cache.
+
+    Every interval seconds, each brand whose cached document is missing or
+    would expire before the next pass is refetched in the background, so
+    lookups of these brands never wait on the network.
+    """
+    while True:
+        for identifier in identifiers:
+            identifier = brandfetch.aliases.resolve(identifier)
+            cache_key = brand_cache_key(identifier)
+            expires_in = brandfetch.cache.expires_in(cache_key)
+            if expires_in is not None and expires_in > interval:
+                continue
+            # Wait for a free slot rather than dropping hot-list refreshes
+            refresher = brandfetch.refresher
+            while refresher and len(refresher) >= refresher.max_concurrent:
+                await refresher.wait()
+            refresher.schedule(
+                cache_key,
+                functools.partial(refresh_brand_info, brandfetch, identifier, None),
+            )
+        await asyncio.sleep(interval)
 
 
 @asynccontextmanager
-async def brandfetch_lifespan(server: FastMCP) -> AsyncIterator[BrandfetchContext]:
+async def open_brandfetch_context() -> AsyncIterator[BrandfetchContext]:
     """Initialize and clean up Brandfetch API resources."""
     logger.info("Initializing Brandfetch lifespan...")
     
@@ -59,30 +2665,241 @@ async def brandfetch_lifespan(server: FastMCP) -> AsyncIterator[BrandfetchContex
     
     # Set base URL
     base_url = os.environ.get("BRANDFETCH_API_URL", "https://api.brandfetch.io")
-    logger.info(f"Using Brandfetch API URL: {base_url}")
+    logger.info("Using Brandfetch API URL: %s", base_url)
+    
+    metrics = ServerMetrics()
+    # Open connections in the background so the first request doesn't wait
+    # for the TLS handshake
+    warmup_connections = _env_int(
+        "BRANDFETCH_WARMUP_CONNECTIONS", DEFAULT_WARMUP_CONNECTIONS
+    )
+    warmup_tasks: List[asyncio.Task] = []
+    
+    def open_http_client(connections: int) -> httpx.AsyncClient:
+        http_client = create_http_client(metrics)
+        logger.info("HTTP client created")
+        warmup_tasks.append(asyncio.create_task(
+            warm_up_connections(http_client, base_url, connections)
+        ))
+        return http_client
+    
+    # Creating the client loads the TLS and connection pool modules, so by
+    # default that waits for the first request that reaches the API. The
+    # warm-up then runs alongside that request, for the ones that follow.
+    http_client = None
+    client_factory = None
+    if _env_bool("BRANDFETCH_LAZY_INIT", True):
+        client_factory = functools.partial(open_http_client, warmup_connections)
+    else:
+        http_client = open_http_client(warmup_connections)
+    
+    # Create the response cache
+    cache = ResponseCache(
+        max_entries=_env_int("BRANDFETCH_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES),
+        max_bytes=_env_int("BRANDFETCH_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES),
+    )
+    brand_cache_ttl = _env_float("BRANDFETCH_BRAND_CACHE_TTL", DEFAULT_BRAND_CACHE_TTL)
+    search_cache_ttl = _env_float(
+        "BRANDFETCH_SEARCH_CACHE_TTL", DEFAULT_SEARCH_CACHE_TTL
+    )
+    negative_cache_ttl = _env_float(
+        "BRANDFETCH_NEGATIVE_CACHE_TTL", DEFAULT_NEGATIVE_CACHE_TTL
+    )
+    logger.info("Response cache enabled with up to %d entries", cache.max_entries)
+    disk_cache = None
+    disk_cache_path = os.environ.get("BRANDFETCH_CACHE_PATH")
+    if disk_cache_path:
+        disk_cache = DiskCache(
+            disk_cache_path,
+            max_bytes=_env_int(
+                "BRANDFETCH_DISK_CACHE_MAX_BYTES", DEFAULT_DISK_CACHE_MAX_BYTES
+            ),
+        )
+        logger.info("Persistent cache enabled at %s", disk_cache_path)
+    batch_concurrency = _env_int(
+        "BRANDFETCH_BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY
+    )
+    projections = ProjectionTracker(
+        threshold=_env_int(
+            "BRANDFETCH_FULL_FETCH_THRESHOLD", DEFAULT_FULL_FETCH_THRESHOLD
+        ),
+        window=_env_float("BRANDFETCH_FULL_FETCH_WINDOW", DEFAULT_FULL_FETCH_WINDOW),
+    )
+    
+    stale_window = _env_float("BRANDFETCH_STALE_WINDOW", DEFAULT_STALE_WINDOW)
+    refresher = BackgroundRefresher(
+        max_concurrent=_env_int(
+            "BRANDFETCH_MAX_BACKGROUND_REFRESHES", DEFAULT_MAX_BACKGROUND_REFRESHES
+        ),
+    )
+    hot_identifiers = [
+        identifier.strip()
+        for identifier in os.environ.get("BRANDFETCH_HOT_IDENTIFIERS", "").split(",")
+        if identifier.strip()
+    ]
+    hot_refresh_interval = _env_float(
+        "BRANDFETCH_HOT_REFRESH_INTERVAL", DEFAULT_HOT_REFRESH_INTERVAL
+    )
+    
+    # The search and brand endpoints authenticate differently and have
+    # separate quotas, so each gets its own rate limit, optionally shared
+    # with the other server processes on this host
+    rate_limit_path = os.environ.get("BRANDFETCH_RATE_LIMIT_PATH")
+    rate_limiters: Dict[str, TokenBucket] = {}
+    for endpoint in ("search", "brand"):
+        rate = _env_float(f"BRANDFETCH_{endpoint.upper()}_RATE_LIMIT", 0.0)
+        # Unset means a burst of one second's worth of requests
+        burst_setting = f"BRANDFETCH_{endpoint.upper()}_BURST"
+        burst = None
+        if os.environ.get(burst_setting, "").strip():
+            burst = _env_int(burst_setting, 0)
+            if burst < 1:
+                raise ValueError(f"{burst_setting} must be at least 1")
+        if rate_limit_path:
+            rate_limiters[endpoint] = SharedTokenBucket(
+                rate_limit_path, endpoint, rate, burst
+            )
+        else:
+            rate_limiters[endpoint] = TokenBucket(rate, burst)
+    if rate_limit_path:
+        logger.info("Sharing rate limits through %s", rate_limit_path)
     
-    # Create HTTP client
-    http_client = httpx.AsyncClient(
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        },
-        timeout=30.0,  # Generous timeout for API operations
+    brandfetch = BrandfetchContext(
+        api_key=api_key,
+        client_id=client_id,
+        base_url=base_url,
+        http_client=http_client,
+        client_factory=client_factory,
+        cache=cache,
+        brand_cache_ttl=brand_cache_ttl,
+        search_cache_ttl=search_cache_ttl,
+        negative_cache_ttl=negative_cache_ttl,
+        projections=projections,
+        batch_concurrency=batch_concurrency,
+        disk_cache=disk_cache,
+        stale_window=stale_window,
+        refresher=refresher,
+        rate_limiters=rate_limiters,
+        max_retries=_env_int("BRANDFETCH_MAX_RETRIES", DEFAULT_MAX_RETRIES),
+        retry_base_delay=_env_float(
+            "BRANDFETCH_RETRY_BASE_DELAY", DEFAULT_RETRY_BASE_DELAY
+        ),
+        retry_max_delay=_env_float(
+            "BRANDFETCH_RETRY_MAX_DELAY", DEFAULT_RETRY_MAX_DELAY
+        ),
+        attempt_timeout=_env_float(
+            "BRANDFETCH_ATTEMPT_TIMEOUT", DEFAULT_ATTEMPT_TIMEOUT
+        ),
+        call_deadline=_env_float("BRANDFETCH_CALL_DEADLINE", DEFAULT_CALL_DEADLINE),
+        hedging=HedgePolicy(
+            quantile=_env_float("BRANDFETCH_HEDGE_QUANTILE", DEFAULT_HEDGE_QUANTILE),
+            min_delay=_env_float("BRANDFETCH_HEDGE_MIN_DELAY", DEFAULT_HEDGE_MIN_DELAY),
+            budget=_env_float("BRANDFETCH_HEDGE_BUDGET", DEFAULT_HEDGE_BUDGET),
+        ),
+        scheduler=RequestScheduler(
+            max_concurrent=_env_int(
+                "BRANDFETCH_UPSTREAM_CONCURRENCY", DEFAULT_UPSTREAM_CONCURRENCY
+            ),
+            bulk_share=_env_float("BRANDFETCH_BULK_SHARE", DEFAULT_BULK_SHARE),
+        ),
+        metrics=metrics,
+        ranking_weights=RankingWeights(
+            claimed=_env_float(
+                "BRANDFETCH_RANK_CLAIMED_WEIGHT", DEFAULT_RANK_CLAIMED_WEIGHT
+            ),
+            name=_env_float("BRANDFETCH_RANK_NAME_WEIGHT", DEFAULT_RANK_NAME_WEIGHT),
+            domain=_env_float(
+                "BRANDFETCH_RANK_DOMAIN_WEIGHT", DEFAULT_RANK_DOMAIN_WEIGHT
+            ),
+        ),
+        search_index=SearchIndex(
+            _env_int(
+                "BRANDFETCH_SEARCH_INDEX_MAX_ENTRIES", DEFAULT_SEARCH_INDEX_MAX_ENTRIES
+            )
+        ),
+        search_index_min_score=_env_float(
+            "BRANDFETCH_SEARCH_INDEX_MIN_SCORE", DEFAULT_SEARCH_INDEX_MIN_SCORE
+        ),
+        color_index=ColorIndex(
+            _env_int(
+                "BRANDFETCH_COLOR_INDEX_MAX_ENTRIES", DEFAULT_COLOR_INDEX_MAX_ENTRIES
+            )
+        ),
+        aliases=AliasIndex(
+            _env_int("BRANDFETCH_ALIAS_MAX_ENTRIES", DEFAULT_ALIAS_MAX_ENTRIES)
+        ),
+        asset_store=AssetStore(
+            os.environ.get("BRANDFETCH_ASSET_DIR") or DEFAULT_ASSET_DIR,
+            max_bytes=_env_int("BRANDFETCH_ASSET_MAX_BYTES", DEFAULT_ASSET_MAX_BYTES),
+            max_total_bytes=_env_int(
+                "BRANDFETCH_ASSET_STORE_MAX_BYTES", DEFAULT_ASSET_STORE_MAX_BYTES
+            ),
+        ),
+        asset_concurrency=_env_int(
+            "BRANDFETCH_ASSET_CONCURRENCY", DEFAULT_ASSET_CONCURRENCY
+        ),
+        enrich_dir=os.environ.get("BRANDFETCH_ENRICH_DIR") or DEFAULT_ENRICH_DIR,
+        raw_passthrough=_env_bool("BRANDFETCH_RAW_PASSTHROUGH", False),
     )
-    logger.info("HTTP client created")
+    
+    # Keep the configured hot list of brands warm
+    hot_task = None
+    if hot_identifiers:
+        logger.info("Keeping %d hot brands warm", len(hot_identifiers))
+        hot_task = asyncio.create_task(
+            keep_brands_warm(brandfetch, hot_identifiers, hot_refresh_interval)
+        )
     
     try:
         logger.info("Brandfetch lifespan initialization complete")
-        yield BrandfetchContext(
-            api_key=api_key,
-            client_id=client_id,
-            base_url=base_url,
-            http_client=http_client,
-        )
+        yield brandfetch
     finally:
         # Clean up resources
         logger.info("Cleaning up HTTP client")
-        await http_client.aclose()
+        if hot_task is not None:
+            hot_task.cancel()
+        refresher.close()
+        for warmup_task in warmup_tasks:
+            warmup_task.cancel()
+        if brandfetch.http_client is not None:
+            await brandfetch.http_client.aclose()
+        if disk_cache is not None:
+            disk_cache.close()
+        for limiter in rate_limiters.values():
+            if isinstance(limiter, SharedTokenBucket):
+                limiter.close()
+
+
+@asynccontextmanager
+async def brandfetch_lifespan(server: FastMCP) -> AsyncIterator[BrandfetchContext]:
+    """
+    Share one Brandfetch context between all sessions of this process.
+
+    FastMCP enters the lifespan once per session, and once per request in
+    stateless HTTP mode. The first user opens the context and the last one
+    closes it, so the HTTP client, caches and rate limits are shared.
+    """
+    global _active_context, _context_users, _context_stack, _context_lock
+    if _context_lock is None:
+        _context_lock = asyncio.Lock()
+    lock = _context_lock
+    async with lock:
+        if _active_context is None:
+            stack = AsyncExitStack()
+            _active_context = await stack.enter_async_context(open_brandfetch_context())
+            _context_stack = stack
+        _context_users += 1
+        brandfetch = _active_context
+    try:
+        yield brandfetch
+    finally:
+        async with lock:
+            _context_users -= 1
+            if _context_users == 0:
+                stack, _context_stack = _context_stack, None
+                _active_context = None
+                _context_lock = None
+                await stack.aclose()
 
 
 # Create the MCP server with our lifespan
@@ -97,8 +2914,6 @@ mcp = FastMCP(
 # Helper function to access Brandfetch context
 def get_brandfetch_context(ctx: Context) -> BrandfetchContext:
     """Get the Brandfetch context from the request context."""
-    logger.info("Retrieving Brandfetch context")
-    
     if not ctx:
         logger.error("Context is None")
         raise ValueError("Context is None")
@@ -111,25 +2926,858 @@ def get_brandfetch_context(ctx: Context) -> BrandfetchContext:
         logger.error("lifespan_context not found in request_context")
         raise ValueError("lifespan_context not found in request_context")
     
-    logger.info("Successfully retrieved Brandfetch context")
-    return ctx.request_context.lifespan_context
+    return ctx.request_context.lifespan_context
+
+
+def instrument_tool(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+    Record the latency and outcome of every call to a tool.
+
+    Apply below @mcp.tool so the tool keeps its signature and docstring.
+    """
+    tool_name = fn.__name__
+    
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        ctx = kwargs.get("ctx", args[0] if args else None)
+        metrics = get_brandfetch_context(ctx).metrics
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await fn(*args, **kwargs)
+            outcome = "success"
+            return result
+        finally:
+            metrics.observe(
+                "tool_call_seconds", time.perf_counter() - start, tool=tool_name
+            )
+            metrics.increment("tool_calls_total", tool=tool_name, outcome=outcome)
+    
+    return wrapper
+
+
+def with_call_deadline(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+    Bound the upstream requests of an interactive tool call by the call deadline.
+
+    Apply below @instrument_tool. Attempts and retries are cut short so the
+    call's upstream requests end by the deadline, and requests that would
+    start after it fail instead.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        ctx = kwargs.get("ctx", args[0] if args else None)
+        seconds = get_brandfetch_context(ctx).call_deadline
+        if seconds <= 0:
+            return await fn(*args, **kwargs)
+        token = _call_deadline.set(time.monotonic() + seconds)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _call_deadline.reset(token)
+    
+    return wrapper
+
+
+def request_priority(
+    priority: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    Send the upstream requests of a tool at the given priority class.
+
+    Apply below @instrument_tool. Requests are queued under the calling MCP
+    session, so sessions share the upstream budget fairly.
+    """
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            ctx = kwargs.get("ctx", args[0] if args else None)
+            session = getattr(getattr(ctx, "request_context", None), "session", None)
+            token = _request_class.set(
+                RequestClass(priority, id(session) if session is not None else None)
+            )
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _request_class.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def set_request_priority(priority: str, session: Hashable = None) -> None:
+    """Send the upstream requests of the current task at the given priority class."""
+    _request_class.set(RequestClass(priority, session))
+
+
+def _deadline_allows(delay: float) -> bool:
+    """Return whether waiting delay seconds still ends before the call deadline."""
+    deadline = _call_deadline.get()
+    return deadline is None or time.monotonic() + delay < deadline
+
+
+async def collect_server_stats(brandfetch: BrandfetchContext) -> Dict[str, Any]:
+    """Gather metrics and cache, coalescing, refresh and rate limit counters."""
+    stats = brandfetch.metrics.snapshot()
+    cache = brandfetch.cache.stats()
+    lookups = cache["hits"] + cache["misses"]
+    cache["hit_ratio"] = round(cache["hits"] / lookups, 4) if lookups else 0.0
+    stats["cache"] = cache
+    if brandfetch.disk_cache is not None:
+        disk = await asyncio.to_thread(brandfetch.disk_cache.stats)
+        lookups = disk["hits"] + disk["misses"]
+        disk["hit_ratio"] = round(disk["hits"] / lookups, 4) if lookups else 0.0
+        stats["disk_cache"] = disk
+    stats["search_index"] = brandfetch.search_index.stats()
+    stats["color_index"] = brandfetch.color_index.stats()
+    stats["aliases"] = brandfetch.aliases.stats()
+    stats["coalesced_requests"] = brandfetch.inflight.coalesced
+    stats["background_refresh"] = {
+        "running": len(brandfetch.refresher),
+        "scheduled": brandfetch.refresher.scheduled,
+        "dropped": brandfetch.refresher.dropped,
+        "failed": brandfetch.refresher.failed,
+    }
+    stats["rate_limits"] = {
+        endpoint: {"rate": limiter.rate, "throttled": limiter.throttled}
+        for endpoint, limiter in brandfetch.rate_limiters.items()
+    }
+    stats["hedging"] = brandfetch.hedging.stats()
+    stats["scheduler"] = brandfetch.scheduler.stats()
+    return stats
+
+
+async def render_server_stats(brandfetch: BrandfetchContext) -> str:
+    """Render server metrics and cache gauges in Prometheus text format."""
+    stats = await collect_server_stats(brandfetch)
+    gauges: Dict[str, float] = {
+        "uptime_seconds": stats["uptime_seconds"],
+        "coalesced_requests": stats["coalesced_requests"],
+    }
+    for cache_name in ("cache", "disk_cache", "search_index", "color_index", "aliases"):
+        for key, value in stats.get(cache_name, {}).items():
+            gauges[f"{cache_name}_{key}"] = value
+    for key, value in stats["background_refresh"].items():
+        gauges[f"background_refresh_{key}"] = value
+    for endpoint, limits in stats["rate_limits"].items():
+        gauges[f"{endpoint}_rate_limit_throttled"] = limits["throttled"]
+    scheduler = stats["scheduler"]
+    for priority in PRIORITIES:
+        gauges[f"scheduler_in_flight_{priority}"] = scheduler["in_flight"][priority]
+        gauges[f"scheduler_queued_{priority}"] = scheduler["queued"][priority]
+    return brandfetch.metrics.render_prometheus(gauges)
+
+
+def _index_brand_document(
+    brandfetch: BrandfetchContext, document: Dict[str, Any], identifier: str
+) -> None:
+    """Add a brand document to the local search and color indexes."""
+    brandfetch.search_index.add_brand_document(document)
+    brandfetch.color_index.add_brand_document(document, identifier)
+
+
+async def _disk_cache_get(
+    brandfetch: BrandfetchContext, keys: List[str]
+) -> Optional[Tuple[str, Any, float, bytes]]:
+    """Look keys up in the disk cache, treating errors as a miss."""
+    if brandfetch.disk_cache is None:
+        return None
+    try:
+        return await asyncio.to_thread(brandfetch.disk_cache.get_first, keys)
+    except sqlite3.Error as e:
+        logger.warning("Disk cache read failed: %s", e)
+        return None
+
+
+async def _disk_cache_set(
+    brandfetch: BrandfetchContext,
+    key: str,
+    value: Any,
+    ttl: float,
+    encoded: Optional[bytes] = None,
+    validators: Optional[Dict[str, str]] = None,
+) -> None:
+    """
+    Store a response in the disk cache, logging and ignoring errors.
+
+    encoded is the JSON of value when it is already at hand, such as the
+    body of the upstream response.
+    """
+    if brandfetch.disk_cache is None:
+        return
+    data = encoded
+    if data is None:
+        start = time.perf_counter()
+        data = json_dumps(value)
+        brandfetch.metrics.observe("encode_seconds", time.perf_counter() - start)
+    try:
+        await asyncio.to_thread(
+            brandfetch.disk_cache.set_encoded, key, data, ttl, validators
+        )
+    except sqlite3.Error as e:
+        logger.warning("Disk cache write failed: %s", e)
+
+
+async def _revalidation_entry(
+    brandfetch: BrandfetchContext, cache_key: str
+) -> Optional[Tuple[Any, bytes, Dict[str, str]]]:
+    """
+    Find an expired copy of a response that can be revalidated.
+
+    Returns (value, data, validators) from the in-memory cache or, failing
+    that, the disk cache, or None if neither holds validators for the key.
+    """
+    entry = brandfetch.cache.peek(cache_key)
+    if entry is not None and entry.validators:
+        data = entry.encoded if entry.encoded is not None else json_dumps(entry.value)
+        return entry.value, data, entry.validators
+    if brandfetch.disk_cache is None:
+        return None
+    try:
+        return await asyncio.to_thread(
+            brandfetch.disk_cache.get_revalidation, cache_key
+        )
+    except sqlite3.Error as e:
+        logger.warning("Disk cache read failed: %s", e)
+        return None
+
+
+async def _cache_not_found(brandfetch: BrandfetchContext, cache_key: str) -> None:
+    """Remember for a short while that the API answered a lookup with 404."""
+    key = missing_cache_key(cache_key)
+    brandfetch.cache.set(key, 404, brandfetch.negative_cache_ttl, len(key))
+    await _disk_cache_set(brandfetch, key, 404, brandfetch.negative_cache_ttl)
+
+
+async def send_request(
+    brandfetch: BrandfetchContext,
+    endpoint: str,
+    url: str,
+    params: Dict[str, Any],
+    headers: Dict[str, Any],
+) -> httpx.Response:
+    """
+    Send a GET request through the endpoint's rate limiter, retrying failures.
+
+    Rate-limited (429) and server error (5xx) responses and transport errors
+    are retried with jittered exponential backoff. A Retry-After header takes
+    precedence over the backoff delay. Every 429 also pauses all requests to
+    the endpoint until then (at most RATE_LIMIT_MAX_PAUSE), even when this
+    caller gives up. The last response is returned once retries run out or
+    the requested delay exceeds the maximum, so callers still see the final
+    status code. While the endpoint is paused for longer than the maximum
+    delay, a 429 is returned without sending anything.
+    
+    Each attempt waits its turn in the request scheduler, at the priority
+    class of the current tool call, is bounded by the attempt timeout and,
+    for interactive calls, may be hedged (see _send_attempt). Within an
+    interactive tool call, no attempt or retry runs past the call deadline.
+    """
+    limiter = brandfetch.rate_limiters[endpoint]
+    metrics = brandfetch.metrics
+    request = _request_class.get()
+    attempt = 0
+    while True:
+        paused = limiter.paused_for()
+        if paused > brandfetch.retry_max_delay or not _deadline_allows(paused):
+            # The API would refuse the request, so answer for it
+            metrics.increment("upstream_paused_total", endpoint=endpoint)
+            return httpx.Response(
+                429,
+                headers={"Retry-After": str(int(paused) + 1)},
+                request=httpx.Request("GET", url, params=params),
+            )
+        error: Optional[httpx.TransportError] = None
+        async with brandfetch.scheduler.slot(limiter, request) as waited:
+            priority = request.priority
+            metrics.observe("scheduler_wait_seconds", waited, priority=priority)
+            timeout = None
+            if brandfetch.attempt_timeout > 0:
+                timeout = brandfetch.attempt_timeout
+            deadline = _call_deadline.get()
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.increment(
+                        "upstream_deadline_exceeded_total", endpoint=endpoint
+                    )
+                    raise httpx.TimeoutException("Tool call deadline exceeded")
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                response = await _send_attempt(
+                    brandfetch, endpoint, url, params, headers, timeout,
+                    hedge=priority == PRIORITY_INTERACTIVE,
+                )
+            except httpx.TransportError as e:
+                error = e
+        
+        if error is not None:
+            metrics.increment(
+                "upstream_responses_total", endpoint=endpoint, status="transport_error"
+            )
+            delay = _backoff_delay(brandfetch, attempt)
+            if attempt >= brandfetch.max_retries or not _deadline_allows(delay):
+                raise error
+            logger.warning(
+                "Request to %s endpoint failed (%s), retrying in %.2fs",
+                endpoint,
+                error,
+                delay,
+                extra={"endpoint": endpoint, "attempt": attempt},
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+            metrics.increment("upstream_retries_total", endpoint=endpoint)
+            continue
+        
+        metrics.increment(
+            "upstream_responses_total",
+            endpoint=endpoint,
+            status=str(response.status_code),
+        )
+        if response.status_code not in RETRYABLE_STATUS_CODES:
+            await limiter.record_success()
+            return response
+        
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = _backoff_delay(brandfetch, attempt)
+        if response.status_code == 429:
+            # The limiter holds back every caller, whether or not this one retries
+            await limiter.pause(min(delay, RATE_LIMIT_MAX_PAUSE))
+        if (
+            attempt >= brandfetch.max_retries
+            or delay > brandfetch.retry_max_delay
+            or not _deadline_allows(delay)
+        ):
+            return response
+        logger.warning(
+            "HTTP %d from %s endpoint, retrying in %.2fs",
+            response.status_code,
+            endpoint,
+            delay,
+            extra={
+                "endpoint": endpoint,
+                "status": response.status_code,
+                "attempt": attempt,
+            },
+        )
+        if response.status_code != 429:
+            # After a 429 the paused limiter makes this caller wait too
+            await asyncio.sleep(delay)
+        attempt += 1
+        metrics.increment("upstream_retries_total", endpoint=endpoint)
+
+
+async def _send_attempt(
+    brandfetch: BrandfetchContext,
+    endpoint: str,
+    url: str,
+    params: Dict[str, Any],
+    headers: Dict[str, Any],
+    timeout: Optional[float],
+    hedge: bool = True,
+) -> httpx.Response:
+    """
+    Send one attempt of a request, hedged with a duplicate if it is slow.
+
+    Each request is abandoned with httpx.TimeoutException after timeout
+    seconds. When the hedge policy gives a delay and the request hasn't
+    answered by then, a duplicate is sent if the hedge budget and the rate
+    limit allow it right away; the first response wins and the other request
+    is cancelled. An error from one request waits for the other. With
+    hedge False, the request is never hedged.
+    """
+    http_client = brandfetch.get_http_client()
+    metrics = brandfetch.metrics
+    hedging = brandfetch.hedging
+    
+    async def request() -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                http_client.get(url, params=params, headers=headers), timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.observe(
+                "upstream_request_seconds",
+                time.perf_counter() - start,
+                endpoint=endpoint,
+            )
+            raise httpx.TimeoutException(f"No response within {timeout:.1f}s") from None
+        except httpx.TransportError:
+            metrics.observe(
+                "upstream_request_seconds",
+                time.perf_counter() - start,
+                endpoint=endpoint,
+            )
+            raise
+        metrics.observe(
+            "upstream_request_seconds", time.perf_counter() - start, endpoint=endpoint
+        )
+        return response
+    
+    if not hedge:
+        return await request()
+    hedge_delay = hedging.delay(
+        metrics.histogram("upstream_request_seconds", endpoint=endpoint)
+    )
+    if hedge_delay is None or (timeout is not None and hedge_delay >= timeout):
+        return await request()
+    
+    tasks = [asyncio.ensure_future(request())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if done or not hedging.can_hedge():
+            return await tasks[0]
+        if not await brandfetch.rate_limiters[endpoint].try_acquire():
+            return await tasks[0]
+        hedging.record_hedge()
+        metrics.increment("upstream_hedges_total", endpoint=endpoint)
+        logger.debug("Hedging %s request after %.3fs", endpoint, hedge_delay)
+        tasks.append(asyncio.ensure_future(request()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    if task is tasks[1]:
+                        hedging.wins += 1
+                        metrics.increment(
+                            "upstream_hedge_wins_total", endpoint=endpoint
+                        )
+                    return task.result()
+        assert error is not None
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # Mark the loser's error as retrieved
+
+
+def _backoff_delay(brandfetch: BrandfetchContext, attempt: int) -> float:
+    """Return a full-jitter exponential backoff delay for a retry attempt."""
+    ceiling = min(
+        brandfetch.retry_max_delay, brandfetch.retry_base_delay * 2 ** attempt
+    )
+    return random.uniform(0, ceiling)
+
+
+def _log_http_error(operation: str, response: httpx.Response) -> None:
+    """Log an HTTP error response without its full body."""
+    logger.error(
+        "HTTP error during %s: %d",
+        operation,
+        response.status_code,
+        extra={"status": response.status_code, "url": str(response.url)},
+    )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response body (truncated): %.200s", response.text)
+
+
+async def fetch_brand_info(
+    brandfetch: BrandfetchContext,
+    identifier: str,
+    fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch a brand document, answering from the cache where possible.
+
+    A cached document holding a superset of the requested fields is projected
+    locally instead of calling the API. When several narrow projections of the
+    same brand miss the cache in quick succession, the full document is
+    fetched once so later projections can be answered from it. Concurrent
+    identical lookups share a single upstream request.
+    
+    The identifier is canonicalized and resolved through learned aliases
+    first, so every identifier of a brand shares its cache entries.
+    """
+    identifier = brandfetch.aliases.resolve(identifier)
+    candidates = brand_cache_candidates(brandfetch.cache, identifier, fields)
+    cached = brandfetch.cache.get_first(candidates)
+    if cached is None:
+        cached = brandfetch.cache.get_stale_first(candidates)
+        if cached is not None:
+            stale_key = cached[0]
+            stale_fields = brand_cache_key_fields(stale_key)
+            logger.debug("Serving stale brand info for %s while refreshing", identifier)
+            brandfetch.refresher.schedule(
+                stale_key,
+                functools.partial(
+                    refresh_brand_info, brandfetch, identifier, stale_fields
+                ),
+            )
+    if cached is not None:
+        cached_key, document = cached
+        logger.debug("Cache hit for brand info: %s", identifier)
+        if fields and cached_key != brand_cache_key(identifier, fields):
+            return project_fields(document, fields)
+        return document
+    
+    if missing_cache_key(brand_cache_key(identifier)) in brandfetch.cache:
+        logger.debug("Cached not-found answer for brand info: %s", identifier)
+        raise ValueError("Failed to get brand info: HTTP 404")
+    
+    fetch_fields = fields
+    if fields and brandfetch.projections.should_fetch_full(
+        normalize_identifier(identifier)
+    ):
+        logger.debug("Fetching full brand document for %s", identifier)
+        fetch_fields = None
+    
+    result = await brandfetch.inflight.do(
+        brand_cache_key(identifier, fetch_fields),
+        lambda: _load_brand_info(brandfetch, identifier, fetch_fields),
+    )
+    if fields and fetch_fields is None:
+        return project_fields(result, fields)
+    return result
+
+
+async def fetch_brand_info_json(
+    brandfetch: BrandfetchContext,
+    identifier: str,
+    fields: Optional[List[str]] = None,
+) -> str:
+    """
+    Fetch a brand document as JSON text.
+
+    When the document is served unchanged from the cache, the JSON it was
+    decoded from (the upstream response body or the disk cache entry) is
+    returned as is; only documents projected locally are encoded again.
+    """
+    document = await fetch_brand_info(brandfetch, identifier, fields)
+    # Resolved after the fetch, which may have learned the brand's primary ID
+    cache_key = brand_cache_key(brandfetch.aliases.resolve(identifier), fields)
+    encoded = brandfetch.cache.get_encoded(cache_key, document)
+    if encoded is None:
+        start = time.perf_counter()
+        encoded = json_dumps(document)
+        brandfetch.metrics.observe("encode_seconds", time.perf_counter() - start)
+    return encoded.decode()
+
+
+async def refresh_brand_info(
+    brandfetch: BrandfetchContext,
+    identifier: str,
+    fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Reload a brand document into the cache, bypassing cached entries."""
+    # Refreshes run in the background as bulk work, outside the deadline of
+    # the tool call that scheduled them
+    _call_deadline.set(None)
+    set_request_priority(PRIORITY_BULK)
+    return await brandfetch.inflight.do(
+        brand_cache_key(identifier, fields),
+        lambda: _load_brand_info(brandfetch, identifier, fields),
+    )
+
+
+async def _load_brand_info(
+    brandfetch: BrandfetchContext,
+    identifier: str,
+    fields: Optional[List[str]],
+    follow_alias: bool = True,
+) -> Dict[str, Any]:
+    """Load a brand document from the disk cache, or from the API on a miss."""
+    cache_key = brand_cache_key(identifier, fields)
+    full_key = brand_cache_key(identifier)
+    keys = [cache_key] if cache_key == full_key else [cache_key, full_key]
+    # Aliases learned by other server processes are stored on disk as well,
+    # and so are identifiers the API didn't know
+    if follow_alias:
+        keys.append(alias_cache_key(identifier))
+    missing_key = missing_cache_key(full_key)
+    keys.append(missing_key)
+    stored = await _disk_cache_get(brandfetch, keys)
+    if stored is not None and stored[0].startswith("alias:"):
+        primary = stored[1]
+        brandfetch.aliases.add(identifier, primary)
+        return await _load_brand_info(brandfetch, primary, fields, follow_alias=False)
+    if stored is not None and stored[0] == missing_key:
+        brandfetch.cache.set(
+            missing_key, 404, stored[2] - time.time(), len(missing_key)
+        )
+        raise ValueError("Failed to get brand info: HTTP 404")
+    if stored is not None:
+        stored_key, document, expires_at, data = stored
+        logger.debug("Disk cache hit for brand info: %s", identifier)
+        _index_brand_document(brandfetch, document, identifier)
+        brandfetch.cache.set(
+            stored_key,
+            document,
+            expires_at - time.time(),
+            len(data),
+            group=brand_cache_group(identifier),
+            stale_ttl=brandfetch.stale_window,
+            encoded=data,
+        )
+        if fields and stored_key != cache_key:
+            return project_fields(document, fields)
+        return document
+    return await _request_brand_info(brandfetch, identifier, fields)
+
+
+async def _request_brand_info(
+    brandfetch: BrandfetchContext,
+    identifier: str,
+    fields: Optional[List[str]],
+) -> Dict[str, Any]:
+    """Request a brand document from the API and cache it."""
+    # Build query parameters
+    params = {}
+    if fields:
+        params["fields"] = ",".join(fields)
+    
+    # The brand endpoint uses bearer token authentication
+    headers = {
+        "Authorization": f"Bearer {brandfetch.api_key}",
+        "Content-Type": "application/json",
+    }
+    # An expired copy is revalidated instead of downloaded again
+    previous = await _revalidation_entry(
+        brandfetch, brand_cache_key(identifier, fields)
+    )
+    if previous is not None:
+        headers.update(previous[2])
+    
+    try:
+        response = await send_request(
+            brandfetch,
+            "brand",
+            f"{brandfetch.base_url}/v2/brands/{identifier}",
+            params=params,
+            headers=headers,
+        )
+        if response.status_code == 304 and previous is not None:
+            logger.debug("Brand info for %s not modified", identifier)
+            return await _store_not_modified(
+                brandfetch, identifier, fields, previous, response
+            )
+        if response.status_code == 404:
+            await _cache_not_found(brandfetch, brand_cache_key(identifier))
+        response.raise_for_status()
+        
+        start = time.perf_counter()
+        result = json_loads(response.content)
+        brandfetch.metrics.observe(
+            "decode_seconds", time.perf_counter() - start, endpoint="brand"
+        )
+        logger.debug("Retrieved brand info for %s", identifier)
+        _index_brand_document(brandfetch, result, identifier)
+        # Cache under the brand's primary identifier, shared by all its aliases
+        primary = brandfetch.aliases.learn(identifier, result)
+        cache_key = brand_cache_key(primary, fields)
+        validators = conditional_headers(response)
+        brandfetch.cache.set(
+            cache_key,
+            result,
+            brandfetch.brand_cache_ttl,
+            len(response.content),
+            group=brand_cache_group(primary),
+            stale_ttl=brandfetch.stale_window,
+            encoded=response.content,
+            validators=validators,
+        )
+        await _disk_cache_set(
+            brandfetch,
+            cache_key,
+            result,
+            brandfetch.brand_cache_ttl,
+            response.content,
+            validators,
+        )
+        aliases = {normalize_identifier(identifier)}
+        if isinstance(result.get("domain"), str):
+            aliases.add(normalize_identifier(result["domain"]))
+        for alias in aliases:
+            if alias and alias != primary:
+                await _disk_cache_set(
+                    brandfetch,
+                    alias_cache_key(alias),
+                    primary,
+                    brandfetch.brand_cache_ttl,
+                )
+        return result
+    except httpx.HTTPStatusError as e:
+        _log_http_error("brand info retrieval", e.response)
+        raise ValueError(f"Failed to get brand info: HTTP {e.response.status_code}")
+    except Exception as e:
+        logger.error("Exception during brand info retrieval: %s", e)
+        raise ValueError(f"Failed to get brand info: {str(e)}")
+
+
+async def _store_not_modified(
+    brandfetch: BrandfetchContext,
+    identifier: str,
+    fields: Optional[List[str]],
+    previous: Tuple[Any, bytes, Dict[str, str]],
+    response: httpx.Response,
+) -> Dict[str, Any]:
+    """Renew the cached copy of a brand document the API reported unchanged."""
+    document, data, validators = previous
+    validators = {**validators, **conditional_headers(response)}
+    cache_key = brand_cache_key(identifier, fields)
+    _index_brand_document(brandfetch, document, identifier)
+    brandfetch.cache.set(
+        cache_key,
+        document,
+        brandfetch.brand_cache_ttl,
+        len(data),
+        group=brand_cache_group(identifier),
+        stale_ttl=brandfetch.stale_window,
+        encoded=data,
+        validators=validators,
+    )
+    await _disk_cache_set(
+        brandfetch, cache_key, document, brandfetch.brand_cache_ttl, data, validators
+    )
+    return document
+
+
+async def fetch_brand_search(
+    brandfetch: BrandfetchContext,
+    name: str,
+    client_id: Optional[str] = None,
+    force_upstream: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Search for brands by name, answering from the cache where possible.
+
+    On a cache miss, a confident match in the local search index answers
+    the search without calling the API, unless force_upstream is set.
+    Concurrent identical searches share a single upstream request.
+    """
+    # Use provided client_id or fall back to the one from environment
+    client_id_param = client_id or brandfetch.client_id
+    
+    cache_key = search_cache_key(name, client_id_param)
+    cached = brandfetch.cache.get(cache_key)
+    if cached is not None:
+        logger.debug("Cache hit for brand search: %s", name)
+        return cached
+    if missing_cache_key(cache_key) in brandfetch.cache:
+        logger.debug("Cached not-found answer for brand search: %s", name)
+        raise ValueError("Failed to search brands: HTTP 404")
+    
+    if not force_upstream and len(brandfetch.search_index):
+        matches = brandfetch.search_index.search(name)
+        if matches and matches[0][0] >= brandfetch.search_index_min_score:
+            brandfetch.search_index.hits += 1
+            logger.debug("Search index hit for brand search: %s", name)
+            return [dict(brand) for _, brand in matches]
+        brandfetch.search_index.misses += 1
+    
+    return await brandfetch.inflight.do(
+        cache_key, lambda: _load_brand_search(brandfetch, name, client_id_param)
+    )
+
+
+async def _load_brand_search(
+    brandfetch: BrandfetchContext,
+    name: str,
+    client_id: str,
+) -> List[Dict[str, Any]]:
+    """Load search results from the disk cache, or from the API on a miss."""
+    cache_key = search_cache_key(name, client_id)
+    missing_key = missing_cache_key(cache_key)
+    stored = await _disk_cache_get(brandfetch, [cache_key, missing_key])
+    if stored is not None and stored[0] == missing_key:
+        brandfetch.cache.set(
+            missing_key, 404, stored[2] - time.time(), len(missing_key)
+        )
+        raise ValueError("Failed to search brands: HTTP 404")
+    if stored is not None:
+        _, result, expires_at, data = stored
+        logger.debug("Disk cache hit for brand search: %s", name)
+        brandfetch.search_index.add_search_results(result)
+        brandfetch.aliases.learn_search_results(result)
+        brandfetch.cache.set(cache_key, result, expires_at - time.time(), len(data))
+        return result
+    return await _request_brand_search(brandfetch, name, client_id)
+
+
+async def _request_brand_search(
+    brandfetch: BrandfetchContext,
+    name: str,
+    client_id: str,
+) -> List[Dict[str, Any]]:
+    """Request brand search results from the API and cache them."""
+    try:
+        # The search endpoint doesn't use bearer token, it uses client_id as a query parameter
+        response = await send_request(
+            brandfetch,
+            "search",
+            f"{brandfetch.base_url}/v2/search/{name}",
+            params={"c": client_id},
+            headers={
+                # No bearer token for this endpoint; the client has no default one
+                "Content-Type": "application/json",
+            }
+        )
+        cache_key = search_cache_key(name, client_id)
+        if response.status_code == 404:
+            await _cache_not_found(brandfetch, cache_key)
+        response.raise_for_status()
+        
+        start = time.perf_counter()
+        result = json_loads(response.content)
+        brandfetch.metrics.observe(
+            "decode_seconds", time.perf_counter() - start, endpoint="search"
+        )
+        logger.debug("Found %d brands for %s", len(result), name)
+        brandfetch.search_index.add_search_results(result)
+        brandfetch.aliases.learn_search_results(result)
+        # Searches without results are kept only as long as a not-found answer
+        ttl = brandfetch.search_cache_ttl
+        if not result and brandfetch.negative_cache_ttl > 0:
+            ttl = min(ttl, brandfetch.negative_cache_ttl)
+        brandfetch.cache.set(cache_key, result, ttl, len(response.content))
+        await _disk_cache_set(brandfetch, cache_key, result, ttl, response.content)
+        return result
+    except httpx.HTTPStatusError as e:
+        _log_http_error("brand search", e.response)
+        raise ValueError(f"Failed to search brands: HTTP {e.response.status_code}")
+    except Exception as e:
+        logger.error("Exception during brand search: %s", e)
+        raise ValueError(f"Failed to search brands: {str(e)}")
 
 
 @mcp.tool(name="search_brands")
+@instrument_tool
+@request_priority(PRIORITY_INTERACTIVE)
+@with_call_deadline
 async def search_brands(
     ctx: Context,
     name: str,
     client_id: Optional[str] = None,
+    force_upstream: bool = False,
 ) -> List[Dict[str, Any]]:
     """
     Search for brands by name using the Brandfetch Search API.
     
+    Names of brands seen in earlier responses are matched locally first, so
+    repeat searches are answered without calling the API.
+    
     Args:
         name: The name of the company you are searching for.
-        client_id: Optional client ID for the API. If not provided, will use the one from environment.
+        client_id: Optional client ID for the API. If not provided, will use
+                   the one from environment.
+        force_upstream: Always ask the Search API instead of answering from
+                        brands seen earlier.
     
     Returns:
-        A list of matching brands with their icon, name, domain, claimed status, and brand ID.
+        A list of matching brands with their icon, name, domain, claimed
+        status, and brand ID.
         Example:
         [
             {
@@ -142,42 +3790,24 @@ async def search_brands(
         ]
     """
     brandfetch = get_brandfetch_context(ctx)
-    logger.info(f"Searching for brands with name: {name}")
-    
-    # Use provided client_id or fall back to the one from environment
-    client_id_param = client_id or brandfetch.client_id
-    
-    try:
-        # The search endpoint doesn't use bearer token, it uses client_id as a query parameter
-        response = await brandfetch.http_client.get(
-            f"{brandfetch.base_url}/v2/search/{name}",
-            params={"c": client_id_param},
-            headers={
-                # Remove the bearer token for this specific request
-                "Authorization": None,
-                "Content-Type": "application/json",
-            }
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        logger.info(f"Found {len(result)} brands")
-        return result
-    except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error during brand search: {e.response.status_code}")
-        logger.error(f"Response: {e.response.text}")
-        raise ValueError(f"Failed to search brands: HTTP {e.response.status_code}")
-    except Exception as e:
-        logger.error(f"Exception during brand search: {str(e)}")
-        raise ValueError(f"Failed to search brands: {str(e)}")
+    logger.debug("Searching for brands with name: %s", name)
+    return await fetch_brand_search(brandfetch, name, client_id, force_upstream)
 
 
 @mcp.tool(name="get_brand_info")
+@instrument_tool
+@request_priority(PRIORITY_INTERACTIVE)
+@with_call_deadline
 async def get_brand_info(
     ctx: Context,
     identifier: str,
     fields: Optional[List[str]] = None,
-) -> Dict[str, Any]:
+    compact: bool = False,
+    logo_themes: Optional[List[str]] = None,
+    logo_formats: Optional[List[str]] = None,
+    max_items: Optional[int] = None,
+    best_logo_only: bool = False,
+) -> Union[Dict[str, Any], str]:
     """
     Get detailed brand information by identifier using the Brandfetch Brand API.
     
@@ -189,6 +3819,17 @@ async def get_brand_info(
                     - Stock Symbol: NKE
         fields: Optional list of fields to include in the response.
                 If None, returns all fields.
+        compact: Return a slimmed document: null and empty values are dropped
+                 and lists are capped at max_items. The logo options below
+                 also imply compact mode.
+        logo_themes: Optional logo themes to keep, most preferred first
+                     (e.g. ["light", "dark"]).
+        logo_formats: Optional logo formats to keep, most preferred first
+                      (e.g. ["svg", "png"]).
+        max_items: Optional maximum length of any list in compact mode
+                   (default 10).
+        best_logo_only: Keep only the best matching logo, with a single
+                        format, for each logo type.
     
     Returns:
         Detailed brand information, optionally filtered by the 'fields' parameter.
@@ -199,37 +3840,755 @@ async def get_brand_info(
         - Fonts used by the brand
         - Social media links
         - Company information
+        With BRANDFETCH_RAW_PASSTHROUGH enabled, uncompacted documents are
+        returned as the JSON text received from the API.
     """
     brandfetch = get_brandfetch_context(ctx)
-    logger.info(f"Getting brand info for identifier: {identifier}")
+    logger.debug("Getting brand info for identifier: %s", identifier)
+    compact = compact or bool(
+        logo_themes or logo_formats or max_items is not None or best_logo_only
+    )
+    if brandfetch.raw_passthrough and not compact:
+        return await fetch_brand_info_json(brandfetch, identifier, fields)
+    document = await fetch_brand_info(brandfetch, identifier, fields)
+    if compact:
+        spec = compile_compact_spec(
+            tuple(logo_themes) if logo_themes else None,
+            tuple(logo_formats) if logo_formats else None,
+            DEFAULT_COMPACT_MAX_ITEMS if max_items is None else max_items,
+            best_logo_only,
+        )
+        document = compact_brand_document(document, spec)
+    return document
+
+
+@mcp.tool(name="resolve_brand")
+@instrument_tool
+@request_priority(PRIORITY_INTERACTIVE)
+@with_call_deadline
+async def resolve_brand(
+    ctx: Context,
+    name: str,
+    fields: Optional[List[str]] = None,
+    top_n: int = 1,
+    client_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Find a brand by name and get its brand information in one call.
     
-    # Build query parameters
-    params = {}
-    if fields:
-        params["fields"] = ",".join(fields)
+    Searches for the name, ranks the results (claimed brands, exact name
+    matches and domains resembling the name come first) and fetches the
+    brand information for the best match, saving a separate get_brand_info
+    call.
     
-    try:
-        # The brand endpoint uses bearer token authentication
-        response = await brandfetch.http_client.get(
-            f"{brandfetch.base_url}/v2/brands/{identifier}",
-            params=params,
-            headers={
-                "Authorization": f"Bearer {brandfetch.api_key}",
-                "Content-Type": "application/json",
+    Args:
+        name: The name of the company you are searching for.
+        fields: Optional list of fields to include in the brand information.
+                If None, returns all fields.
+        top_n: Number of best matches to fetch brand information for, in
+               parallel (default 1, maximum 10).
+        client_id: Optional client ID for the search API. If not provided,
+                   will use the one from environment.
+    
+    Returns:
+        The best match with its brand information, or a null match if the
+        search found nothing. With top_n above 1, the fetched candidates are
+        also listed, each with its brand information or error.
+        Example:
+        {
+            "query": "Nike",
+            "match": {"name": "Nike", "domain": "nike.com", "claimed": true,
+                      "brandId": "id_0dwKPKT", "score": 4.0},
+            "brand": {"name": "Nike", "logos": [...], ...}
+        }
+    """
+    brandfetch = get_brandfetch_context(ctx)
+    if not 1 <= top_n <= MAX_RESOLVE_CANDIDATES:
+        raise ValueError(f"top_n must be between 1 and {MAX_RESOLVE_CANDIDATES}")
+    
+    results = await fetch_brand_search(brandfetch, name, client_id)
+    ranked = rank_search_results(name, results, brandfetch.ranking_weights)
+    candidates = [
+        result for result in ranked if result.get("domain") or result.get("brandId")
+    ][:top_n]
+    if not candidates:
+        return {"query": name, "match": None, "brand": None}
+    
+    async def fetch_candidate(candidate: Dict[str, Any]) -> Dict[str, Any]:
+        identifier = candidate.get("domain") or candidate["brandId"]
+        try:
+            brand = await fetch_brand_info(brandfetch, identifier, fields)
+            return dict(candidate, brand=brand)
+        except ValueError as e:
+            return dict(candidate, error=str(e))
+    
+    fetched = await asyncio.gather(*(fetch_candidate(c) for c in candidates))
+    # The best match is the highest ranked candidate that could be fetched
+    best = next((c for c in fetched if "brand" in c), fetched[0])
+    if "error" in best:
+        raise ValueError(best["error"])
+    
+    resolved: Dict[str, Any] = {
+        "query": name,
+        "match": {key: value for key, value in best.items() if key != "brand"},
+        "brand": best["brand"],
+    }
+    if top_n > 1:
+        resolved["candidates"] = list(fetched)
+    return resolved
+
+
+@mcp.tool(name="get_brands_info")
+@instrument_tool
+@request_priority(PRIORITY_BULK)
+async def get_brands_info(
+    ctx: Context,
+    identifiers: List[str],
+    fields: Optional[List[str]] = None,
+    max_concurrency: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Get brand information for several identifiers in one call.
+    
+    Requests are sent concurrently, so the call takes about as long as the
+    slowest single lookup rather than the sum of all of them.
+    They are sent as bulk work, so interactive lookups go first.
+    
+    Args:
+        identifiers: Identifiers to retrieve brand data for, in any of the
+                     formats accepted by get_brand_info (domain, brand ID,
+                     ISIN or stock symbol).
+        fields: Optional list of fields to include in every response.
+                If None, returns all fields.
+        max_concurrency: Optional maximum number of concurrent API requests.
+                         If not provided, will use the server default.
+    
+    Returns:
+        One result per identifier, in the same order as the input. Each result
+        holds either the brand information or the error for that identifier.
+        Example:
+        [
+            {"identifier": "nike.com", "data": {"name": "Nike", ...}},
+            {
+                "identifier": "unknown.example",
+                "error": "Failed to get brand info: HTTP 404"
             }
+        ]
+    """
+    brandfetch = get_brandfetch_context(ctx)
+    logger.info("Getting brand info for %d identifiers", len(identifiers))
+    
+    if len(identifiers) > MAX_BATCH_SIZE:
+        raise ValueError(
+            f"Too many identifiers: {len(identifiers)} (maximum is {MAX_BATCH_SIZE})"
         )
-        response.raise_for_status()
-        
-        result = response.json()
-        logger.info(f"Successfully retrieved brand info for {identifier}")
-        return result
+    
+    concurrency = (
+        max_concurrency if max_concurrency is not None else brandfetch.batch_concurrency
+    )
+    if concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def fetch_one(identifier: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                data = await fetch_brand_info(brandfetch, identifier, fields)
+            except ValueError as e:
+                return {"identifier": identifier, "error": str(e)}
+        return {"identifier": identifier, "data": data}
+    
+    results = await asyncio.gather(*(fetch_one(i) for i in identifiers))
+    failed = sum(1 for result in results if "error" in result)
+    logger.info(
+        "Retrieved brand info for %d of %d identifiers",
+        len(results) - failed,
+        len(results),
+    )
+    return list(results)
+
+
+def read_identifiers(path: str, column: Optional[str] = None) -> Iterator[str]:
+    """
+    Read brand identifiers from a file one line at a time.
+
+    Each non-empty line holds either a bare identifier or a JSON object with
+    an "identifier" (or "domain") key, as in NDJSON exports. Files ending in
+    .csv are read as CSV with a header row, taking the "identifier" or
+    "domain" column, or else the first one. column names the key or CSV
+    column to use instead.
+    """
+    with open(os.path.expanduser(path), encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            yield from _read_csv_identifiers(f, column)
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json_loads(line)
+                if column is not None:
+                    identifier = record.get(column)
+                else:
+                    identifier = record.get("identifier") or record.get("domain")
+                if identifier:
+                    yield str(identifier).strip()
+            else:
+                yield line
+
+
+def _read_csv_identifiers(f: Iterable[str], column: Optional[str]) -> Iterator[str]:
+    """Read identifiers from one column of a CSV file with a header row."""
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if not header:
+        return
+    names = [name.strip().lower() for name in header]
+    if column is not None:
+        if column.lower() not in names:
+            raise ValueError(f"CSV file has no {column!r} column")
+        index = names.index(column.lower())
+    else:
+        index = next(
+            (names.index(name) for name in ("identifier", "domain") if name in names), 0
+        )
+    for row in reader:
+        if index < len(row) and row[index].strip():
+            yield row[index].strip()
+
+
+def resolve_enrich_path(brandfetch: BrandfetchContext, path: str) -> str:
+    """
+    Return the absolute path of an enrich_brands file.
+
+    Relative paths are taken from the enrichment directory, and paths that
+    lead outside it (including through symbolic links) are refused, since
+    they come from MCP clients.
+    """
+    if brandfetch.enrich_dir is None:
+        raise ValueError("File input and output are disabled")
+    root = os.path.realpath(os.path.expanduser(brandfetch.enrich_dir))
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Path is outside the enrichment directory {root}: {path}")
+    return resolved
+
+
+def _open_new_file(path: str) -> TextIO:
+    """Open a file for writing, refusing to replace an existing one."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        return open(path, "x", encoding="utf-8")
+    except FileExistsError:
+        raise ValueError(f"Output file already exists: {path}")
+
+
+def _write_lines(f: TextIO, lines: List[str]) -> None:
+    f.writelines(lines)
+    f.flush()
+
+
+async def _queue_identifiers(
+    identifiers: Iterator[str], queued: "asyncio.Queue[Optional[str]]", workers: int
+) -> None:
+    """
+    Feed identifiers to enrichment workers, then one None per worker.
+
+    The iterator is advanced in batches in a worker thread, since it may be
+    reading a file. The queue is bounded, so reading keeps pace with the
+    workers instead of loading the whole input. If reading fails, no None
+    is sent; the caller cancels the workers instead.
+    """
+    try:
+        while True:
+            batch = await asyncio.to_thread(
+                list, itertools.islice(identifiers, queued.maxsize)
+            )
+            if not batch:
+                break
+            for identifier in batch:
+                await queued.put(identifier)
+    except OSError as e:
+        raise ValueError(f"Failed to read identifiers: {e}")
+    for _ in range(workers):
+        await queued.put(None)
+
+
+@mcp.tool(name="enrich_brands")
+@instrument_tool
+@request_priority(PRIORITY_BULK)
+async def enrich_brands(
+    ctx: Context,
+    identifiers: Optional[List[str]] = None,
+    input_path: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    output_path: Optional[str] = None,
+    chunk_size: int = DEFAULT_ENRICH_CHUNK_SIZE,
+    max_concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Enrich a large list of brand identifiers, streaming results as they complete.
+    
+    Identifiers are processed with bounded concurrency and progress is reported
+    after every chunk. With an output_path, results are appended to an NDJSON
+    file after every chunk, so memory use stays flat however large the input
+    is and partial results can be read while the job runs. Files are read and
+    written inside the server's enrichment directory (BRANDFETCH_ENRICH_DIR).
+    Upstream requests are sent as bulk work, behind interactive lookups.
+    
+    Args:
+        identifiers: Identifiers to enrich (domain, brand ID, ISIN or stock symbol).
+        input_path: Optional path to a file with one identifier (or one JSON
+                    object with an "identifier" key) per line, or a CSV file
+                    with an "identifier" or "domain" column, used instead of
+                    identifiers for very large inputs. Requires an output_path.
+        fields: Optional list of fields to include in every result.
+                If None, returns all fields.
+        output_path: Optional path of a new NDJSON file to write results to. If
+                     not provided, results are returned in the response.
+        chunk_size: Number of completed results between progress reports.
+        max_concurrency: Optional maximum number of concurrent API requests.
+                         If not provided, will use the server default.
+    
+    Returns:
+        A summary with the number of identifiers processed, succeeded and failed,
+        plus either the output_path or the results in completion order. Each
+        result has the same shape as a get_brands_info result.
+    """
+    brandfetch = get_brandfetch_context(ctx)
+    
+    if (identifiers is None) == (input_path is None):
+        raise ValueError("Provide exactly one of identifiers or input_path")
+    if input_path is not None and output_path is None:
+        raise ValueError("An output_path is required with input_path")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    concurrency = (
+        max_concurrency if max_concurrency is not None else brandfetch.batch_concurrency
+    )
+    if concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    
+    # Files are only counted as they are read, so progress has no total
+    total: Optional[int] = None
+    if input_path is not None:
+        input_path = resolve_enrich_path(brandfetch, input_path)
+        if not await asyncio.to_thread(os.path.isfile, input_path):
+            raise ValueError(f"Input file not found: {input_path}")
+        pending = read_identifiers(input_path)
+        logger.info("Enriching identifiers from %s", input_path)
+    else:
+        total = len(identifiers)
+        pending = iter(identifiers)
+        logger.info("Enriching %d identifiers", total)
+    
+    output = None
+    if output_path is not None:
+        output_path = resolve_enrich_path(brandfetch, output_path)
+        output = await asyncio.to_thread(_open_new_file, output_path)
+    results: List[Dict[str, Any]] = []
+    lines: List[str] = []
+    completed = 0
+    failed = 0
+    
+    write_lock = asyncio.Lock()
+    
+    async def flush() -> None:
+        # One write at a time, so chunks reach the file in order
+        async with write_lock:
+            chunk = lines[:]
+            lines.clear()
+            if chunk:
+                write = asyncio.ensure_future(
+                    asyncio.to_thread(_write_lines, output, chunk)
+                )
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # The thread can't be stopped, so let it finish before
+                    # the lock is released and the file may be closed
+                    await write
+                    raise
+    
+    async def report(total: Optional[int]) -> None:
+        if output is not None:
+            await flush()
+        await ctx.report_progress(completed, total)
+        await ctx.info(f"Enriched {completed} brands ({failed} failed)")
+    
+    async def emit(result: Dict[str, Any]) -> None:
+        nonlocal completed, failed
+        completed += 1
+        if "error" in result:
+            failed += 1
+        if output is not None:
+            start = time.perf_counter()
+            lines.append(json_dumps(result).decode() + "\n")
+            brandfetch.metrics.observe("encode_seconds", time.perf_counter() - start)
+        else:
+            results.append(result)
+        if completed % chunk_size == 0 and completed != total:
+            await report(total)
+    
+    queued: "asyncio.Queue[Optional[str]]" = asyncio.Queue(
+        maxsize=max(concurrency, chunk_size)
+    )
+    
+    async def worker() -> None:
+        # Workers share a bounded queue, so only `concurrency` identifiers
+        # are in flight at any time regardless of the input size
+        while True:
+            identifier = await queued.get()
+            if identifier is None:
+                return
+            try:
+                data = await fetch_brand_info(brandfetch, identifier, fields)
+                result = {"identifier": identifier, "data": data}
+            except ValueError as e:
+                result = {"identifier": identifier, "error": str(e)}
+            await emit(result)
+    
+    tasks = [asyncio.create_task(_queue_identifiers(pending, queued, concurrency))]
+    tasks.extend(asyncio.create_task(worker()) for _ in range(concurrency))
+    try:
+        # Raises if the input couldn't be read or a worker failed, e.g. to
+        # report progress to a client that has gone away
+        await asyncio.gather(*tasks)
+        await report(completed)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if output is not None:
+            # Keep the results of a job that failed part way through
+            await flush()
+            await asyncio.to_thread(output.close)
+    
+    logger.info("Enriched %d of %d identifiers", completed - failed, completed)
+    summary: Dict[str, Any] = {
+        "total": completed,
+        "succeeded": completed - failed,
+        "failed": failed,
+    }
+    if output_path is not None:
+        summary["output_path"] = output_path
+    else:
+        summary["results"] = results
+    return summary
+
+
+async def fetch_asset(
+    brandfetch: BrandfetchContext, url: str
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Return the stored record for an asset URL, downloading it on a miss.
+
+    The download is streamed to disk in chunks, so memory use doesn't
+    depend on the file size. Returns the record and whether it was already
+    stored. Concurrent requests for the same URL share one download.
+    """
+    store = brandfetch.asset_store
+    if store is None:
+        raise ValueError("The asset store is disabled")
+    record = await asyncio.to_thread(store.lookup, url)
+    if record is not None:
+        brandfetch.metrics.increment("asset_requests_total", source="store")
+        return record, True
+    record = await brandfetch.inflight.do(
+        f"asset:{url}", lambda: _download_asset(brandfetch, store, url)
+    )
+    return record, False
+
+
+async def _download_asset(
+    brandfetch: BrandfetchContext, store: AssetStore, url: str
+) -> Dict[str, Any]:
+    """Stream an asset into the store, following up to ASSET_MAX_REDIRECTS redirects."""
+    if not url.startswith(("https://", "http://")):
+        raise ValueError(f"Unsupported asset URL: {url}")
+    start = time.perf_counter()
+    writer = await asyncio.to_thread(store.begin)
+    try:
+        source = url
+        for _ in range(ASSET_MAX_REDIRECTS + 1):
+            # Asset URLs are public; no credentials are sent with them
+            async with brandfetch.get_http_client().stream(
+                "GET", source, headers={"Accept": "*/*"}
+            ) as response:
+                if response.is_redirect and response.next_request is not None:
+                    source = str(response.next_request.url)
+                    if not source.startswith(("https://", "http://")):
+                        raise ValueError(f"Unsupported asset URL: {source}")
+                    continue
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(ASSET_CHUNK_SIZE):
+                    if writer.size + len(chunk) > store.max_bytes:
+                        raise ValueError(
+                            f"Asset is larger than {store.max_bytes} bytes: {url}"
+                        )
+                    await asyncio.to_thread(writer.write, chunk)
+                content_type = response.headers.get("content-type")
+                break
+        else:
+            raise ValueError(f"Too many redirects downloading asset: {url}")
+        record = await asyncio.to_thread(store.commit, writer, url, content_type)
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error during brand info retrieval: {e.response.status_code}")
-        logger.error(f"Response: {e.response.text}")
-        raise ValueError(f"Failed to get brand info: HTTP {e.response.status_code}")
-    except Exception as e:
-        logger.error(f"Exception during brand info retrieval: {str(e)}")
-        raise ValueError(f"Failed to get brand info: {str(e)}")
+        await asyncio.to_thread(writer.abort)
+        raise ValueError(f"Failed to download asset: HTTP {e.response.status_code}")
+    except httpx.HTTPError as e:
+        await asyncio.to_thread(writer.abort)
+        raise ValueError(f"Failed to download asset: {str(e)}")
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    brandfetch.metrics.observe("asset_download_seconds", time.perf_counter() - start)
+    brandfetch.metrics.increment("asset_requests_total", source="download")
+    return record
+
+
+@mcp.tool(name="get_brand_assets")
+@instrument_tool
+@request_priority(PRIORITY_INTERACTIVE)
+async def get_brand_assets(
+    ctx: Context,
+    identifier: str,
+    logo_types: Optional[List[str]] = None,
+    logo_themes: Optional[List[str]] = None,
+    logo_formats: Optional[List[str]] = None,
+    include_base64: bool = False,
+    max_concurrency: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Download a brand's logo files into the local asset store.
+    
+    Each file is downloaded once and stored under its content hash, so
+    repeat requests for the same asset are read from disk. Files are
+    streamed to disk rather than held in memory.
+    
+    Args:
+        identifier: Identifier of the brand (domain, brand ID, ISIN or stock symbol).
+        logo_types: Optional logo types to download (e.g. ["logo", "icon"]).
+                    If None, downloads all types.
+        logo_themes: Optional logo themes to download (e.g. ["light"]).
+        logo_formats: Optional file formats to download (e.g. ["svg", "png"]).
+        include_base64: Include the file content as base64 (files up to 1 MiB).
+        max_concurrency: Optional maximum number of concurrent downloads.
+                         If not provided, will use the server default.
+    
+    Returns:
+        One entry per asset with its type, theme, format, source URL and
+        either the local path, SHA-256, size and content type, or an error.
+        Example:
+        [
+            {
+                "type": "logo", "theme": "light", "format": "svg",
+                "src": "https://asset.brandfetch.io/.../logo.svg",
+                "path": "/home/me/.cache/brandfetch-mcp/assets/blobs/3f/3f9a...",
+                "sha256": "3f9a...", "size": 5120,
+                "content_type": "image/svg+xml", "cached": true
+            }
+        ]
+    """
+    brandfetch = get_brandfetch_context(ctx)
+    concurrency = (
+        max_concurrency if max_concurrency is not None else brandfetch.asset_concurrency
+    )
+    if concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    
+    document = await fetch_brand_info(brandfetch, identifier, ["logos"])
+    types = {t.lower() for t in logo_types} if logo_types else None
+    themes = {t.lower() for t in logo_themes} if logo_themes else None
+    formats = {f.lower() for f in logo_formats} if logo_formats else None
+    assets = []
+    for logo in document.get("logos") or []:
+        logo_type = str(logo.get("type") or "").lower()
+        theme = str(logo.get("theme") or "").lower()
+        if (types and logo_type not in types) or (themes and theme not in themes):
+            continue
+        for fmt in logo.get("formats") or []:
+            file_format = str(fmt.get("format") or "").lower()
+            if fmt.get("src") and (not formats or file_format in formats):
+                assets.append({
+                    "type": logo_type,
+                    "theme": theme,
+                    "format": file_format,
+                    "src": fmt["src"],
+                })
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def fetch_one(asset: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                record, cached = await fetch_asset(brandfetch, asset["src"])
+            except ValueError as e:
+                return dict(asset, error=str(e))
+            result = dict(
+                asset,
+                path=record["path"],
+                sha256=record["sha256"],
+                size=record["size"],
+                content_type=record["content_type"],
+                cached=cached,
+            )
+            if include_base64 and record["size"] <= MAX_ASSET_BASE64_BYTES:
+                data = await asyncio.to_thread(_read_file, record["path"])
+                result["base64"] = base64.b64encode(data).decode("ascii")
+            return result
+    
+    return list(await asyncio.gather(*(fetch_one(asset) for asset in assets)))
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def load_color_index(brandfetch: BrandfetchContext) -> None:
+    """
+    Add the brand documents in the disk cache to the color index, once.
+
+    This covers brands fetched by other server processes or by the warm-up
+    command. Documents are read in batches in a worker thread.
+    """
+    color_index = brandfetch.color_index
+    disk_cache = brandfetch.disk_cache
+    if disk_cache is None or color_index.disk_scanned or color_index.max_entries <= 0:
+        return
+
+    async def scan() -> None:
+        after = ""
+        while True:
+            rows = await asyncio.to_thread(
+                disk_cache.scan, "brand:", after, COLOR_INDEX_SCAN_BATCH
+            )
+            for key, document in rows:
+                if isinstance(document, dict):
+                    # Keys are brand:<identifier>:<fields>
+                    identifier = key[len("brand:"):].rsplit(":", 1)[0]
+                    color_index.add_brand_document(document, identifier)
+            if len(rows) < COLOR_INDEX_SCAN_BATCH:
+                break
+            after = rows[-1][0]
+        color_index.disk_scanned = True
+        logger.info("Color index holds %d brands", len(color_index))
+
+    await brandfetch.inflight.do("color-index:disk", scan)
+
+
+@mcp.tool(name="find_similar_brands")
+@instrument_tool
+@request_priority(PRIORITY_INTERACTIVE)
+@with_call_deadline
+async def find_similar_brands(
+    ctx: Context,
+    identifier: Optional[str] = None,
+    colors: Optional[List[str]] = None,
+    limit: int = 10,
+) -> Dict[str, Any]:
+    """
+    Find brands with a color palette like a given brand's or a list of colors.
+
+    Palettes are compared in a perceptual color space (CIE Lab), weighting
+    brand and accent colors above dark and light ones. Only brands already
+    in the server's caches are compared, so no API requests are made, except
+    to fetch the reference brand if it isn't cached yet. Brands looked up
+    with get_brand_info, get_brands_info or enrich_brands are included.
+
+    Args:
+        identifier: Brand whose palette to match (domain, brand ID, ISIN or
+                    stock symbol).
+        colors: Hex colors to match instead of a brand, e.g. ["#111111", "#e10600"].
+        limit: Number of brands to return (default 10, maximum 50).
+
+    Returns:
+        The query palette, the number of brands compared and the closest
+        brands, closest first. The distance is 0 for identical palettes;
+        differences below about 10 are hard to see.
+        Example:
+        {
+            "query": {"identifier": "nike.com", "colors": ["#111111", "#e10600"]},
+            "indexed_brands": 12000,
+            "results": [
+                {"name": "Example", "domain": "example.com", "brandId": "id_123",
+                 "colors": ["#000000", "#e1261c"], "distance": 4.21}
+            ]
+        }
+    """
+    brandfetch = get_brandfetch_context(ctx)
+    if (identifier is None) == (colors is None):
+        raise ValueError("Provide exactly one of identifier or colors")
+    if not 1 <= limit <= MAX_SIMILAR_BRANDS:
+        raise ValueError(f"limit must be between 1 and {MAX_SIMILAR_BRANDS}")
+    import_numpy()  # Fail before fetching anything if NumPy is missing
+    await load_color_index(brandfetch)
+
+    query: Dict[str, Any] = {}
+    exclude = None
+    if identifier is not None:
+        query["identifier"] = identifier
+        indexed = brandfetch.color_index.get(brandfetch.aliases.resolve(identifier))
+        if indexed is not None:
+            brand, palette = indexed
+            exclude = brand["domain"]
+        else:
+            document = await fetch_brand_info(brandfetch, identifier)
+            palette = palette_colors(document.get("colors") or [])
+            exclude = document.get("domain") or identifier
+        if not palette:
+            raise ValueError(f"No colors found for {identifier}")
+    else:
+        palette = palette_colors(colors or [])
+        if not palette:
+            raise ValueError("No valid hex colors given")
+    query["colors"] = [entry[0] for entry in palette]
+
+    matches = brandfetch.color_index.nearest(palette, limit, exclude=exclude)
+    return {
+        "query": query,
+        "indexed_brands": len(brandfetch.color_index),
+        "results": [dict(brand, distance=distance) for distance, brand in matches],
+    }
+
+
+@mcp.tool(name="get_server_stats")
+async def get_server_stats(
+    ctx: Context, format: str = "json"
+) -> Union[Dict[str, Any], str]:
+    """
+    Get latency and cache statistics for this server process.
+    
+    Args:
+        format: "json" for a structured summary, or "prometheus" for the
+                Prometheus text exposition format.
+    
+    Returns:
+        Per-tool call latency (p50/p95/p99), upstream request, connection pool
+        wait and JSON decode/encode latency, upstream response and retry
+        counts, cache hit ratios, coalesced requests, background refreshes
+        and rate limiter throttling.
+    """
+    brandfetch = get_brandfetch_context(ctx)
+    if format == "prometheus":
+        return await render_server_stats(brandfetch)
+    if format != "json":
+        raise ValueError(
+            f"Unknown format: {format!r} (expected 'json' or 'prometheus')"
+        )
+    return await collect_server_stats(brandfetch)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Serve Prometheus metrics when running over an HTTP transport."""
+    if _active_context is None:
+        return PlainTextResponse("", status_code=503)
+    return PlainTextResponse(
+        await render_server_stats(_active_context),
+        media_type="text/plain; version=0.0.4",
+    )
 
 
 @mcp.prompt(name="search_prompt")
@@ -275,8 +4634,106 @@ Please help me format my request to get the brand information I need.
 """
 
 
+def create_http_app() -> Starlette:
+    """
+    Build the ASGI app for an HTTP transport, once per worker process.
+
+    The transport is read from BRANDFETCH_TRANSPORT ("streamable-http" or
+    "sse"). Streamable HTTP runs stateless, so any worker can serve any
+    request. The app holds the shared Brandfetch context for its lifetime,
+    rather than opening it for every stateless request.
+    """
+    transport = os.environ.get("BRANDFETCH_TRANSPORT", "streamable-http")
+    if transport == "streamable-http":
+        mcp.settings.stateless_http = True
+        app = mcp.streamable_http_app()
+    elif transport == "sse":
+        app = mcp.sse_app()
+    else:
+        raise ValueError(f"Unknown HTTP transport: {transport!r}")
+    transport_lifespan = app.router.lifespan_context
+    
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        async with brandfetch_lifespan(mcp):
+            async with transport_lifespan(app):
+                yield
+    
+    app.router.lifespan_context = lifespan
+    return app
+
+
+def serve(
+    transport: str = "stdio",
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    workers: int = 1,
+) -> None:
+    """
+    Run the server on stdio, or over HTTP with one or more worker processes.
+
+    Several workers share the persistent cache and the rate limits through
+    SQLite databases on this host, which default to files under
+    ~/.cache/brandfetch-mcp unless BRANDFETCH_CACHE_PATH and
+    BRANDFETCH_RATE_LIMIT_PATH are set.
+    """
+    if transport == "stdio":
+        mcp.run()
+        return
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if transport == "sse" and workers > 1:
+        raise ValueError(
+            "SSE sessions are bound to one process; "
+            "use streamable-http with several workers"
+        )
+    
+    import uvicorn
+    
+    # Worker processes inherit the environment and read it in create_http_app
+    os.environ["BRANDFETCH_TRANSPORT"] = transport
+    if workers > 1:
+        os.environ.setdefault("BRANDFETCH_CACHE_PATH", DEFAULT_SHARED_CACHE_PATH)
+        os.environ.setdefault(
+            "BRANDFETCH_RATE_LIMIT_PATH", DEFAULT_SHARED_RATE_LIMIT_PATH
+        )
+    uvicorn.run(
+        "brandfetch_server:create_http_app",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        log_level=os.environ.get("LOG_LEVEL", "INFO").strip().lower(),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the server from the command line."""
+    parser = argparse.ArgumentParser(description="Run the Brandfetch MCP server.")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "streamable-http", "sse"],
+        default=os.environ.get("BRANDFETCH_TRANSPORT", "stdio"),
+        help="Transport to serve (default: stdio)",
+    )
+    parser.add_argument(
+        "--host", default=os.environ.get("BRANDFETCH_HOST", "127.0.0.1")
+    )
+    parser.add_argument("--port", type=int, default=_env_int("BRANDFETCH_PORT", 8000))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=_env_int("BRANDFETCH_WORKERS", 1),
+        help="Worker processes for HTTP transports (default: 1)",
+    )
+    args = parser.parse_args(argv)
+    
+    logger.info("Starting Brandfetch API server...")
+    serve(args.transport, args.host, args.port, args.workers)
+    logger.info("Server shutdown")
+
+
 # Run the server when executed directly
 if __name__ == "__main__":
-    logger.info("Starting Brandfetch API server...")
-    mcp.run()
-    logger.info("Server shutdown")
\ No newline at end of file
+    main()
\ No newline at end of file
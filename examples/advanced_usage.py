@@ -3,7 +3,8 @@
 Advanced example of using the Brandfetch MCP server.
 
 This example demonstrates how to:
-1. Get filtered brand information (only logos and colors)
+1. Find a brand by name and get filtered brand information (only logos
+   and colors) in a single resolve_brand call
 2. Process and display logo information
 3. Process and display color information
 
@@ -43,35 +44,25 @@ async def main():
             await session.initialize()
             print("Connected to Brandfetch MCP server")
             
-            # First, search for a brand
+            # Search for the brand and get only its logos and colors in one call
             brand_name = "Google"
-            print(f"\nSearching for brand '{brand_name}'...")
-            search_result = await session.call_tool(
-                "search_brands", 
-                arguments={"name": brand_name}
+            print(f"\nResolving brand '{brand_name}'...")
+            result = await session.call_tool(
+                "resolve_brand",
+                arguments={
+                    "name": brand_name,
+                    "fields": ["logos", "colors"]
+                }
             )
+            resolved = json.loads(result.content[0].text)
             
-            if not search_result or len(search_result) == 0:
+            if not resolved.get("match"):
                 print(f"No brands found for '{brand_name}'")
                 return
             
-            # Get the first found brand's domain
-            brand_domain = search_result[0].get("domain")
-            if not brand_domain:
-                print("Domain not found in search results")
-                return
-            
-            print(f"Found brand: {search_result[0].get('name')} ({brand_domain})")
-            
-            # Get only logos and colors for the brand
-            print(f"\nGetting logos and colors for {brand_domain}...")
-            brand_info = await session.call_tool(
-                "get_brand_info",
-                arguments={
-                    "identifier": brand_domain,
-                    "fields": ["logos", "colors"]
-                }
-            )
+            match = resolved["match"]
+            print(f"Found brand: {match.get('name')} ({match.get('domain')})")
+            brand_info = resolved["brand"]
             
             # Process logos
             logos = brand_info.get("logos", [])
@@ -8,8 +8,12 @@ These tests verify that the server correctly handles:
 Note: These tests use mocked responses to avoid making actual API calls.
 """
 import asyncio
+import json
 import pytest
 import os
+import subprocess
+import threading
+import time
 import httpx
 from unittest.mock import patch, MagicMock, AsyncMock
 
@@ -21,18 +25,25 @@ import brandfetch_server
 from mcp.server.fastmcp import Context
 
 
+def make_response(status_code, json_data=None, text=None, url="https://api.brandfetch.io"):
+    """Create an httpx response bound to a request, as the client would return."""
+    kwargs = {"json": json_data} if text is None else {"text": text}
+    return httpx.Response(status_code, request=httpx.Request("GET", url), **kwargs)
+
+
 @pytest.fixture
 def mock_context():
     """Create a mock context for testing."""
     context = MagicMock(spec=Context)
     context.request_context = MagicMock()
     
-    # Mock the lifespan context
-    brandfetch_context = MagicMock()
-    brandfetch_context.api_key = "test_api_key"
-    brandfetch_context.client_id = "test_client_id"
-    brandfetch_context.base_url = "https://api.brandfetch.io"
-    brandfetch_context.http_client = AsyncMock(spec=httpx.AsyncClient)
+    # Use a real lifespan context backed by a mocked HTTP client
+    brandfetch_context = brandfetch_server.BrandfetchContext(
+        api_key="test_api_key",
+        client_id="test_client_id",
+        base_url="https://api.brandfetch.io",
+        http_client=AsyncMock(spec=httpx.AsyncClient),
+    )
     
     context.request_context.lifespan_context = brandfetch_context
     return context
@@ -42,9 +53,7 @@ def mock_context():
 async def test_search_brands(mock_context):
     """Test the search_brands function."""
     # Create a mock response for the search API
-    mock_response = AsyncMock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = [
+    mock_response = make_response(200, [
         {
             "icon": "https://example.com/icon.svg",
             "name": "Example Company",
@@ -52,7 +61,7 @@ async def test_search_brands(mock_context):
             "claimed": True,
             "brandId": "id_12345"
         }
-    ]
+    ])
     
     # Set up the mock client to return our mock response
     mock_context.request_context.lifespan_context.http_client.get.return_value = mock_response
@@ -71,7 +80,6 @@ async def test_search_brands(mock_context):
         "https://api.brandfetch.io/v2/search/Example",
         params={"c": "test_client_id"},
         headers={
-            "Authorization": None,
             "Content-Type": "application/json",
         }
     )
@@ -81,9 +89,7 @@ async def test_search_brands(mock_context):
 async def test_get_brand_info(mock_context):
     """Test the get_brand_info function."""
     # Create a mock response for the brand API
-    mock_response = AsyncMock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {
+    mock_response = make_response(200, {
         "id": "id_12345",
         "name": "Example Company",
         "domain": "example.com",
@@ -103,7 +109,7 @@ async def test_get_brand_info(mock_context):
                 ]
             }
         ]
-    }
+    })
     
     # Set up the mock client to return our mock response
     mock_context.request_context.lifespan_context.http_client.get.return_value = mock_response
@@ -136,13 +142,10 @@ async def test_get_brand_info(mock_context):
 async def test_get_brand_info_error_handling(mock_context):
     """Test that the get_brand_info function handles errors correctly."""
     # Create a mock response for a 404 error
-    mock_response = AsyncMock()
-    mock_response.status_code = 404
-    mock_response.text = "Brand not found"
-    mock_response.raise_for_status.side_effect = httpx.HTTPStatusError(
-        "404 Not Found", 
-        request=httpx.Request("GET", "https://api.brandfetch.io/v2/brands/nonexistent.com"),
-        response=mock_response
+    mock_response = make_response(
+        404,
+        text="Brand not found",
+        url="https://api.brandfetch.io/v2/brands/nonexistent.com",
     )
     
     # Set up the mock client to return our mock response
@@ -153,3 +156,1604 @@ async def test_get_brand_info_error_handling(mock_context):
         await brandfetch_server.get_brand_info(mock_context, "nonexistent.com")
     
     assert "Failed to get brand info: HTTP 404" in str(excinfo.value)
+
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_uses_cache(mock_context):
+    """Test that repeated brand lookups are served from the response cache."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(200, {"name": "Example Company"})
+    
+    first = await brandfetch_server.get_brand_info(
+        mock_context, "Example.com", fields=["name", "logos"]
+    )
+    # Identifier case and field order do not change the cache key
+    second = await brandfetch_server.get_brand_info(
+        mock_context, " example.com ", fields=["logos", "name"]
+    )
+    
+    assert first == second == {"name": "Example Company"}
+    assert http_client.get.call_count == 1
+    cache = mock_context.request_context.lifespan_context.cache
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_search_brands_cache_keyed_by_client_id(mock_context):
+    """Test that search results are cached per normalized name and client ID."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(200, [{"name": "Example Company"}])
+    
+    await brandfetch_server.search_brands(mock_context, "Example")
+    await brandfetch_server.search_brands(mock_context, "  example ")
+    await brandfetch_server.search_brands(mock_context, "Example", client_id="other")
+    
+    assert http_client.get.call_count == 2
+
+
+def test_response_cache_expiry_and_eviction():
+    """Test TTL expiry and LRU eviction by entry count and byte size."""
+    cache = brandfetch_server.ResponseCache(max_entries=2, max_bytes=100)
+    
+    with patch.object(brandfetch_server.time, "monotonic", return_value=0.0):
+        cache.set("a", 1, ttl=10, size=10)
+        cache.set("b", 2, ttl=10, size=10)
+        assert cache.get("a") == 1  # "a" is now most recently used
+        cache.set("c", 3, ttl=10, size=10)
+        assert "b" not in cache
+        assert cache.get("a") == 1
+        
+        # Oversized byte totals evict from the least recently used end
+        cache.set("d", 4, ttl=10, size=95)
+        assert len(cache) == 1
+        assert cache.get("d") == 4
+    
+    with patch.object(brandfetch_server.time, "monotonic", return_value=11.0):
+        assert cache.get("d") is None
+    
+    assert cache.stats()["evictions"] == 3
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_projects_cached_superset(mock_context):
+    """Test that a narrower field request is answered from a cached superset."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(200, {
+        "logos": [{"type": "logo"}],
+        "colors": [{"hex": "#000000"}],
+    })
+    
+    await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["logos", "colors"]
+    )
+    result = await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["logos"]
+    )
+    
+    assert result == {"logos": [{"type": "logo"}]}
+    assert http_client.get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_projects_full_document(mock_context):
+    """Test that any field request is answered from a cached full document."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(200, {
+        "name": "Example Company",
+        "logos": [],
+        "fonts": [],
+    })
+    
+    await brandfetch_server.get_brand_info(mock_context, "example.com")
+    result = await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["name", "fonts"]
+    )
+    
+    assert result == {"name": "Example Company", "fonts": []}
+    assert http_client.get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_fetches_full_document_for_repeated_projections(
+    mock_context,
+):
+    """Test that repeated narrow projections trigger one full document fetch."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.side_effect = [
+        make_response(200, {"logos": []}),
+        make_response(200, {"logos": [], "colors": [], "fonts": []}),
+    ]
+    
+    await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["logos"]
+    )
+    colors = await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["colors"]
+    )
+    fonts = await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["fonts"]
+    )
+    
+    assert colors == {"colors": []}
+    assert fonts == {"fonts": []}
+    assert http_client.get.call_count == 2
+    assert http_client.get.call_args_list[1].kwargs["params"] == {}
+
+
+@pytest.mark.asyncio
+async def test_get_brands_info_returns_results_in_order(mock_context):
+    """Test that batch lookups return per-identifier results and errors in order."""
+    async def fake_get(url, params=None, headers=None):
+        if url.endswith("/missing.com"):
+            return make_response(404, text="Brand not found", url=url)
+        # Finish later requests first to check that the input order is kept
+        await asyncio.sleep(0.01 if url.endswith("/first.com") else 0)
+        return make_response(200, {"domain": url.rsplit("/", 1)[1]}, url=url)
+    
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.side_effect = fake_get
+    
+    results = await brandfetch_server.get_brands_info(
+        mock_context, ["first.com", "missing.com", "second.com"], fields=["domain"]
+    )
+    
+    assert results == [
+        {"identifier": "first.com", "data": {"domain": "first.com"}},
+        {"identifier": "missing.com", "error": "Failed to get brand info: HTTP 404"},
+        {"identifier": "second.com", "data": {"domain": "second.com"}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_brands_info_limits_concurrency(mock_context):
+    """Test that batch lookups never exceed the concurrency limit."""
+    in_flight = 0
+    peak = 0
+    
+    async def fake_get(url, params=None, headers=None):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return make_response(200, {"name": "Example"}, url=url)
+    
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.side_effect = fake_get
+    
+    identifiers = [f"brand{i}.com" for i in range(10)]
+    results = await brandfetch_server.get_brands_info(
+        mock_context, identifiers, max_concurrency=3
+    )
+    
+    assert len(results) == 10
+    assert peak == 3
+    
+    with pytest.raises(ValueError, match="at least 1"):
+        await brandfetch_server.get_brands_info(
+            mock_context, identifiers, max_concurrency=0
+        )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_lookups_share_one_request(mock_context):
+    """Test that concurrent identical lookups are coalesced into one request."""
+    async def fake_get(url, params=None, headers=None):
+        await asyncio.sleep(0.01)
+        return make_response(200, {"name": "Example Company"}, url=url)
+    
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.side_effect = fake_get
+    
+    results = await asyncio.gather(*(
+        brandfetch_server.get_brand_info(mock_context, "example.com")
+        for _ in range(5)
+    ))
+    
+    assert all(result == {"name": "Example Company"} for result in results)
+    assert http_client.get.call_count == 1
+    inflight = mock_context.request_context.lifespan_context.inflight
+    assert inflight.coalesced == 4
+    assert len(inflight) == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_share_failure(mock_context):
+    """Test that a failed coalesced request is delivered to every waiter."""
+    async def fake_get(url, params=None, headers=None):
+        await asyncio.sleep(0.01)
+        return make_response(404, text="Not found", url=url)
+    
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.side_effect = fake_get
+    
+    results = await asyncio.gather(
+        *(brandfetch_server.search_brands(mock_context, "Example") for _ in range(3)),
+        return_exceptions=True,
+    )
+    
+    assert http_client.get.call_count == 1
+    for result in results:
+        assert isinstance(result, ValueError)
+        assert "Failed to search brands: HTTP 404" in str(result)
+
+
+def test_create_http_client_reads_environment():
+    """Test that HTTP client timeouts and HTTP/2 come from the environment."""
+    env = {
+        "BRANDFETCH_CONNECT_TIMEOUT": "2.5",
+        "BRANDFETCH_READ_TIMEOUT": "12",
+        "BRANDFETCH_POOL_TIMEOUT": "1",
+        "BRANDFETCH_HTTP2": "false",
+    }
+    with patch.dict(os.environ, env):
+        client = brandfetch_server.create_http_client()
+    
+    assert client.timeout.connect == 2.5
+    assert client.timeout.read == 12.0
+    assert client.timeout.write == brandfetch_server.DEFAULT_WRITE_TIMEOUT
+    assert client.timeout.pool == 1.0
+    # The bearer token is sent per request, never to the search endpoint
+    assert "Authorization" not in client.headers
+    asyncio.run(client.aclose())
+
+
+@pytest.mark.asyncio
+async def test_warm_up_connections_ignores_failures():
+    """Test that connection warm-up sends requests and never raises."""
+    requests = []
+    
+    def handler(request):
+        requests.append(request)
+        if len(requests) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(404)
+    
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await brandfetch_server.warm_up_connections(
+            client, "https://api.brandfetch.io", 2
+        )
+        await brandfetch_server.warm_up_connections(
+            client, "https://api.brandfetch.io", 0
+        )
+    
+    assert len(requests) == 2
+    assert all(request.method == "HEAD" for request in requests)
+
+
+def test_disk_cache_expiry_and_eviction(tmp_path):
+    """Test that the disk cache expires entries and stays under its size limit."""
+    cache = brandfetch_server.DiskCache(str(tmp_path / "cache.db"), max_bytes=100)
+    
+    cache.set("a", {"value": "a" * 20}, ttl=60)
+    cache.set("b", {"value": "b" * 20}, ttl=60)
+    assert cache.get_first(["missing", "a"])[:2] == ("a", {"value": "a" * 20})
+    
+    # Pushing the total over the limit evicts the least recently accessed entry
+    with patch.object(brandfetch_server.time, "time", return_value=time.time() + 1):
+        cache.set("c", {"value": "c" * 40}, ttl=60)
+    assert cache.get_first(["a"]) is None
+    stats = cache.stats()
+    assert stats["bytes"] <= 100
+    assert stats["entries"] == 2
+    cache.set("c", {"value": "c" * 30}, ttl=60)
+    assert cache.stats()["entries"] == 2
+    
+    with patch.object(brandfetch_server.time, "time", return_value=time.time() + 120):
+        assert cache.get_first(["b", "c"]) is None
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_shared_between_contexts(mock_context, tmp_path):
+    """Test that a new server process is answered from the persistent cache."""
+    path = str(tmp_path / "cache.db")
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.disk_cache = brandfetch_server.DiskCache(path)
+    brandfetch.http_client.get.return_value = make_response(
+        200, {"name": "Example Company", "logos": []}
+    )
+    await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    # A fresh context stands in for a newly started server process
+    cold = brandfetch_server.BrandfetchContext(
+        api_key="test_api_key",
+        client_id="test_client_id",
+        base_url="https://api.brandfetch.io",
+        http_client=AsyncMock(spec=httpx.AsyncClient),
+        disk_cache=brandfetch_server.DiskCache(path),
+    )
+    mock_context.request_context.lifespan_context = cold
+    result = await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["name"]
+    )
+    
+    assert result == {"name": "Example Company"}
+    cold.http_client.get.assert_not_called()
+    # The document is now in the new process's memory cache as well
+    assert brandfetch_server.brand_cache_key("example.com") in cold.cache
+    brandfetch.disk_cache.close()
+    cold.disk_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_serves_stale_while_refreshing(mock_context):
+    """Test that an expired entry is served at once and refreshed in the background."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.http_client.get.side_effect = [
+        make_response(200, {"name": "Old Name"}),
+        make_response(200, {"name": "New Name"}),
+    ]
+    await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    # Jump past the TTL but stay inside the stale window
+    later = time.monotonic() + brandfetch.brand_cache_ttl + 1
+    with patch.object(brandfetch_server.time, "monotonic", return_value=later):
+        stale = await brandfetch_server.get_brand_info(mock_context, "example.com")
+        assert stale == {"name": "Old Name"}
+        await brandfetch.refresher.wait()
+        fresh = await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert fresh == {"name": "New Name"}
+    assert brandfetch.http_client.get.call_count == 2
+    assert brandfetch.cache.stale_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_refetches_past_stale_window(mock_context):
+    """Test that entries past the stale window are fetched on the critical path."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.http_client.get.side_effect = [
+        make_response(200, {"name": "Old Name"}),
+        make_response(200, {"name": "New Name"}),
+    ]
+    await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    later = time.monotonic() + brandfetch.brand_cache_ttl + brandfetch.stale_window + 1
+    with patch.object(brandfetch_server.time, "monotonic", return_value=later):
+        result = await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert result == {"name": "New Name"}
+    assert len(brandfetch.refresher) == 0
+
+
+def not_modified_response(etag):
+    """Create a 304 response as the API sends it for an unchanged document."""
+    return httpx.Response(
+        304, headers={"ETag": etag}, request=httpx.Request("GET", "https://api.brandfetch.io")
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_revalidates_expired_document(mock_context):
+    """Test that an expired document is revalidated and a 304 renews its TTL."""
+    brandfetch = mock_context.request_context.lifespan_context
+    document = make_response(200, {"name": "Example"})
+    document.headers["ETag"] = '"v1"'
+    brandfetch.http_client.get.side_effect = [document, not_modified_response('"v1"')]
+    await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    later = time.monotonic() + brandfetch.brand_cache_ttl + 1
+    with patch.object(brandfetch_server.time, "monotonic", return_value=later):
+        await brandfetch_server.get_brand_info(mock_context, "example.com")
+        await brandfetch.refresher.wait()
+        key = brandfetch_server.brand_cache_key("example.com")
+        assert key in brandfetch.cache
+        fresh = await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert fresh == {"name": "Example"}
+    revalidation = brandfetch.http_client.get.call_args_list[1]
+    assert revalidation.kwargs["headers"]["If-None-Match"] == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_revalidates_after_stale_window(mock_context):
+    """Test that validators outlive the stale window without a disk cache."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.stale_window = 0
+    document = make_response(200, {"name": "Example"})
+    document.headers["ETag"] = '"v1"'
+    brandfetch.http_client.get.side_effect = [document, not_modified_response('"v1"')]
+    await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    later = time.monotonic() + brandfetch.brand_cache_ttl + 1
+    with patch.object(brandfetch_server.time, "monotonic", return_value=later):
+        result = await brandfetch_server.get_brand_info(mock_context, "example.com")
+        key = brandfetch_server.brand_cache_key("example.com")
+        assert key in brandfetch.cache
+        assert brandfetch.cache.get(key) == {"name": "Example"}
+    
+    assert result == {"name": "Example"}
+    assert brandfetch.disk_cache is None
+    revalidation = brandfetch.http_client.get.call_args_list[1]
+    assert revalidation.kwargs["headers"]["If-None-Match"] == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_revalidates_expired_entries(mock_context, tmp_path):
+    """Test that a new process revalidates an expired persistent entry."""
+    path = str(tmp_path / "cache.db")
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.disk_cache = brandfetch_server.DiskCache(path)
+    document = make_response(200, {"name": "Example"})
+    document.headers["Last-Modified"] = "Wed, 01 Jan 2025 00:00:00 GMT"
+    brandfetch.http_client.get.return_value = document
+    await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    cold = brandfetch_server.BrandfetchContext(
+        api_key="test_api_key",
+        client_id="test_client_id",
+        base_url="https://api.brandfetch.io",
+        http_client=AsyncMock(spec=httpx.AsyncClient),
+        disk_cache=brandfetch_server.DiskCache(path),
+    )
+    cold.http_client.get.return_value = not_modified_response('"v1"')
+    mock_context.request_context.lifespan_context = cold
+    later = time.time() + brandfetch.brand_cache_ttl + 1
+    with patch.object(brandfetch_server.time, "time", return_value=later):
+        result = await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert result == {"name": "Example"}
+    headers = cold.http_client.get.call_args.kwargs["headers"]
+    assert headers["If-Modified-Since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    # The renewed entry keeps both validators
+    cache_key = brandfetch_server.brand_cache_key("example.com")
+    stored = cold.disk_cache.get_revalidation(cache_key)
+    assert stored[2] == {
+        "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT", "If-None-Match": '"v1"'
+    }
+    brandfetch.disk_cache.close()
+    cold.disk_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_not_found_answers_are_cached_briefly(mock_context):
+    """Test that 404s and empty searches are remembered for the negative TTL."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.http_client.get.side_effect = [
+        make_response(404, {"message": "Brand not found"}),
+        make_response(404, {"message": "Not found"}),
+        make_response(200, []),
+    ]
+    for _ in range(2):
+        with pytest.raises(ValueError, match="HTTP 404"):
+            await brandfetch_server.get_brand_info(mock_context, "unknown.example")
+        with pytest.raises(ValueError, match="HTTP 404"):
+            await brandfetch_server.search_brands(
+                mock_context, "nothing", force_upstream=True
+            )
+    assert await brandfetch_server.search_brands(
+        mock_context, "no results", force_upstream=True
+    ) == []
+    assert brandfetch.http_client.get.call_count == 3
+    
+    later = time.monotonic() + brandfetch.negative_cache_ttl + 1
+    with patch.object(brandfetch_server.time, "monotonic", return_value=later):
+        key = brandfetch_server.search_cache_key("no results", "test_client_id")
+        assert brandfetch.cache.get(key) is None
+        brandfetch.http_client.get.side_effect = None
+        brandfetch.http_client.get.return_value = make_response(200, {"name": "Known"})
+        result = await brandfetch_server.get_brand_info(mock_context, "unknown.example")
+    assert result == {"name": "Known"}
+
+
+@pytest.mark.asyncio
+async def test_keep_brands_warm_fetches_hot_list(mock_context):
+    """Test that the hot-list refresher loads full documents into the cache."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.http_client.get.return_value = make_response(200, {"name": "Hot"})
+    
+    task = asyncio.create_task(
+        brandfetch_server.keep_brands_warm(brandfetch, ["hot.com", "warm.com"], 60)
+    )
+    await asyncio.sleep(0)
+    await brandfetch.refresher.wait()
+    task.cancel()
+    
+    assert brandfetch_server.brand_cache_key("hot.com") in brandfetch.cache
+    assert brandfetch_server.brand_cache_key("warm.com") in brandfetch.cache
+    assert brandfetch.http_client.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_retries_rate_limited_requests(mock_context):
+    """Test that 429 responses are retried after the Retry-After delay."""
+    brandfetch = mock_context.request_context.lifespan_context
+    rate_limited = httpx.Response(
+        429,
+        headers={"Retry-After": "0"},
+        request=httpx.Request("GET", "https://api.brandfetch.io"),
+    )
+    brandfetch.http_client.get.side_effect = [
+        rate_limited,
+        make_response(200, {"name": "Example Company"}),
+    ]
+    
+    result = await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert result == {"name": "Example Company"}
+    assert brandfetch.http_client.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_gives_up_after_max_retries(mock_context):
+    """Test that persistent server errors surface after the retries run out."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.retry_base_delay = 0.001
+    brandfetch.http_client.get.return_value = make_response(503, text="Unavailable")
+    
+    with pytest.raises(ValueError) as excinfo:
+        await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert "Failed to get brand info: HTTP 503" in str(excinfo.value)
+    assert brandfetch.http_client.get.call_count == brandfetch.max_retries + 1
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_does_not_wait_for_long_retry_after(mock_context):
+    """Test that a Retry-After beyond the maximum delay is not waited for."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.http_client.get.return_value = httpx.Response(
+        429,
+        headers={"Retry-After": "3600"},
+        request=httpx.Request("GET", "https://api.brandfetch.io"),
+    )
+    
+    with pytest.raises(ValueError) as excinfo:
+        await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert "HTTP 429" in str(excinfo.value)
+    assert brandfetch.http_client.get.call_count == 1
+    
+    # The endpoint stays paused, so later lookups don't call the API
+    with pytest.raises(ValueError, match="HTTP 429"):
+        await brandfetch_server.get_brand_info(mock_context, "other.example")
+    assert brandfetch.http_client.get.call_count == 1
+    assert brandfetch.rate_limiters["brand"].paused_for() > 500
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    """Test that the token bucket delays requests beyond the burst."""
+    bucket = brandfetch_server.TokenBucket(rate=100, burst=2)
+    
+    start = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    elapsed = time.monotonic() - start
+    
+    # Two requests fit in the burst, the other two wait 10ms each
+    assert elapsed >= 0.015
+    assert bucket.throttled == 2
+    
+    await bucket.pause(0.0)
+    assert bucket.rate == 50
+    await bucket.record_success()
+    assert bucket.rate == 55
+
+
+@pytest.mark.asyncio
+async def test_slow_requests_are_hedged_within_budget(mock_context):
+    """Test that a request slower than the hedge delay races a duplicate."""
+    brandfetch = mock_context.request_context.lifespan_context
+    calls = []
+    
+    async def fake_get(url, params=None, headers=None):
+        calls.append(url)
+        # The first request stalls; its duplicate answers at once
+        if len(calls) % 2 == 1:
+            await asyncio.sleep(10)
+        return make_response(200, {"name": f"Brand {len(calls)}"})
+    
+    brandfetch.http_client.get.side_effect = fake_get
+    for _ in range(brandfetch_server.HEDGE_MIN_SAMPLES):
+        brandfetch.metrics.observe("upstream_request_seconds", 0.001, endpoint="brand")
+    brandfetch.hedging = brandfetch_server.HedgePolicy(
+        quantile=0.95, min_delay=0.01, budget=1.0
+    )
+    
+    result = await brandfetch_server.get_brand_info(mock_context, "example.com")
+    
+    assert result == {"name": "Brand 2"}
+    assert brandfetch.hedging.stats()["hedges"] == 1
+    assert brandfetch.hedging.wins == 1
+    
+    # Without budget left, the slow request is waited for (up to its timeout)
+    brandfetch.hedging.budget = 0.0
+    brandfetch.hedging.credits = 0.0
+    brandfetch.attempt_timeout = 0.05
+    brandfetch.max_retries = 0
+    with pytest.raises(ValueError, match="No response within"):
+        await brandfetch_server.get_brand_info(mock_context, "other.com")
+    assert brandfetch.hedging.hedges == 1
+
+
+@pytest.mark.asyncio
+async def test_call_deadline_bounds_attempts_and_retries(mock_context):
+    """Test that slow attempts are retried but never past the call deadline."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.attempt_timeout = 0.05
+    brandfetch.retry_base_delay = 0.01
+    calls = []
+    
+    async def fake_get(url, params=None, headers=None):
+        calls.append(url)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+        return make_response(200, {"name": "Example"})
+    
+    brandfetch.http_client.get.side_effect = fake_get
+    assert await brandfetch_server.get_brand_info(mock_context, "example.com") == {
+        "name": "Example"
+    }
+    assert len(calls) == 2
+    
+    async def hanging_get(url, params=None, headers=None):
+        await asyncio.sleep(10)
+    
+    brandfetch.http_client.get.side_effect = hanging_get
+    brandfetch.call_deadline = 0.2
+    start = time.monotonic()
+    with pytest.raises(ValueError):
+        await brandfetch_server.search_brands(mock_context, "slow", force_upstream=True)
+    assert time.monotonic() - start < 1.0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_sends_interactive_requests_first():
+    """Test that interactive requests overtake bulk work and sessions take turns."""
+    scheduler = brandfetch_server.RequestScheduler()
+    limiter = brandfetch_server.TokenBucket(rate=100, burst=1)
+    order = []
+    
+    async def request(label, priority, session):
+        request_class = brandfetch_server.RequestClass(priority, session)
+        async with scheduler.slot(limiter, request_class):
+            order.append(label)
+    
+    bulk = [
+        asyncio.create_task(request(label, brandfetch_server.PRIORITY_BULK, label[0]))
+        for label in ("a1", "a2", "a3", "a4", "b1", "b2")
+    ]
+    await asyncio.sleep(0.002)
+    interactive = asyncio.create_task(
+        request("interactive", brandfetch_server.PRIORITY_INTERACTIVE, "c")
+    )
+    await asyncio.gather(interactive, *bulk)
+    
+    # Only requests already waiting for a token may be ahead of the interactive one
+    assert order.index("interactive") <= 2
+    order.remove("interactive")
+    # a1 is dispatched on arrival; after that the two sessions take turns
+    assert order == ["a1", "a2", "b1", "a3", "b2", "a4"]
+    assert scheduler.stats()["dispatched"] == {"interactive": 1, "bulk": 6}
+    assert scheduler.stats()["in_flight"] == {"interactive": 0, "bulk": 0}
+    
+    with pytest.raises(ValueError, match="bulk_share"):
+        brandfetch_server.RequestScheduler(bulk_share=0)
+    with pytest.raises(ValueError, match="max_concurrent"):
+        brandfetch_server.RequestScheduler(max_concurrent=-1)
+
+
+@pytest.mark.asyncio
+async def test_bulk_requests_leave_slots_for_interactive_calls(mock_context):
+    """Test that bulk work can't occupy every upstream slot."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.scheduler = brandfetch_server.RequestScheduler(
+        max_concurrent=4, bulk_share=0.5
+    )
+    release = asyncio.Event()
+    
+    async def fake_get(url, params=None, headers=None):
+        if "bulk" in url:
+            await release.wait()
+        return make_response(200, {"name": url.rsplit("/", 1)[-1]})
+    
+    brandfetch.http_client.get.side_effect = fake_get
+    batch = asyncio.create_task(brandfetch_server.get_brands_info(
+        mock_context, [f"bulk{i}.com" for i in range(5)], max_concurrency=5
+    ))
+    await asyncio.sleep(0.01)
+    assert brandfetch.scheduler.stats()["in_flight"]["bulk"] == 2
+    assert brandfetch.scheduler.stats()["queued"]["bulk"] == 3
+    
+    # An interactive lookup doesn't wait behind the batch
+    result = await asyncio.wait_for(
+        brandfetch_server.get_brand_info(mock_context, "example.com"), timeout=1
+    )
+    assert result == {"name": "example.com"}
+    
+    release.set()
+    assert len(await batch) == 5
+    assert brandfetch.scheduler.dispatched == {"interactive": 1, "bulk": 5}
+
+
+@pytest.mark.asyncio
+async def test_interactive_caller_raises_priority_of_joined_bulk_lookup(mock_context):
+    """Test that joining a queued bulk lookup moves it ahead of the batch."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.scheduler = brandfetch_server.RequestScheduler(
+        max_concurrent=2, bulk_share=0.5
+    )
+    release = asyncio.Event()
+    
+    async def fake_get(url, params=None, headers=None):
+        if url.endswith("/bulk0.com"):
+            await release.wait()
+        return make_response(200, {"name": url.rsplit("/", 1)[-1]})
+    
+    brandfetch.http_client.get.side_effect = fake_get
+    batch = asyncio.create_task(brandfetch_server.get_brands_info(
+        mock_context, [f"bulk{i}.com" for i in range(4)], max_concurrency=4
+    ))
+    await asyncio.sleep(0.01)
+    assert brandfetch.scheduler.stats()["queued"]["bulk"] == 3
+    
+    result = await asyncio.wait_for(
+        brandfetch_server.get_brand_info(mock_context, "bulk3.com"), timeout=1
+    )
+    
+    assert result == {"name": "bulk3.com"}
+    assert brandfetch.inflight.coalesced == 1
+    assert brandfetch.scheduler.stats()["queued"]["bulk"] == 2
+    assert brandfetch.http_client.get.call_count == 2
+    release.set()
+    assert len(await batch) == 4
+
+
+def test_parse_retry_after():
+    """Test parsing Retry-After in seconds and as an HTTP date."""
+    assert brandfetch_server.parse_retry_after("5") == 5.0
+    assert brandfetch_server.parse_retry_after(None) is None
+    assert brandfetch_server.parse_retry_after("not a date") is None
+    
+    in_a_minute = time.strftime(
+        "%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60)
+    )
+    assert 55 <= brandfetch_server.parse_retry_after(in_a_minute) <= 60
+
+
+@pytest.mark.asyncio
+async def test_enrich_brands_streams_to_ndjson(mock_context, tmp_path):
+    """Test that enrichment writes NDJSON results and reports progress per chunk."""
+    async def fake_get(url, params=None, headers=None):
+        if url.endswith("/missing.com"):
+            return make_response(404, text="Brand not found", url=url)
+        return make_response(200, {"domain": url.rsplit("/", 1)[1]}, url=url)
+    
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.http_client.get.side_effect = fake_get
+    brandfetch.enrich_dir = str(tmp_path)
+    input_path = tmp_path / "input.ndjson"
+    input_path.write_text(
+        "a.com\n\n{\"identifier\": \"missing.com\"}\nb.com\nc.com\nd.com\n"
+    )
+    output_path = tmp_path / "output.ndjson"
+    
+    summary = await brandfetch_server.enrich_brands(
+        mock_context,
+        input_path="input.ndjson",
+        output_path=str(output_path),
+        chunk_size=2,
+        max_concurrency=2,
+    )
+    
+    assert summary == {
+        "total": 5,
+        "succeeded": 4,
+        "failed": 1,
+        "output_path": str(output_path),
+    }
+    lines = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert sorted(line["identifier"] for line in lines) == [
+        "a.com", "b.com", "c.com", "d.com", "missing.com"
+    ]
+    assert mock_context.report_progress.await_args_list[-1].args == (5, 5)
+    assert mock_context.report_progress.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_enrich_brands_returns_results_without_output_path(mock_context):
+    """Test that enrichment returns results when no output file is given."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(200, {"name": "Example"})
+    
+    summary = await brandfetch_server.enrich_brands(
+        mock_context, identifiers=["a.com", "b.com"], fields=["name"]
+    )
+    
+    assert summary["succeeded"] == 2
+    assert {r["identifier"] for r in summary["results"]} == {"a.com", "b.com"}
+    
+    with pytest.raises(ValueError):
+        await brandfetch_server.enrich_brands(mock_context)
+    with pytest.raises(ValueError, match="at least 1"):
+        await brandfetch_server.enrich_brands(
+            mock_context, identifiers=["a.com"], max_concurrency=0
+        )
+
+
+@pytest.mark.asyncio
+async def test_enrich_brands_stops_every_worker_on_failure(mock_context, tmp_path):
+    """Test that a failed progress report stops the job without leaking tasks."""
+    async def fake_get(url, params=None, headers=None):
+        await asyncio.sleep(0.001)
+        return make_response(200, {"domain": url.rsplit("/", 1)[1]}, url=url)
+    
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.http_client.get.side_effect = fake_get
+    brandfetch.enrich_dir = str(tmp_path)
+    mock_context.report_progress.side_effect = RuntimeError("client disconnected")
+    tasks = asyncio.all_tasks()
+    
+    with pytest.raises(RuntimeError):
+        await brandfetch_server.enrich_brands(
+            mock_context,
+            identifiers=[f"brand{i}.com" for i in range(50)],
+            output_path="output.ndjson",
+            chunk_size=2,
+            max_concurrency=4,
+        )
+    calls = brandfetch.http_client.get.call_count
+    await asyncio.sleep(0.05)
+    
+    assert brandfetch.http_client.get.call_count == calls
+    assert asyncio.all_tasks() == tasks
+    assert (tmp_path / "output.ndjson").read_text().count("\n") >= 2
+
+
+@pytest.mark.asyncio
+async def test_enrich_brands_keeps_files_inside_enrich_dir(mock_context, tmp_path):
+    """Test that enrichment refuses outside paths and existing output files."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.enrich_dir = str(tmp_path / "enrich")
+    (tmp_path / "enrich").mkdir()
+    (tmp_path / "enrich" / "input.txt").write_text("a.com\n")
+    (tmp_path / "enrich" / "done.ndjson").write_text("keep\n")
+    (tmp_path / "secret.txt").write_text("root:x:0:0\n")
+    (tmp_path / "enrich" / "link.txt").symlink_to(tmp_path / "secret.txt")
+    
+    for input_path in ("../secret.txt", str(tmp_path / "secret.txt"), "link.txt"):
+        with pytest.raises(ValueError, match="outside the enrichment directory"):
+            await brandfetch_server.enrich_brands(
+                mock_context, input_path=input_path, output_path="out.ndjson"
+            )
+    with pytest.raises(ValueError, match="outside the enrichment directory"):
+        await brandfetch_server.enrich_brands(
+            mock_context, identifiers=["a.com"], output_path="../out.ndjson"
+        )
+    with pytest.raises(ValueError, match="already exists"):
+        await brandfetch_server.enrich_brands(
+            mock_context, input_path="input.txt", output_path="done.ndjson"
+        )
+    with pytest.raises(ValueError, match="output_path is required"):
+        await brandfetch_server.enrich_brands(mock_context, input_path="input.txt")
+    
+    assert (tmp_path / "enrich" / "done.ndjson").read_text() == "keep\n"
+    assert not (tmp_path / "out.ndjson").exists()
+    brandfetch.http_client.get.assert_not_called()
+
+
+def test_read_identifiers_from_csv_columns(tmp_path):
+    """Test that CSV inputs are read from the identifier column or a named one."""
+    path = tmp_path / "brands.csv"
+    path.write_text(
+        'name,Domain,ticker\n"Nike, Inc.",nike.com,NKE\nEmpty,,\n'
+        "Adidas,adidas.com,ADS\n"
+    )
+    
+    identifiers = list(brandfetch_server.read_identifiers(str(path)))
+    assert identifiers == ["nike.com", "adidas.com"]
+    assert list(brandfetch_server.read_identifiers(str(path), column="ticker")) == [
+        "NKE", "ADS"
+    ]
+    with pytest.raises(ValueError):
+        list(brandfetch_server.read_identifiers(str(path), column="isin"))
+
+
+def test_histogram_quantiles_and_prometheus_rendering():
+    """Test that histograms estimate percentiles and render as Prometheus text."""
+    histogram = brandfetch_server.Histogram()
+    for _ in range(90):
+        histogram.observe(0.004)
+    for _ in range(10):
+        histogram.observe(0.2)
+    
+    assert histogram.count == 100
+    assert 0.0025 < histogram.quantile(0.5) <= 0.005
+    assert 0.1 < histogram.quantile(0.99) <= 0.25
+    
+    metrics = brandfetch_server.ServerMetrics()
+    metrics.observe("tool_call_seconds", 0.004, tool="search_brands")
+    metrics.increment("tool_calls_total", tool="search_brands", outcome="success")
+    text = metrics.render_prometheus({"cache_hits": 3})
+    
+    assert (
+        'brandfetch_tool_calls_total{outcome="success",tool="search_brands"} 1'
+        in text
+    )
+    assert (
+        'brandfetch_tool_call_seconds_bucket{tool="search_brands",le="+Inf"} 1'
+        in text
+    )
+    assert 'brandfetch_tool_call_seconds_count{tool="search_brands"} 1' in text
+    assert "brandfetch_cache_hits 3" in text
+
+
+@pytest.mark.asyncio
+async def test_get_server_stats_reports_tool_and_upstream_metrics(mock_context):
+    """Test that tool calls and upstream requests show up in the server stats."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(200, {"name": "Nike"})
+    
+    await brandfetch_server.get_brand_info(mock_context, "nike.com")
+    await brandfetch_server.get_brand_info(mock_context, "nike.com")
+    
+    stats = await brandfetch_server.get_server_stats(mock_context)
+    
+    counters = stats["counters"]
+    assert stats["histograms"]["tool_call_seconds"]["tool=get_brand_info"]["count"] == 2
+    assert counters["tool_calls_total"]["outcome=success,tool=get_brand_info"] == 2
+    assert counters["upstream_responses_total"]["endpoint=brand,status=200"] == 1
+    assert stats["histograms"]["decode_seconds"]["endpoint=brand"]["count"] == 1
+    assert stats["cache"]["hit_ratio"] == 0.5
+    
+    text = await brandfetch_server.get_server_stats(mock_context, format="prometheus")
+    assert "brandfetch_upstream_request_seconds_bucket" in text
+    with pytest.raises(ValueError):
+        await brandfetch_server.get_server_stats(mock_context, format="xml")
+
+
+def test_sampling_filter_keeps_warnings():
+    """Test that log sampling drops info records but never warnings."""
+    log_filter = brandfetch_server.SamplingFilter(0.0)
+    make_record = brandfetch_server.logger.makeRecord
+    info = make_record("brandfetch-mcp", 20, "", 0, "hit", (), None)
+    warning = make_record("brandfetch-mcp", 30, "", 0, "retry", (), None)
+    
+    assert not log_filter.filter(info)
+    assert log_filter.filter(warning)
+    assert brandfetch_server.SamplingFilter(1.0).filter(info)
+
+
+def test_json_log_formatter_includes_extra_fields():
+    """Test that structured log lines carry the message and extra fields."""
+    record = brandfetch_server.logger.makeRecord(
+        "brandfetch-mcp", 30, "", 0, "HTTP %d from %s", (429, "brand"), None,
+        extra={"endpoint": "brand"},
+    )
+    
+    entry = json.loads(brandfetch_server.JsonLogFormatter().format(record))
+    
+    assert entry["message"] == "HTTP 429 from brand"
+    assert entry["level"] == "WARNING"
+    assert entry["endpoint"] == "brand"
+
+
+def test_compact_brand_document_filters_logos_and_drops_empty_values():
+    """Test that compact mode keeps preferred logo formats and drops empty values."""
+    def logo(logo_type, theme):
+        return {
+            "type": logo_type,
+            "theme": theme,
+            "tags": [],
+            "formats": [
+                {"src": f"{logo_type}-{theme}.{fmt}", "format": fmt, "background": None}
+                for fmt in ("png", "svg")
+            ],
+        }
+    document = {
+        "name": "Example",
+        "description": "",
+        "logos": [logo("logo", "dark"), logo("logo", "light"), logo("icon", "dark")],
+        "links": [{"name": str(i), "url": None} for i in range(20)],
+    }
+    
+    spec = brandfetch_server.compile_compact_spec(("light", "dark"), ("svg",), 3, True)
+    result = brandfetch_server.compact_brand_document(document, spec)
+    
+    assert "description" not in result
+    assert result["links"] == [{"name": "0"}, {"name": "1"}, {"name": "2"}]
+    assert result["logos"] == [
+        {
+            "type": "logo",
+            "theme": "light",
+            "formats": [{"src": "logo-light.svg", "format": "svg"}],
+        },
+        {
+            "type": "icon",
+            "theme": "dark",
+            "formats": [{"src": "icon-dark.svg", "format": "svg"}],
+        },
+    ]
+    assert len(document["logos"][0]["formats"]) == 2
+    assert (
+        brandfetch_server.compile_compact_spec(("light", "dark"), ("svg",), 3, True)
+        is spec
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_compact_mode(mock_context):
+    """Test that get_brand_info slims the cached document on request."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(
+        200, {"name": "Nike", "claimed": True, "description": None, "colors": []}
+    )
+    
+    full = await brandfetch_server.get_brand_info(mock_context, "nike.com")
+    compact = await brandfetch_server.get_brand_info(
+        mock_context, "nike.com", compact=True
+    )
+    
+    assert full["description"] is None
+    assert compact == {"name": "Nike", "claimed": True}
+    assert http_client.get.call_count == 1
+
+
+def test_json_helpers_fall_back_to_standard_library():
+    """Test that JSON helpers round-trip with and without the orjson backend."""
+    value = {"name": "Café", "colors": [{"hex": "#000000"}], "claimed": True}
+    encoded = brandfetch_server.json_dumps(value)
+    assert brandfetch_server.json_loads(encoded) == value
+    
+    with patch.object(brandfetch_server, "orjson", None):
+        fallback = brandfetch_server.json_dumps(value)
+        assert brandfetch_server.json_loads(fallback) == value
+        assert brandfetch_server.json_loads(fallback.decode()) == value
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_passes_raw_json_through(mock_context):
+    """Test that passthrough returns the upstream body unless it was transformed."""
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.raw_passthrough = True
+    body = '{"id": "id_1", "name": "Example",  "domain": "example.com", "colors": []}'
+    brandfetch.http_client.get.return_value = make_response(200, text=body)
+    
+    assert await brandfetch_server.get_brand_info(mock_context, "example.com") == body
+    # Repeat lookups, through any alias, return the cached body as is
+    assert await brandfetch_server.get_brand_info(mock_context, "EXAMPLE.com") == body
+    assert await brandfetch_server.get_brand_info(mock_context, "id_1") == body
+    assert brandfetch.http_client.get.call_count == 1
+    
+    # Local projections and compact documents are encoded again
+    projected = await brandfetch_server.get_brand_info(
+        mock_context, "example.com", fields=["name"]
+    )
+    assert json.loads(projected) == {"name": "Example"}
+    compacted = await brandfetch_server.get_brand_info(
+        mock_context, "example.com", compact=True
+    )
+    assert compacted == {"id": "id_1", "name": "Example", "domain": "example.com"}
+
+
+def test_rank_search_results_prefers_exact_claimed_matches():
+    """Test that ranking puts claimed, exact-name, similar-domain results first."""
+    results = [
+        {"name": "Nike Store", "domain": "nikestore.example", "claimed": False},
+        {"name": "NIKE", "domain": "nike-fans.example", "claimed": False},
+        {"name": "Nike", "domain": "nike.com", "claimed": True},
+    ]
+    
+    ranked = brandfetch_server.rank_search_results(
+        "nike", results, brandfetch_server.RankingWeights()
+    )
+    
+    assert [r["domain"] for r in ranked] == [
+        "nike.com", "nike-fans.example", "nikestore.example"
+    ]
+    assert ranked[0]["score"] == 4.0
+    assert "score" not in results[0]
+
+
+@pytest.mark.asyncio
+async def test_resolve_brand_searches_and_fetches_best_match(mock_context):
+    """Test that resolve_brand fetches brand info for the top ranked results."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    
+    async def get(url, **kwargs):
+        if "/v2/search/" in url:
+            return make_response(200, [
+                {"name": "Nike Store", "domain": "nikestore.example", "claimed": False},
+                {"name": "Nike", "domain": "nike.com", "claimed": True},
+            ])
+        return make_response(200, {"name": url.rsplit("/", 1)[-1]})
+    http_client.get.side_effect = get
+    
+    resolved = await brandfetch_server.resolve_brand(mock_context, "Nike", top_n=2)
+    
+    assert resolved["match"]["domain"] == "nike.com"
+    assert resolved["brand"] == {"name": "nike.com"}
+    assert [c["brand"]["name"] for c in resolved["candidates"]] == [
+        "nike.com", "nikestore.example"
+    ]
+    assert http_client.get.call_count == 3
+    
+    http_client.get.side_effect = None
+    http_client.get.return_value = make_response(200, [])
+    resolved = await brandfetch_server.resolve_brand(mock_context, "Nobody")
+    assert resolved["match"] is None
+
+
+def test_search_index_matches_exact_prefix_and_fuzzy_names():
+    """Test that the search index ranks exact, prefix and fuzzy name matches."""
+    index = brandfetch_server.SearchIndex(max_entries=3)
+    index.add_search_results([
+        {"name": "Nike", "domain": "nike.com", "brandId": "id_nike", "claimed": True},
+        {"name": "Nike Store", "domain": "nikestore.example", "brandId": "id_store"},
+        {"name": "Adidas", "domain": "adidas.com", "brandId": "id_adidas"},
+    ])
+    
+    matches = index.search("NIKE")
+    domains = [brand["domain"] for _, brand in matches]
+    assert domains == ["nike.com", "nikestore.example"]
+    assert matches[0][0] == 1.0
+    assert 0.5 < matches[1][0] < 0.9
+    assert index.search("adidsa")[0][1]["domain"] == "adidas.com"
+    
+    index.add({"name": "Puma", "domain": "puma.com", "brandId": "id_puma"})
+    assert len(index) == 3
+    assert index.search("nike")[0][1]["domain"] == "nikestore.example"
+
+
+@pytest.mark.asyncio
+async def test_search_brands_answers_from_index_of_seen_brands(mock_context):
+    """Test that searches for brands seen before skip the Search API."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(
+        200, {"id": "id_nike", "name": "Nike", "domain": "nike.com", "claimed": True}
+    )
+    await brandfetch_server.get_brand_info(mock_context, "nike.com")
+    
+    result = await brandfetch_server.search_brands(mock_context, "nike")
+    
+    assert result == [{
+        "icon": None,
+        "name": "Nike",
+        "domain": "nike.com",
+        "claimed": True,
+        "brandId": "id_nike",
+    }]
+    assert http_client.get.call_count == 1
+    
+    http_client.get.return_value = make_response(200, [])
+    result = await brandfetch_server.search_brands(
+        mock_context, "nike", force_upstream=True
+    )
+    assert result == []
+    assert http_client.get.call_count == 2
+
+
+def test_classify_identifier_canonicalizes_each_kind():
+    """Test that identifiers are classified and put in canonical form."""
+    classify = brandfetch_server.classify_identifier
+    
+    assert classify(" Nike.com ") == ("domain", "nike.com")
+    assert classify("https://www.Nike.com/en/") == ("domain", "nike.com")
+    assert classify("nike.com.") == ("domain", "nike.com")
+    assert classify("id_0dwKPKT") == ("id", "id_0dwKPKT")
+    assert classify("us6541061031") == ("isin", "US6541061031")
+    assert classify(" NKE ") == ("ticker", "NKE")
+    assert classify("BRK.B") == ("ticker", "BRK.B")
+
+
+def test_classify_identifier_keeps_ambiguous_input():
+    """Test that IDs, suffixed symbols and unclassified input are not rewritten."""
+    classify = brandfetch_server.classify_identifier
+    
+    assert classify("idL0iThUh6") == ("id", "idL0iThUh6")
+    assert classify("VOW3.DE") == ("ticker", "VOW3.DE")
+    assert classify("RY.TO") == ("ticker", "RY.TO")
+    assert classify("ry.to") == ("domain", "ry.to")
+    assert classify(" user@mail.com ") == ("unknown", "user@mail.com")
+    assert classify("https://user@www.nike.com:443/") == ("domain", "nike.com")
+    assert classify("Some Brand") == ("unknown", "Some Brand")
+    # Lowercase words are not stock symbols, nor brand IDs
+    assert classify("nike") == ("unknown", "nike")
+    assert classify(" apple ") == ("unknown", "apple")
+    assert classify("identification") == ("unknown", "identification")
+    assert classify("idabcdefgh") == ("unknown", "idabcdefgh")
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_sends_brand_ids_verbatim(mock_context):
+    """Test that case-sensitive brand IDs reach the API unchanged."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(200, {"name": "Example"})
+    
+    await brandfetch_server.get_brand_info(mock_context, "idL0iThUh6")
+    await brandfetch_server.get_brand_info(mock_context, "user@mail.com")
+    await brandfetch_server.get_brand_info(mock_context, "apple")
+    
+    urls = [call.args[0] for call in http_client.get.call_args_list]
+    assert urls[0].endswith("/v2/brands/idL0iThUh6")
+    assert urls[1].endswith("/v2/brands/user@mail.com")
+    assert urls[2].endswith("/v2/brands/apple")
+
+
+@pytest.mark.asyncio
+async def test_get_brand_info_aliases_share_cache_entry(mock_context):
+    """Test that every known identifier of a brand is answered from one cache entry."""
+    http_client = mock_context.request_context.lifespan_context.http_client
+    http_client.get.return_value = make_response(
+        200, {"id": "id_0dwKPKT", "name": "Nike", "domain": "nike.com"}
+    )
+    
+    await brandfetch_server.get_brand_info(mock_context, "US6541061031")
+    for identifier in ["us6541061031", "id_0dwKPKT", "Nike.com", "https://www.nike.com/"]:
+        result = await brandfetch_server.get_brand_info(mock_context, identifier)
+        assert result["name"] == "Nike"
+    
+    assert http_client.get.call_count == 1
+    assert http_client.get.call_args.args[0].endswith("/v2/brands/US6541061031")
+    assert brandfetch_server.brand_cache_key("id_0dwKPKT") in (
+        mock_context.request_context.lifespan_context.cache
+    )
+
+
+@pytest.mark.asyncio
+async def test_aliases_shared_through_disk_cache(mock_context, tmp_path):
+    """Test that a new server process follows aliases stored in the disk cache."""
+    path = str(tmp_path / "cache.db")
+    brandfetch = mock_context.request_context.lifespan_context
+    brandfetch.disk_cache = brandfetch_server.DiskCache(path)
+    brandfetch.http_client.get.return_value = make_response(
+        200, {"id": "id_0dwKPKT", "name": "Nike", "domain": "nike.com"}
+    )
+    await brandfetch_server.get_brand_info(mock_context, "NKE")
+    
+    cold = brandfetch_server.BrandfetchContext(
+        api_key="test_api_key",
+        client_id="test_client_id",
+        base_url="https://api.brandfetch.io",
+        http_client=AsyncMock(spec=httpx.AsyncClient),
+        disk_cache=brandfetch_server.DiskCache(path),
+    )
+    mock_context.request_context.lifespan_context = cold
+    result = await brandfetch_server.get_brand_info(mock_context, "www.nike.com")
+    
+    assert result["name"] == "Nike"
+    cold.http_client.get.assert_not_called()
+    assert cold.aliases.resolve("nike.com") == "id_0dwKPKT"
+    brandfetch.disk_cache.close()
+    cold.disk_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_get_brand_assets_stores_files_by_content(mock_context, tmp_path):
+    """Test that logo files are downloaded once and stored by content hash."""
+    brandfetch = mock_context.request_context.lifespan_context
+    requests = []
+    
+    def handler(request):
+        requests.append(request)
+        if request.url.path.startswith("/v2/brands/"):
+            return httpx.Response(200, json={"logos": [
+                {"type": "logo", "theme": "light", "formats": [
+                    {"src": "https://cdn.example/logo.svg", "format": "svg"},
+                    {"src": "https://cdn.example/logo.png", "format": "png"},
+                ]},
+                {"type": "icon", "theme": "dark", "formats": [
+                    {"src": "https://cdn.example/icon.svg", "format": "svg"},
+                ]},
+            ]})
+        # Both SVGs have the same content
+        body = b"<svg/>" if request.url.path.endswith(".svg") else b"\x89PNG" * 1000
+        return httpx.Response(200, content=body, headers={"Content-Type": "image/test"})
+    
+    brandfetch.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    brandfetch.asset_store = brandfetch_server.AssetStore(str(tmp_path), max_bytes=3000)
+    
+    assets = await brandfetch_server.get_brand_assets(
+        mock_context, "example.com", logo_formats=["svg"], include_base64=True
+    )
+    
+    assert [asset["src"] for asset in assets] == [
+        "https://cdn.example/logo.svg", "https://cdn.example/icon.svg"
+    ]
+    assert assets[0]["sha256"] == assets[1]["sha256"]
+    assert assets[0]["base64"] == "PHN2Zy8+"
+    assert open(assets[0]["path"], "rb").read() == b"<svg/>"
+    assert "authorization" not in requests[1].headers
+    
+    again = await brandfetch_server.get_brand_assets(mock_context, "example.com")
+    assert [asset.get("cached") for asset in again] == [True, None, True]
+    assert again[1]["error"].startswith("Asset is larger than 3000 bytes")
+    assert not os.listdir(tmp_path / "tmp")
+    with pytest.raises(ValueError, match="at least 1"):
+        await brandfetch_server.get_brand_assets(
+            mock_context, "example.com", max_concurrency=0
+        )
+    await brandfetch.http_client.aclose()
+
+
+def test_asset_store_evicts_least_recently_used_blobs(tmp_path):
+    """Test that the asset store stays under its total size and drops stale parts."""
+    (tmp_path / "tmp").mkdir()
+    stale = tmp_path / "tmp" / "crashed.part"
+    stale.write_bytes(b"x")
+    os.utime(stale, (0, 0))
+    fresh = tmp_path / "tmp" / "downloading.part"
+    fresh.write_bytes(b"x")
+    store = brandfetch_server.AssetStore(str(tmp_path), max_total_bytes=250)
+    
+    def put(url, content, age):
+        writer = store.begin()
+        writer.write(content)
+        record = store.commit(writer, url, None)
+        accessed = time.time() - age
+        os.utime(record["path"], (accessed, accessed))
+        return record
+    
+    a = put("https://cdn.example/a.png", b"a" * 100, age=300)
+    b = put("https://cdn.example/b.png", b"b" * 100, age=200)
+    assert not stale.exists()
+    assert fresh.exists()
+    # Reading a makes b the least recently used
+    assert store.lookup("https://cdn.example/a.png") == a
+    
+    put("https://cdn.example/c.png", b"c" * 100, age=0)
+    
+    assert store.lookup("https://cdn.example/b.png") is None
+    assert not os.path.exists(b["path"])
+    assert store.lookup("https://cdn.example/a.png") == a
+    assert store.lookup("https://cdn.example/c.png") is not None
+    assert len(os.listdir(tmp_path / "urls")) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_brand_assets_follows_redirects(mock_context, tmp_path):
+    """Test that redirected asset URLs are followed, up to a limit."""
+    brandfetch = mock_context.request_context.lifespan_context
+    
+    def handler(request):
+        if request.url.path.startswith("/v2/brands/"):
+            return httpx.Response(200, json={"logos": [
+                {"type": "logo", "theme": "light", "formats": [
+                    {"src": "https://cdn.example/logo.svg", "format": "svg"},
+                    {"src": "https://cdn.example/loop.png", "format": "png"},
+                ]},
+            ]})
+        if request.url.path == "/logo.svg":
+            return httpx.Response(302, headers={"Location": "/v1/logo.svg"})
+        if request.url.path == "/v1/logo.svg":
+            return httpx.Response(301, headers={"Location": "https://assets.example/logo"})
+        if request.url.host == "assets.example":
+            return httpx.Response(200, content=b"<svg/>")
+        return httpx.Response(302, headers={"Location": "/loop.png"})
+    
+    brandfetch.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    brandfetch.asset_store = brandfetch_server.AssetStore(str(tmp_path))
+    
+    assets = await brandfetch_server.get_brand_assets(mock_context, "example.com")
+    
+    assert assets[0]["src"] == "https://cdn.example/logo.svg"
+    assert open(assets[0]["path"], "rb").read() == b"<svg/>"
+    assert assets[1]["error"].startswith("Too many redirects")
+    await brandfetch.http_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_lifespan_context_shared_between_sessions():
+    """Test that concurrent sessions share one context, closed by the last one."""
+    env = {"BRANDFETCH_API_KEY": "key", "BRANDFETCH_CLIENT_ID": "client",
+           "BRANDFETCH_WARMUP_CONNECTIONS": "0"}
+    with patch.dict(os.environ, env):
+        lifespan = brandfetch_server.brandfetch_lifespan
+        async with lifespan(brandfetch_server.mcp) as first:
+            async with lifespan(brandfetch_server.mcp) as second:
+                assert first is second
+            http_client = first.get_http_client()
+            assert not http_client.is_closed
+            assert brandfetch_server._active_context is first
+        assert http_client.is_closed
+        assert brandfetch_server._active_context is None
+
+
+# Startup budgets, generous enough for slow CI machines
+IMPORT_BUDGET_SECONDS = 0.5
+LIFESPAN_BUDGET_SECONDS = 0.05
+
+
+def test_import_stays_within_budget_and_defers_connection_modules():
+    """Test that importing the server is fast and leaves the HTTP stack unloaded."""
+    # Time only the server module, not the MCP SDK it builds on
+    script = (
+        "import json, sys, time\n"
+        "import httpx, dotenv, mcp.server.fastmcp, starlette.applications\n"
+        "start = time.perf_counter()\n"
+        "import brandfetch_server\n"
+        "print(json.dumps({'seconds': time.perf_counter() - start,\n"
+        "                  'httpcore': 'httpcore' in sys.modules}))\n"
+    )
+    repo_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=repo_dir,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    
+    assert result["seconds"] < IMPORT_BUDGET_SECONDS
+    assert result["httpcore"] is False
+
+
+@pytest.mark.asyncio
+async def test_lifespan_defers_http_client_until_first_use():
+    """Test that the context opens quickly and creates its client on first use."""
+    env = {"BRANDFETCH_API_KEY": "key", "BRANDFETCH_CLIENT_ID": "client",
+           "BRANDFETCH_WARMUP_CONNECTIONS": "0"}
+    with patch.dict(os.environ, env):
+        start = time.perf_counter()
+        async with brandfetch_server.open_brandfetch_context() as brandfetch:
+            assert time.perf_counter() - start < LIFESPAN_BUDGET_SECONDS
+            assert brandfetch.http_client is None
+            
+            http_client = brandfetch.get_http_client()
+            assert brandfetch.get_http_client() is http_client
+        assert http_client.is_closed
+        
+        with patch.dict(os.environ, {"BRANDFETCH_LAZY_INIT": "false"}):
+            async with brandfetch_server.open_brandfetch_context() as brandfetch:
+                assert brandfetch.http_client is not None
+
+
+@pytest.mark.asyncio
+async def test_context_rejects_zero_burst():
+    """Test that an explicit burst of 0 is an error rather than the default."""
+    env = {"BRANDFETCH_API_KEY": "key", "BRANDFETCH_CLIENT_ID": "client",
+           "BRANDFETCH_BRAND_BURST": "0"}
+    with patch.dict(os.environ, env):
+        with pytest.raises(
+            ValueError, match="BRANDFETCH_BRAND_BURST must be at least 1"
+        ):
+            async with brandfetch_server.open_brandfetch_context():
+                pass
+
+
+@pytest.mark.asyncio
+async def test_lazy_client_warms_configured_connections():
+    """Test that a client created on first use warms every configured connection."""
+    env = {"BRANDFETCH_API_KEY": "key", "BRANDFETCH_CLIENT_ID": "client",
+           "BRANDFETCH_WARMUP_CONNECTIONS": "2"}
+    with patch.dict(os.environ, env), patch.object(
+        brandfetch_server, "warm_up_connections", AsyncMock()
+    ) as warm_up:
+        async with brandfetch_server.open_brandfetch_context() as brandfetch:
+            warm_up.assert_not_called()
+            brandfetch.get_http_client()
+            await asyncio.sleep(0)
+    
+    assert warm_up.await_args.args[2] == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_token_bucket_budget_spans_processes(tmp_path):
+    """Test that buckets on one database share a budget and pause together."""
+    path = str(tmp_path / "rate_limits.db")
+    first = brandfetch_server.SharedTokenBucket(path, "brand", rate=10, burst=2)
+    # A second process joins the budget set up by the first
+    second = brandfetch_server.SharedTokenBucket(path, "brand", rate=10, burst=2)
+    
+    with patch.object(brandfetch_server.asyncio, "sleep", AsyncMock()) as sleep:
+        assert await first.acquire() == 0
+        assert await second.acquire() == 0
+        assert await first.acquire() > 0
+        
+        await second.pause(5)
+        assert await first.acquire() >= 4.9
+    
+    assert first.rate == 5
+    assert sleep.await_count == 2
+    first.close()
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_unlimited_shared_token_bucket_skips_write_transaction(tmp_path):
+    """Test that a bucket without a rate only reads the shared pause."""
+    path = str(tmp_path / "rate_limits.db")
+    bucket = brandfetch_server.SharedTokenBucket(path, "search")
+    statements = []
+    bucket._conn.set_trace_callback(statements.append)
+    
+    assert await bucket.acquire() == 0
+    assert await bucket.try_acquire()
+    assert not any("BEGIN" in statement for statement in statements)
+    
+    await bucket.pause(5)
+    with patch.object(brandfetch_server.asyncio, "sleep", AsyncMock()):
+        assert await bucket.acquire() >= 4.9
+    assert not await bucket.try_acquire()
+    bucket.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_token_bucket_writes_off_the_event_loop(tmp_path):
+    """Test that pausing and recovering the shared rate don't block the loop."""
+    bucket = brandfetch_server.SharedTokenBucket(
+        str(tmp_path / "rate_limits.db"), "brand", rate=10
+    )
+    await bucket.pause(0)
+    # Another writer holds the database for a while
+    bucket._lock.acquire()
+    threading.Timer(0.3, bucket._lock.release).start()
+    
+    recovery = asyncio.create_task(bucket.record_success())
+    start = time.monotonic()
+    await asyncio.sleep(0.01)
+    
+    assert time.monotonic() - start < 0.2
+    await recovery
+    assert bucket.rate == 5.5
+    bucket.close()
+
+
+def test_palette_colors_in_lab_weighted_by_type_and_brightness():
+    """Test hex to Lab conversion and the weighting of palette colors."""
+    white = brandfetch_server.hex_to_lab("#FFF")
+    assert white[0] == pytest.approx(100, abs=0.01)
+    assert abs(white[1]) < 0.01 and abs(white[2]) < 0.01
+    assert brandfetch_server.hex_to_lab("#ff0000") == pytest.approx(
+        (53.24, 80.09, 67.2), abs=0.01
+    )
+    assert brandfetch_server.hex_to_lab("red") is None
+    
+    palette = brandfetch_server.palette_colors([
+        {"hex": "#111111", "type": "dark", "brightness": 17},
+        {"hex": "#E10600", "type": "accent", "brightness": 75},
+        {"hex": "not a color", "type": "brand"},
+        "#0000ff",
+    ])
+    assert [entry[0] for entry in palette] == ["#0000ff", "#e10600", "#111111"]
+    assert palette[0][4] == 1.0
+    assert palette[2][4] < 0.5 * palette[1][4]
+
+
+@pytest.mark.asyncio
+async def test_find_similar_brands_from_cached_documents(mock_context, tmp_path):
+    """Test that similar palettes are found among cached brands without API calls."""
+    pytest.importorskip("numpy")
+    brandfetch = mock_context.request_context.lifespan_context
+    palettes = {
+        "red.com": ["#e10600", "#111111"],
+        "crimson.com": ["#d0101a", "#1a1a1a"],
+        "blue.com": ["#0033cc", "#ffffff"],
+    }
+    
+    async def fake_get(url, params=None, headers=None):
+        domain = url.rsplit("/", 1)[-1]
+        colors = [{"hex": hex, "type": "brand"} for hex in palettes[domain]]
+        return make_response(200, {"name": domain, "domain": domain, "colors": colors})
+    
+    brandfetch.http_client.get.side_effect = fake_get
+    for domain in ("red.com", "crimson.com"):
+        await brandfetch_server.get_brand_info(mock_context, domain)
+    # Brands in the disk cache, e.g. from the warm-up command, are included too
+    brandfetch.disk_cache = brandfetch_server.DiskCache(str(tmp_path / "cache.db"))
+    brandfetch.disk_cache.set(
+        brandfetch_server.brand_cache_key("blue.com", ["colors"]),
+        {"colors": [{"hex": hex, "type": "brand"} for hex in palettes["blue.com"]]},
+        ttl=60,
+    )
+    calls = brandfetch.http_client.get.call_count
+    
+    result = await brandfetch_server.find_similar_brands(
+        mock_context, identifier="red.com"
+    )
+    
+    assert result["indexed_brands"] == 3
+    assert result["query"]["colors"] == ["#e10600", "#111111"]
+    domains = [brand["domain"] for brand in result["results"]]
+    assert domains == ["crimson.com", "blue.com"]
+    assert result["results"][0]["distance"] < result["results"][1]["distance"]
+    assert brandfetch.http_client.get.call_count == calls
+    
+    result = await brandfetch_server.find_similar_brands(
+        mock_context, colors=["#0030d0"], limit=1
+    )
+    assert [brand["domain"] for brand in result["results"]] == ["blue.com"]
+    with pytest.raises(ValueError, match="exactly one"):
+        await brandfetch_server.find_similar_brands(mock_context)
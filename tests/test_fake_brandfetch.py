@@ -0,0 +1,76 @@
+"""
+Tests for the local Brandfetch API stand-in used by the benchmarks.
+"""
+import os
+import sys
+
+import httpx
+import pytest
+
+# Add the parent directory to the path to import the benchmarks
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks import fake_brandfetch
+
+
+def make_client(**config):
+    """Create an HTTP client wired to a fake API app."""
+    config.setdefault("latency_ms", 0)
+    config.setdefault("jitter_ms", 0)
+    app = fake_brandfetch.create_app(fake_brandfetch.FakeConfig(**config))
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://fake"
+    )
+
+
+@pytest.mark.asyncio
+async def test_fake_brand_endpoint_filters_fields():
+    """Test that the fake brand endpoint honors fields and authentication."""
+    async with make_client() as client:
+        response = await client.get(
+            "/v2/brands/nike.com",
+            params={"fields": "name,colors"},
+            headers={"Authorization": "Bearer key"},
+        )
+        unauthorized = await client.get("/v2/brands/nike.com")
+        missing = await client.get(
+            "/v2/brands/missing.com", headers={"Authorization": "Bearer key"}
+        )
+        revalidated = await client.get(
+            "/v2/brands/nike.com",
+            params={"fields": "name,colors"},
+            headers={
+                "Authorization": "Bearer key",
+                "If-None-Match": response.headers["ETag"],
+            },
+        )
+        stats = (await client.get("/__stats")).json()
+    
+    assert response.status_code == 200
+    assert set(response.json()) == {"name", "colors"}
+    assert response.json()["name"] == "Nike"
+    assert unauthorized.status_code == 401
+    assert missing.status_code == 404
+    assert revalidated.status_code == 304
+    assert stats["brand_requests"] == 4
+
+
+@pytest.mark.asyncio
+async def test_fake_search_endpoint_injects_rate_limits():
+    """Test that the fake API injects 429 responses with Retry-After."""
+    async with make_client(rate_limit_rate=1.0, retry_after=2) as client:
+        response = await client.get("/v2/search/nike", params={"c": "client"})
+    
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_fake_brand_documents_are_deterministic():
+    """Test that the same identifier always yields the same document."""
+    first = fake_brandfetch.make_brand("Example.com")
+    second = fake_brandfetch.make_brand("example.com")
+    
+    assert first == second
+    assert len(first["logos"]) == 6
+    results = fake_brandfetch.make_search_results("Example", 3)
+    assert results[0]["domain"] == "example.com"
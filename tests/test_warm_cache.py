@@ -0,0 +1,93 @@
+"""
+Tests for the cache warm-up command.
+"""
+import io
+import json
+import os
+import sys
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+# Add the parent directory to the path to import the server and the command
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import brandfetch_server
+import warm_cache
+
+
+def make_context(tmp_path):
+    """Create a Brandfetch context with a disk cache and a mocked HTTP client."""
+    async def fake_get(url, params=None, headers=None):
+        request = httpx.Request("GET", url)
+        if url.endswith("/missing.com"):
+            return httpx.Response(404, json={"message": "Not found"}, request=request)
+        return httpx.Response(
+            200, json={"domain": url.rsplit("/", 1)[1]}, request=request
+        )
+    
+    http_client = AsyncMock(spec=httpx.AsyncClient)
+    http_client.get.side_effect = fake_get
+    return brandfetch_server.BrandfetchContext(
+        api_key="test_api_key",
+        client_id="test_client_id",
+        base_url="https://api.brandfetch.io",
+        http_client=http_client,
+        disk_cache=brandfetch_server.DiskCache(str(tmp_path / "cache.db")),
+    )
+
+
+@pytest.mark.asyncio
+async def test_warm_cache_fills_disk_cache_and_records_state(tmp_path):
+    """Test that warm-up stores documents, skips repeats and records each result."""
+    brandfetch = make_context(tmp_path)
+    state = io.StringIO()
+    
+    summary = await warm_cache.warm_cache(
+        brandfetch,
+        ["a.com", "missing.com", "A.com", "b.com"],
+        concurrency=2,
+        state=state,
+    )
+    
+    assert (summary["warmed"], summary["failed"], summary["skipped"]) == (2, 1, 1)
+    assert summary["upstream_requests"] == 3
+    assert summary["errors"] == [
+        {"identifier": "missing.com", "error": "Failed to get brand info: HTTP 404"}
+    ]
+    records = [json.loads(line) for line in state.getvalue().splitlines()]
+    assert {r["identifier"]: r["status"] for r in records} == {
+        "a.com": "ok", "missing.com": "error", "b.com": "ok"
+    }
+    cache_key = brandfetch_server.brand_cache_key("b.com")
+    stored = brandfetch.disk_cache.get_first([cache_key])
+    assert stored[1] == {"domain": "b.com"}
+    brandfetch.disk_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_warm_cache_resumes_from_state_file(tmp_path):
+    """Test that a resumed run skips identifiers that succeeded before."""
+    state_path = tmp_path / "input.csv.warmup-state.ndjson"
+    state_path.write_text(
+        '{"identifier": "a.com", "status": "ok", "seconds": 0.1}\n'
+        '{"identifier": "missing.com", "status": "error", "seconds": 0.1}\n'
+        '{"identifier": "b.c'
+    )
+    completed = warm_cache.load_completed(str(state_path))
+    assert completed == {"a.com"}
+    
+    brandfetch = make_context(tmp_path)
+    summary = await warm_cache.warm_cache(
+        brandfetch, ["a.com", "missing.com", "b.com"], completed=completed
+    )
+    
+    assert (summary["warmed"], summary["failed"], summary["skipped"]) == (1, 1, 1)
+    calls = brandfetch.http_client.get.call_args_list
+    called = {call.args[0].rsplit("/", 1)[1] for call in calls}
+    assert called == {"missing.com", "b.com"}
+    
+    with pytest.raises(ValueError, match="at least 1"):
+        await warm_cache.warm_cache(brandfetch, ["c.com"], concurrency=0)
+    brandfetch.disk_cache.close()
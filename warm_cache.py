@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Brandfetch cache warm-up
+
+Fetches a list of brand identifiers into the persistent cache shared by the
+Brandfetch MCP server processes, so sessions answer them without calling the
+API. Identifiers are read from a CSV, NDJSON or plain text file and fetched
+through the server's own request path: the same rate limits, retries,
+aliases and bounded concurrency.
+
+Each completed identifier is appended to a state file, so an interrupted run
+skips the identifiers that already succeeded when it is started again. A
+summary of timings and failures is printed as JSON at the end.
+
+Usage:
+    python warm_cache.py domains.csv --concurrency 8 --rate 5
+
+Then start the server on the same cache:
+    BRANDFETCH_CACHE_PATH=~/.cache/brandfetch-mcp/cache.db python brandfetch_server.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, TextIO
+
+from brandfetch_server import (
+    DEFAULT_SHARED_CACHE_PATH,
+    PRIORITY_BULK,
+    BrandfetchContext,
+    fetch_brand_info,
+    normalize_identifier,
+    open_brandfetch_context,
+    read_identifiers,
+    set_request_priority,
+)
+
+logger = logging.getLogger("brandfetch-mcp.warm-up")
+
+# Failures listed individually in the summary
+MAX_REPORTED_ERRORS = 20
+
+
+def state_path_for(input_path: str) -> str:
+    """Return the default state file of an input file."""
+    return f"{input_path}.warmup-state.ndjson"
+
+
+def load_completed(state_path: str) -> Set[str]:
+    """Return the normalized identifiers a previous run warmed successfully."""
+    completed: Set[str] = set()
+    if not os.path.exists(state_path):
+        return completed
+    with open(state_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short when the run was interrupted
+            if record.get("status") == "ok":
+                completed.add(normalize_identifier(record["identifier"]))
+    return completed
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    last = len(sorted_values) - 1
+    index = min(last, int(round(pct / 100 * last)))
+    return sorted_values[index]
+
+
+def upstream_requests(brandfetch: BrandfetchContext) -> int:
+    """Return the number of responses received from the API so far."""
+    return sum(
+        count
+        for (name, _), count in brandfetch.metrics.counters.items()
+        if name == "upstream_responses_total"
+    )
+
+
+async def warm_cache(
+    brandfetch: BrandfetchContext,
+    identifiers: Iterable[str],
+    fields: Optional[List[str]] = None,
+    concurrency: Optional[int] = None,
+    completed: Optional[Set[str]] = None,
+    state: Optional[TextIO] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch identifiers into the cache and return a summary of the run.
+
+    Identifiers in completed, and repeats within the input, are skipped.
+    Each result is written to state as a JSON line as soon as it is known.
+    Requests are sent as bulk work, behind interactive tool calls sharing
+    the same context.
+    """
+    completed = completed if completed is not None else set()
+    if concurrency is None:
+        concurrency = brandfetch.batch_concurrency
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    seen: Set[str] = set()
+    latencies: List[float] = []
+    errors: List[Dict[str, str]] = []
+    counts = {"warmed": 0, "failed": 0, "skipped": 0}
+    requests_before = upstream_requests(brandfetch)
+
+    def pending() -> Iterable[str]:
+        for identifier in identifiers:
+            key = normalize_identifier(identifier)
+            if key in completed or key in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(key)
+            yield identifier
+
+    queue = pending()
+
+    async def worker() -> None:
+        # Workers pull from a shared iterator, so only `concurrency`
+        # identifiers are in flight however large the input is
+        for identifier in queue:
+            start = time.perf_counter()
+            record: Dict[str, Any] = {"identifier": identifier}
+            try:
+                await fetch_brand_info(brandfetch, identifier, fields)
+                record["status"] = "ok"
+                counts["warmed"] += 1
+            except ValueError as e:
+                record.update(status="error", error=str(e))
+                counts["failed"] += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"identifier": identifier, "error": str(e)})
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            record["seconds"] = round(elapsed, 4)
+            if state is not None:
+                state.write(json.dumps(record) + "\n")
+                state.flush()
+
+    set_request_priority(PRIORITY_BULK, "warm-up")
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    processed = counts["warmed"] + counts["failed"]
+    return {
+        **counts,
+        "upstream_requests": upstream_requests(brandfetch) - requests_before,
+        "elapsed_s": round(elapsed, 3),
+        "per_s": round(processed / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "errors": errors,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Open the server context and warm the cache from the input file."""
+    # Settings are read by the server context from the environment
+    os.environ["BRANDFETCH_CACHE_PATH"] = args.cache_path
+    if args.rate is not None:
+        os.environ["BRANDFETCH_BRAND_RATE_LIMIT"] = str(args.rate)
+
+    state_path = args.state or state_path_for(args.input)
+    if args.restart and os.path.exists(state_path):
+        os.remove(state_path)
+    completed = load_completed(state_path)
+    if completed:
+        logger.info("Resuming: %d identifiers already warmed", len(completed))
+
+    fields = args.fields.split(",") if args.fields else None
+    async with open_brandfetch_context() as brandfetch:
+        with open(state_path, "a", encoding="utf-8") as state:
+            summary = await warm_cache(
+                brandfetch,
+                read_identifiers(args.input, args.column),
+                fields=fields,
+                concurrency=args.concurrency,
+                completed=completed,
+                state=state,
+            )
+    summary["state_path"] = state_path
+    return summary
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Fetch brand identifiers into the Brandfetch MCP server's cache."
+    )
+    parser.add_argument("input", help="CSV, NDJSON or plain text file of identifiers")
+    parser.add_argument("--column", default=None,
+                        help="CSV column or JSON key holding the identifier")
+    parser.add_argument("--fields", default=None,
+                        help="Comma-separated fields to fetch "
+                             "(default: full documents)")
+    parser.add_argument(
+        "--cache-path",
+        default=os.environ.get("BRANDFETCH_CACHE_PATH") or DEFAULT_SHARED_CACHE_PATH,
+        help="Persistent cache to fill (default: BRANDFETCH_CACHE_PATH or %(default)s)",
+    )
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Concurrent requests "
+                             "(default: BRANDFETCH_BATCH_CONCURRENCY)")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Brand requests per second "
+                             "(default: BRANDFETCH_BRAND_RATE_LIMIT)")
+    parser.add_argument("--state", default=None,
+                        help="State file for resuming "
+                             "(default: <input>.warmup-state.ndjson)")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the state of earlier runs and start over")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the warm-up from the command line and return the exit status."""
+    args = parse_args(argv)
+    try:
+        summary = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Interrupted; run again to resume", file=sys.stderr)
+        return 130
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())